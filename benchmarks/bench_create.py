@@ -0,0 +1,188 @@
+"""Benchmark the parsers and create_* paths on a synthetic PRISMS-PF app
+
+    python benchmarks/bench_create.py --constants 2000 --variables 200 --time-steps 20 --ranks 4 \
+        --latency 0.02 --repeat 3 --output results.json
+
+Generates an app directory (see synthetic_app.py), then times:
+
+  - parse_parameters_file (cold, i.e. without the in-process cache, and cached)
+  - parse_equations_file
+  - every create_*_sample function, against the local backend with
+    --latency seconds injected into each round trip
+
+The results, including the round trips made by each create_* path, are
+written as JSON so they can be compared between revisions.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import datetime
+import contextlib
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from synthetic_app import generate_app, add_generator_options
+
+
+def summarize(times):
+    times = sorted(times)
+    return {'median_ms': 1000 * times[len(times) // 2], 'min_ms': 1000 * times[0], 'max_ms': 1000 * times[-1],
+            'repeat': len(times)}
+
+
+def time_calls(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return summarize(times), result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_parsers(repeat):
+    from prismspf_mcapi.prismspf_parameter_parser import ParametersDocument, parse_parameters_file
+    from prismspf_mcapi.equations_dot_h_parser import parse_equations_file
+
+    results = {}
+    results['parse_parameters_file (cold)'], document = time_calls(lambda: ParametersDocument('parameters.in'), repeat)
+    results['parse_parameters_file (cold)']['entries'] = len(document.parameters)
+    results['parse_parameters_file (cached)'], _ = time_calls(lambda: parse_parameters_file('parameters.in'), repeat)
+    results['parse_equations_file'], equations = time_calls(lambda: parse_equations_file('equations.cc'), repeat)
+    results['parse_equations_file']['variables'] = len(equations)
+    return results
+
+
+def create_args():
+    """Parse the 'simulation --create' options, which cover the options of every create_* function"""
+    from prismspf_mcapi.simulation import SimulationSubcommand
+
+    parser = argparse.ArgumentParser()
+    SimulationSubcommand().add_create_options(parser)
+    return parser.parse_args(['--version', 'benchmark', '--num-cores', '4', '--scan-results'])
+
+
+def bench_create(repeat, latency):
+    """Time each create_*_sample path; each repeat uses a fresh local database"""
+    import prismspf_mcapi.numerical_parameters
+    import prismspf_mcapi.model_parameters
+    import prismspf_mcapi.environment
+    import prismspf_mcapi.equations
+    import prismspf_mcapi.software
+    import prismspf_mcapi.simulation
+    from prismspf_mcapi.local_backend import LocalStore
+
+    args = create_args()
+    paths = [
+        ('numerical-parameters', lambda expt: [prismspf_mcapi.numerical_parameters.create_parameters_sample(expt, args)]),
+        ('model-parameters', lambda expt: [prismspf_mcapi.model_parameters.create_parameters_sample(expt, args)]),
+        ('environment', lambda expt: [prismspf_mcapi.environment.create_environment_sample(expt, args)]),
+        ('equations', lambda expt: prismspf_mcapi.equations.create_equations_sample(expt, args)),
+        ('software', lambda expt: [prismspf_mcapi.software.create_software_sample(expt, args)]),
+    ]
+
+    times = {name: [] for name, _ in paths + [('simulation', None)]}
+    round_trips = {}
+    for _ in range(repeat):
+        store = LocalStore(latency=latency)
+        expt = store.project(os.getcwd()).experiment()
+        sample_list = []
+        for name, create in paths:
+            before = sum(store.calls.values())
+            start = time.perf_counter()
+            procs = create(expt)
+            times[name].append(time.perf_counter() - start)
+            round_trips[name] = sum(store.calls.values()) - before
+            for proc in procs:
+                sample_list += proc.output_samples
+
+        before = sum(store.calls.values())
+        start = time.perf_counter()
+        prismspf_mcapi.simulation.create_simulation_sample(expt, args, sample_list)
+        times['simulation'].append(time.perf_counter() - start)
+        round_trips['simulation'] = sum(store.calls.values()) - before
+
+    results = {}
+    for name in times:
+        results['create ' + name] = summarize(times[name])
+        results['create ' + name]['round_trips'] = round_trips[name]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark prismspf_mcapi parsers and create_* paths on a synthetic app')
+    add_generator_options(parser)
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs of each benchmark')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds injected into each backend round trip')
+    parser.add_argument('--app-dir', default=None, help='Generate the app here and keep it (default: a temporary directory)')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    app_dir = args.app_dir or tempfile.mkdtemp(prefix='prismspf_bench_')
+    output = os.path.abspath(args.output) if args.output is not None else None
+    start = time.perf_counter()
+    files = generate_app(app_dir, args.constants, args.variables, args.depth, args.time_steps, args.ranks, args.points)
+    generate_seconds = time.perf_counter() - start
+
+    cwd = os.getcwd()
+    os.chdir(app_dir)
+    try:
+        devnull = open(os.devnull, 'w')
+        # The create_* functions print progress, and software/environment run git and hostname
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            benchmarks = bench_parsers(args.repeat)
+            try:
+                benchmarks.update(bench_create(args.repeat, args.latency))
+                skipped = None
+            except ImportError as err:
+                # The subcommand modules need the materials_commons package
+                skipped = 'create_* paths skipped: ' + str(err)
+    finally:
+        os.chdir(cwd)
+        if args.app_dir is None:
+            shutil.rmtree(app_dir)
+
+    results = {
+        'benchmark': 'create',
+        'timestamp': datetime.datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'app': {'constants': args.constants, 'variables': args.variables, 'depth': args.depth,
+                'time_steps': args.time_steps, 'ranks': args.ranks, 'points': args.points,
+                'result_files': len(files), 'generate_seconds': generate_seconds},
+        'latency_s': args.latency,
+        'benchmarks': benchmarks}
+    if skipped:
+        results['skipped'] = skipped
+
+    for name, result in benchmarks.items():
+        extra = ', {} round trips'.format(result['round_trips']) if 'round_trips' in result else ''
+        print('{:40} median {:9.1f} ms{}'.format(name, result['median_ms'], extra))
+    if skipped:
+        print(skipped)
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
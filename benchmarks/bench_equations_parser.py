@@ -0,0 +1,80 @@
+"""Benchmark how parse_equations_file scales with the number of variables
+
+    python benchmarks/bench_equations_parser.py --sizes 250 500 1000 2000 4000 8000 --max-exponent 1.3
+
+Writes synthetic equations.cc files (see synthetic_app.py) of increasing size,
+times the parser on each, and fits time ~ variables^exponent. A linear parser
+has an exponent close to 1. Exits with status 1 if the fitted exponent exceeds
+--max-exponent.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from synthetic_app import write_equations_file
+from prismspf_mcapi.equations_dot_h_parser import parse_equations_file
+
+DEFAULT_SIZES = [250, 500, 1000, 2000, 4000, 8000]
+
+
+def fit_exponent(sizes, times):
+    """Least-squares slope of log(time) against log(size)"""
+    xs = [math.log(n) for n in sizes]
+    ys = [math.log(t) for t in times]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sum((x - x_mean) ** 2 for x in xs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark how parse_equations_file scales with the number of variables')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Numbers of variables to time')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed parses per size (the minimum is used)')
+    parser.add_argument('--max-exponent', type=float, default=None, help='Fail if the fitted scaling exponent exceeds this')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='prismspf_bench_')
+    rows = []
+    try:
+        for n_variables in args.sizes:
+            path = os.path.join(work_dir, 'equations_{}.cc'.format(n_variables))
+            write_equations_file(path, n_variables)
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                equations = parse_equations_file(path)
+                times.append(time.perf_counter() - start)
+            if len(equations) != n_variables:
+                raise RuntimeError('Parsed {} variables, expected {}'.format(len(equations), n_variables))
+            rows.append({'variables': n_variables, 'bytes': os.path.getsize(path), 'min_ms': 1000 * min(times),
+                         'us_per_variable': 1e6 * min(times) / n_variables})
+    finally:
+        shutil.rmtree(work_dir)
+
+    exponent = fit_exponent([row['variables'] for row in rows], [row['min_ms'] for row in rows])
+    for row in rows:
+        print('{:8d} variables  {:9.2f} ms  {:6.2f} us/variable'.format(row['variables'], row['min_ms'], row['us_per_variable']))
+    print('Scaling exponent: {:.2f} (1.0 is linear)'.format(exponent))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'equations_parser', 'sizes': rows, 'exponent': exponent}, f, indent=2)
+
+    if args.max_exponent is not None and exponent > args.max_exponent:
+        print('Scaling exponent exceeds {:.2f}'.format(args.max_exponent))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
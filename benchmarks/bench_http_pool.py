@@ -0,0 +1,106 @@
+"""Benchmark shared keep-alive connections against one connection per request
+
+    python benchmarks/bench_http_pool.py --requests 500 --files 64 --workers 8 --connect-delay 0.01
+
+Starts the stand-in upload server (prismspf_mcapi.upload_server) on a free
+local port, with --connect-delay seconds added to every new connection in
+place of the TCP and TLS handshakes of a remote server. Then times, with a
+pooled ConnectionPool and with one that closes every connection after one
+request:
+
+  - --requests sequential small requests (upload offset queries)
+  - uploading --files small files with --workers concurrent upload workers
+
+Connections opened are counted on both the client and the server.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from urllib.parse import urlsplit
+from prismspf_mcapi.upload_server import start_server
+from prismspf_mcapi.upload import ChunkedHTTPTransport, UploadEngine
+from prismspf_mcapi.http_pool import ConnectionPool
+
+
+def make_pool(url, keep_alive, pool_size):
+    parts = urlsplit(url)
+    return ConnectionPool(parts.scheme, parts.netloc, max_size=pool_size, keep_alive=keep_alive)
+
+
+def bench_requests(server, url, n_requests, keep_alive, pool_size):
+    transport = ChunkedHTTPTransport(url, pool=make_pool(url, keep_alive, pool_size))
+    before = server.connections
+    start = time.perf_counter()
+    for i in range(n_requests):
+        transport.offset('missing-{}'.format(i))
+    seconds = time.perf_counter() - start
+    return seconds, transport.pool.stats(), server.connections - before
+
+
+def bench_uploads(server, url, paths, workers, keep_alive, pool_size):
+    transport = ChunkedHTTPTransport(url, pool=make_pool(url, keep_alive, pool_size))
+    engine = UploadEngine(transport, workers=workers, chunk_size=4096)
+    before = server.connections
+    start = time.perf_counter()
+    engine.upload(paths)
+    seconds = time.perf_counter() - start
+    return seconds, transport.pool.stats(), server.connections - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark shared keep-alive HTTP connections against the stand-in upload server')
+    parser.add_argument('--requests', type=int, default=500, help='Number of sequential small requests')
+    parser.add_argument('--files', type=int, default=64, help='Number of files uploaded')
+    parser.add_argument('--file-size', type=int, default=16384, help='Bytes per uploaded file (sent in 4 KiB chunks)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent upload workers')
+    parser.add_argument('--pool-size', type=int, default=8, help='Maximum number of open connections')
+    parser.add_argument('--connect-delay', type=float, default=0.01, help='Seconds the server adds to each new connection')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='prismspf_bench_')
+    results = {}
+    try:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(work_dir, 'result-{:04d}.vtu'.format(i))
+            with open(path, 'wb') as f:
+                f.write(os.urandom(args.file_size))
+            paths.append(path)
+
+        for keep_alive in (False, True):
+            mode = 'pooled' if keep_alive else 'per-request'
+            server, url = start_server(os.path.join(work_dir, 'server-' + mode), connect_delay=args.connect_delay)
+            try:
+                seconds, stats, accepted = bench_requests(server, url, args.requests, keep_alive, args.pool_size)
+                results[mode + ' requests'] = dict(stats, seconds=seconds, server_connections=accepted)
+                seconds, stats, accepted = bench_uploads(server, url, paths, args.workers, keep_alive, args.pool_size)
+                results[mode + ' uploads'] = dict(stats, seconds=seconds, server_connections=accepted)
+            finally:
+                server.shutdown()
+                server.server_close()
+    finally:
+        shutil.rmtree(work_dir)
+
+    for name, result in results.items():
+        print('{:24} {:8.3f} s  {:5d} requests  {:5d} connections  {:5.1f}% reused'.format(
+            name, result['seconds'], result['requests'], result['server_connections'],
+            100.0 * result['reused'] / result['requests'] if result['requests'] else 0.0))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'http_pool', 'connect_delay_s': args.connect_delay, 'pool_size': args.pool_size,
+                       'workers': args.workers, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
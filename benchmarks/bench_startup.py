@@ -0,0 +1,121 @@
+"""Benchmark prismspf_mcapi CLI startup time
+
+Times 'mc prismspf' with no subcommand (which only prints the usage), and
+'mc prismspf <subcommand> --help' for every subcommand, in fresh
+interpreters. Checks that no subcommand module is imported for the usage,
+and that a subcommand's help imports neither NumPy nor the modules of the
+other subcommands.
+
+    python benchmarks/bench_startup.py --repeat 20 --max-ms 150 --max-help-ms 400
+
+Exits with status 1 if a median startup time exceeds --max-ms (usage) or
+--max-help-ms (subcommand help), or if a module was imported eagerly.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs one command; argv[1] is the JSON of [command argv, modules that must not be imported]
+STARTUP_SCRIPT = """
+import sys
+import json
+argv, forbidden = json.loads(sys.argv[1])
+import prismspf_mcapi
+try:
+    prismspf_mcapi.prismspf_subcommand(argv)
+except SystemExit:
+    pass
+sys.stderr.write('\\n' + ','.join(name for name in forbidden if name in sys.modules))
+"""
+
+# Modules a subcommand's help may import besides the subcommand's own
+ALLOWED_IMPORTS = {'ingest': ['prismspf_mcapi.simulation']}
+
+
+def startup_cases():
+    """Return (name, argv, modules that must not be imported) for every command timed"""
+    sys.path.insert(0, REPO_DIR)
+    from prismspf_mcapi.main import prismspf_usage
+
+    modules = [interface['module'] for interface in prismspf_usage]
+    cases = [('mc prismspf', ['mc', 'prismspf'], ['materials_commons', 'numpy'] + modules)]
+    for interface in prismspf_usage:
+        allowed = [interface['module']] + ALLOWED_IMPORTS.get(interface['name'], [])
+        cases.append(('mc prismspf ' + interface['name'] + ' --help', ['mc', 'prismspf', interface['name'], '--help'],
+                      ['numpy'] + [module for module in modules if module not in allowed]))
+    return cases
+
+
+def time_startup(argv, forbidden, repeat):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    times = []
+    eager = set()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, json.dumps([argv, forbidden])], env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        times.append(time.perf_counter() - start)
+        eager.update(name for name in result.stderr.decode().strip().split('\n')[-1].split(',') if name)
+    return sorted(times), sorted(eager)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark prismspf_mcapi CLI startup time')
+    parser.add_argument('--repeat', type=int, default=10, help='Number of interpreter launches')
+    parser.add_argument('--max-ms', type=float, default=None, help='Fail if the median time of the usage exceeds this')
+    parser.add_argument('--max-help-ms', type=float, default=None,
+                        help='Fail if the median time of a subcommand\'s help exceeds this')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    # Baseline: a bare interpreter
+    env = dict(os.environ)
+    baseline = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], env=env, check=True)
+        baseline.append(time.perf_counter() - start)
+    baseline.sort()
+
+    baseline_ms = 1000 * baseline[len(baseline) // 2]
+    print('bare interpreter: median {:.1f} ms'.format(baseline_ms))
+
+    results = {
+        'benchmark': 'startup',
+        'repeat': args.repeat,
+        'interpreter_median_ms': baseline_ms,
+        'cases': {}}
+    failed = False
+    for i, (name, argv, forbidden) in enumerate(startup_cases()):
+        times, eager = time_startup(argv, forbidden, args.repeat)
+        median_ms = 1000 * times[len(times) // 2]
+        results['cases'][name] = {
+            'median_ms': median_ms,
+            'min_ms': 1000 * times[0],
+            'max_ms': 1000 * times[-1],
+            'eager_imports': eager}
+
+        print('{}: median {:.1f} ms'.format(name, median_ms))
+        if eager:
+            print('  imported: ' + ', '.join(eager))
+            failed = True
+        max_ms = args.max_ms if i == 0 else args.max_help_ms
+        if max_ms is not None and median_ms > max_ms:
+            print('  median time exceeds {:.1f} ms'.format(max_ms))
+            failed = True
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
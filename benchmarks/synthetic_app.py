@@ -0,0 +1,263 @@
+"""Generate synthetic PRISMS-PF app directories for benchmarks
+
+    python benchmarks/synthetic_app.py APP_DIR --constants 2000 --variables 200 --time-steps 20 --ranks 4
+
+Writes parameters.in (deep subsections and many model constants), equations.cc
+(many variables, with line and block comments) and time steps x ranks .vtu
+result files (plus one .pvtu per time step when there is more than one rank).
+"""
+
+import os
+import sys
+import struct
+import argparse
+
+# Default size of a generated app
+DEFAULT_CONSTANTS = 2000
+DEFAULT_VARIABLES = 200
+DEFAULT_DEPTH = 6
+DEFAULT_TIME_STEPS = 10
+DEFAULT_RANKS = 1
+DEFAULT_POINTS = 1000
+
+_VARIABLE_TYPES = ['SCALAR', 'VECTOR']
+_EQUATION_TYPES = ['EXPLICIT_TIME_DEPENDENT', 'AUXILIARY', 'IMPLICIT_TIME_DEPENDENT', 'TIME_INDEPENDENT']
+
+
+def variable_names(n_variables):
+    return ['var' + str(i) for i in range(n_variables)]
+
+
+def write_parameters_file(path, n_constants=DEFAULT_CONSTANTS, n_variables=DEFAULT_VARIABLES, depth=DEFAULT_DEPTH,
+                          n_time_steps=DEFAULT_TIME_STEPS, n_ranks=DEFAULT_RANKS):
+    """Write a parameters.in with the usual numerical parameters, nested subsections and model constants"""
+    lines = [
+        '# Synthetic parameter file',
+        'set Number of dimensions = 2',
+        'set Domain size X = 100',
+        'set Domain size Y = 100',
+        'set Subdivisions X = 3',
+        'set Subdivisions Y = 3',
+        'set Refine factor = 6',
+        'set Element degree = 1',
+        'set Mesh adaptivity = true',
+        'set Max refinement level = 8',
+        'set Min refinement level = 2',
+        'set Refinement criteria fields = ' + ', '.join(variable_names(min(n_variables, 3))),
+        'set Time step = 1.0e-3',
+        'set Number of time steps = ' + str(max(1, n_time_steps - 1) * 100),
+        'set Output file name (base) = solution',
+        'set Output file type = vtu',
+        'set Output separate files per process = ' + ('true' if n_ranks > 1 else 'false'),
+        'set Output condition = EQUAL_SPACING',
+        'set Number of outputs = ' + str(n_time_steps),
+        '',
+    ]
+
+    # One solver subsection per variable, as generated apps have
+    for name in variable_names(n_variables):
+        lines += ['subsection Linear solver parameters: ' + name,
+                  '    set Tolerance type = ABSOLUTE_RESIDUAL',
+                  '    set Tolerance value = 1e-10',
+                  '    set Maximum linear solver iterations = 1000',
+                  'end',
+                  'subsection Nonlinear solver parameters: ' + name,
+                  '    set Tolerance type = ABSOLUTE_SOLUTION_CHANGE',
+                  '    set Tolerance value = 1e-10',
+                  '    set Use backtracking line search damping = true',
+                  'end']
+
+    # Deeply nested subsections
+    for level in range(depth):
+        indent = '    ' * level
+        lines.append(indent + 'subsection Level ' + str(level))
+        lines.append(indent + '    set Entry = ' + str(level))
+        lines.append(indent + '    # Comment at level ' + str(level))
+    for level in reversed(range(depth)):
+        lines.append('    ' * level + 'end')
+
+    lines.append('')
+    for i in range(n_constants):
+        kind = i % 4
+        if kind == 0:
+            lines.append('set Model constant A{} = {}, DOUBLE'.format(i, 0.5 * i))
+        elif kind == 1:
+            lines.append('set Model constant N{} = {}, INT'.format(i, i))
+        elif kind == 2:
+            lines.append('set Model constant B{} = {}, BOOL'.format(i, 'true' if i % 8 == 2 else 'false'))
+        else:
+            lines.append('set Model constant C{} = ({}, {}, {}), ISOTROPIC ELASTIC CONSTANTS'.format(i, i, i + 1, i + 2))
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_equations_file(path, n_variables=DEFAULT_VARIABLES):
+    """Write an equations.cc declaring 'n_variables' variables, with line and block comments"""
+    lines = [
+        '// Synthetic equations.cc',
+        '/* Block comment before the variable declarations',
+        '   set_variable_name\t\t\t\t(999,"commented_out");',
+        '*/',
+        'void variableAttributeLoader::loadVariableAttributes(){',
+    ]
+    for i, name in enumerate(variable_names(n_variables)):
+        lines += [
+            '\t// Variable ' + str(i),
+            '\tset_variable_name\t\t\t\t(' + str(i) + ',"' + name + '");',
+            '\tset_variable_type\t\t\t\t(' + str(i) + ',' + _VARIABLE_TYPES[i % len(_VARIABLE_TYPES)] + ');',
+            '\tset_variable_equation_type\t\t(' + str(i) + ',' + _EQUATION_TYPES[i % len(_EQUATION_TYPES)] + ');',
+            '',
+            '\tset_dependencies_value_term_RHS(' + str(i) + ', "' + name + ',grad(' + name + ')");',
+        ]
+        if i % 10 == 0:
+            lines += ['\t/* Block comment', '\t   set_variable_name\t\t\t\t(' + str(i) + ',"ignored");', '\t*/']
+    lines += ['}', '']
+    lines += ['template <int dim, int degree>',
+              'void customPDE<dim,degree>::explicitEquationRHS(variableContainer<dim,degree,dealii::VectorizedArray<double> > & variable_list,',
+              '\t\t\t\tdealii::Point<dim, dealii::VectorizedArray<double> > q_point_loc) const {',
+              '}']
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def _appended_array(values, fmt):
+    raw = struct.pack('<' + str(len(values)) + fmt, *values)
+    return struct.pack('<I', len(raw)) + raw
+
+
+def write_vtu_file(path, fields, n_points=DEFAULT_POINTS, step=0):
+    """Write a .vtu file with raw appended point data for 'fields'"""
+    n_cells = max(1, n_points // 4)
+    arrays = [('Points', 'Float32', 3, 'Points', [float(i % 97) for i in range(3 * n_points)], 'f'),
+              ('connectivity', 'Int32', 1, 'Cells', [i % n_points for i in range(4 * n_cells)], 'i'),
+              ('offsets', 'Int32', 1, 'Cells', [4 * (i + 1) for i in range(n_cells)], 'i'),
+              ('types', 'UInt8', 1, 'Cells', [9] * n_cells, 'B')]
+    for j, name in enumerate(fields):
+        arrays.append((name, 'Float64', 1, 'PointData', [((i * (j + 1) + step) % 101) / 100.0 for i in range(n_points)], 'd'))
+
+    blocks = []
+    offset = 0
+    declarations = {}
+    for name, vtk_type, components, section, values, fmt in arrays:
+        block = _appended_array(values, fmt)
+        declarations.setdefault(section, []).append(
+            '<DataArray type="{}" Name="{}" NumberOfComponents="{}" format="appended" offset="{}"/>'.format(
+                vtk_type, name, components, offset))
+        blocks.append(block)
+        offset += len(block)
+
+    xml = ['<?xml version="1.0"?>',
+           '<VTKFile type="UnstructuredGrid" version="0.1" byte_order="LittleEndian" header_type="UInt32">',
+           '<UnstructuredGrid>',
+           '<Piece NumberOfPoints="{}" NumberOfCells="{}">'.format(n_points, n_cells)]
+    for section in ('PointData', 'Points', 'Cells'):
+        xml.append('<' + section + '>')
+        xml += declarations.get(section, [])
+        xml.append('</' + section + '>')
+    xml += ['</Piece>', '</UnstructuredGrid>', '<AppendedData encoding="raw">']
+
+    with open(path, 'wb') as f:
+        f.write(('\n'.join(xml) + '\n_').encode('ascii'))
+        for block in blocks:
+            f.write(block)
+        f.write(b'\n</AppendedData>\n</VTKFile>\n')
+
+
+def write_pvtu_file(path, fields, piece_names):
+    lines = ['<?xml version="1.0"?>',
+             '<VTKFile type="PUnstructuredGrid" version="0.1" byte_order="LittleEndian">',
+             '<PUnstructuredGrid GhostLevel="0">',
+             '<PPointData>']
+    lines += ['<PDataArray type="Float64" Name="{}" NumberOfComponents="1" format="ascii"/>'.format(name) for name in fields]
+    lines += ['</PPointData>', '<PPoints>', '<PDataArray type="Float32" NumberOfComponents="3"/>', '</PPoints>']
+    lines += ['<Piece Source="{}"/>'.format(name) for name in piece_names]
+    lines += ['</PUnstructuredGrid>', '</VTKFile>']
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_result_files(app_dir, n_time_steps=DEFAULT_TIME_STEPS, n_ranks=DEFAULT_RANKS, fields=None,
+                       n_points=DEFAULT_POINTS):
+    """Write n_time_steps x n_ranks result files named like PRISMS-PF output"""
+    if fields is None:
+        fields = variable_names(3)
+    paths = []
+    for t in range(n_time_steps):
+        step = t * 100
+        if n_ranks == 1:
+            name = 'solution-{:06d}.vtu'.format(step)
+            write_vtu_file(os.path.join(app_dir, name), fields, n_points, step)
+            paths.append(name)
+            continue
+        piece_names = ['solution-{:06d}.{:d}.vtu'.format(step, rank) for rank in range(n_ranks)]
+        for name in piece_names:
+            write_vtu_file(os.path.join(app_dir, name), fields, n_points // n_ranks, step)
+        index_name = 'solution-{:06d}.pvtu'.format(step)
+        write_pvtu_file(os.path.join(app_dir, index_name), fields, piece_names)
+        paths += [index_name] + piece_names
+    return paths
+
+
+def generate_app(app_dir, n_constants=DEFAULT_CONSTANTS, n_variables=DEFAULT_VARIABLES, depth=DEFAULT_DEPTH,
+                 n_time_steps=DEFAULT_TIME_STEPS, n_ranks=DEFAULT_RANKS, n_points=DEFAULT_POINTS, n_fields=3):
+    """
+    Generate a synthetic PRISMS-PF app directory.
+
+    Arguments:
+
+        app_dir: str
+          Created if it does not exist
+
+        n_constants: int
+          Number of model constants in parameters.in
+
+        n_variables: int
+          Number of variables in equations.cc (each also gets solver subsections in parameters.in)
+
+        depth: int
+          Nesting depth of the deepest subsection in parameters.in
+
+        n_time_steps, n_ranks: int
+          Number of output time steps and of files per time step
+
+        n_points: int
+          Number of points per time step (split across ranks)
+
+        n_fields: int
+          Number of variables written as fields to the result files
+
+    Returns:
+
+        result_files: list of str
+          Names of the generated result files, relative to app_dir
+    """
+    if not os.path.isdir(app_dir):
+        os.makedirs(app_dir)
+    write_parameters_file(os.path.join(app_dir, 'parameters.in'), n_constants, n_variables, depth, n_time_steps, n_ranks)
+    write_equations_file(os.path.join(app_dir, 'equations.cc'), n_variables)
+    fields = variable_names(min(n_fields, n_variables))
+    return write_result_files(app_dir, n_time_steps, n_ranks, fields, n_points)
+
+
+def add_generator_options(parser):
+    parser.add_argument('--constants', type=int, default=DEFAULT_CONSTANTS, help='Number of model constants')
+    parser.add_argument('--variables', type=int, default=DEFAULT_VARIABLES, help='Number of variables in equations.cc')
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH, help='Nesting depth of subsections in parameters.in')
+    parser.add_argument('--time-steps', type=int, default=DEFAULT_TIME_STEPS, help='Number of output time steps')
+    parser.add_argument('--ranks', type=int, default=DEFAULT_RANKS, help='Number of result files per time step')
+    parser.add_argument('--points', type=int, default=DEFAULT_POINTS, help='Number of points per time step')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic PRISMS-PF app directory')
+    parser.add_argument('app_dir', help='Directory to write the app to')
+    add_generator_options(parser)
+    args = parser.parse_args()
+
+    files = generate_app(args.app_dir, args.constants, args.variables, args.depth, args.time_steps, args.ranks, args.points)
+    print('Wrote parameters.in, equations.cc and {} result file(s) to {}'.format(len(files), args.app_dir))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
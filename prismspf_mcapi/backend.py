@@ -0,0 +1,166 @@
+"""Selection of the backend that samples, processes and files are created in"""
+
+import os
+import time
+import threading
+from prismspf_mcapi.proxy import wrap_backend
+from prismspf_mcapi.profiling import active_tracer
+from prismspf_mcapi.http_pool import share_api_session
+from prismspf_mcapi.retry import get_retry_policy
+from prismspf_mcapi.metadata_cache import get_metadata_cache
+
+# Environment variable selecting the backend:
+#   'mcapi' (default)   the Materials Commons project and experiment of the current directory
+#   'memory'            a local in-memory database, discarded at exit
+#   'sqlite:<path>'     a local SQLite database file
+BACKEND_ENV_VAR = 'PRISMSPF_MCAPI_BACKEND'
+
+# Environment variable with the latency, in seconds, added to each local backend round trip
+LATENCY_ENV_VAR = 'PRISMSPF_MCAPI_LATENCY'
+
+# Environment variable with the fraction of local backend round trips that fail transiently
+FAILURE_RATE_ENV_VAR = 'PRISMSPF_MCAPI_FAILURE_RATE'
+
+# backend spec -> LocalStore, so one invocation always sees the same local database
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_local_store(spec, latency=None):
+    """
+    Return the shared LocalStore for a local backend spec, creating it if necessary.
+
+    Arguments:
+
+        spec: str
+          'memory' or 'sqlite:<path>'
+
+        latency: float, optional (default=the PRISMSPF_MCAPI_LATENCY environment variable, or 0)
+          Seconds added to each round trip
+
+    The fraction of round trips that fail transiently is read from the
+    PRISMSPF_MCAPI_FAILURE_RATE environment variable (default 0).
+
+    Returns:
+
+        store: prismspf_mcapi.local_backend.LocalStore instance
+    """
+    from prismspf_mcapi.local_backend import LocalStore
+
+    if spec == 'memory':
+        path = ':memory:'
+    elif spec.startswith('sqlite:'):
+        path = spec[len('sqlite:'):]
+    else:
+        raise ValueError("Unknown backend '" + spec + "', use 'mcapi', 'memory' or 'sqlite:<path>'")
+    if latency is None:
+        latency = float(os.environ.get(LATENCY_ENV_VAR, 0.0))
+
+    with _stores_lock:
+        if spec not in _stores:
+            _stores[spec] = LocalStore(path, latency=latency)
+        _stores[spec].latency = float(latency)
+        _stores[spec].failure_rate = float(os.environ.get(FAILURE_RATE_ENV_VAR, 0.0))
+        return _stores[spec]
+
+
+class ConnectionLimiter(object):
+    """
+    Bounds the number of backend calls in flight at the same time, across all
+    threads that share it (a prismspf_mcapi.proxy.BackendProxy hook).
+
+    Arguments:
+
+        max_connections: int
+          Maximum number of concurrent backend calls
+
+    Attributes:
+
+        calls: int
+          Number of calls made
+
+        wait_seconds: float
+          Total time calls waited for a free connection
+
+        peak: int
+          Largest number of calls that were in flight at the same time
+    """
+
+    def __init__(self, max_connections):
+        self.max_connections = max(1, int(max_connections))
+        self._semaphore = threading.BoundedSemaphore(self.max_connections)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.wait_seconds = 0.0
+        self.in_flight = 0
+        self.peak = 0
+
+    def call(self, method, fn, args, kwargs):
+        start = time.perf_counter()
+        with self._semaphore:
+            with self._lock:
+                self.calls += 1
+                self.wait_seconds += time.perf_counter() - start
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def report(self):
+        """Return a one-line summary of the calls made and the time spent waiting for a connection"""
+        return '{} backend call(s) over at most {} connection(s), peak {} in flight, {:.2f} s waiting'.format(
+            self.calls, self.max_connections, self.peak, self.wait_seconds)
+
+
+def make_project_and_experiment(backend=None, latency=None, app_dir=None, limiter=None):
+    """
+    Return the project and experiment to create samples and processes in.
+
+    Arguments:
+
+        backend: str, optional (default=the PRISMSPF_MCAPI_BACKEND environment variable, or 'mcapi')
+          'mcapi', 'memory' or 'sqlite:<path>'
+
+        latency: float, optional
+          Seconds added to each round trip of a local backend
+
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory, used to find the Materials Commons
+          project. Local backends always use the project of the current
+          working directory, so every app directory of a sweep shares it.
+
+        limiter: ConnectionLimiter, optional (default=None)
+          Bounds the concurrent calls made through the returned objects
+
+    Returns:
+
+        (proj, expt): mcapi.Project and mcapi.Experiment objects, or their
+          prismspf_mcapi.local_backend stand-ins. Materials Commons requests
+          share one keep-alive session (see prismspf_mcapi.http_pool). They
+          are wrapped in prismspf_mcapi.proxy.BackendProxy objects, so calls
+          that fail transiently are retried when that is safe (see
+          prismspf_mcapi.retry.RetryPolicy), at most
+          'limiter' calls are in flight, calls are traced while a
+          subcommand runs with --profile, and writes clear the project's
+          metadata cache (see prismspf_mcapi.metadata_cache).
+    """
+    if backend is None:
+        backend = os.environ.get(BACKEND_ENV_VAR, 'mcapi')
+
+    if backend == 'mcapi':
+        from materials_commons.cli.functions import make_local_project, make_local_expt
+        share_api_session()
+        proj = make_local_project(app_dir) if app_dir is not None else make_local_project()
+        expt = make_local_expt(proj)
+    else:
+        proj = get_local_store(backend, latency).project(os.getcwd())
+        expt = proj.experiment()
+    # Only the local backends are known to apply a write at most once per idempotency key
+    get_retry_policy().keyed_writes = (backend != 'mcapi')
+
+    # Retries wait outside the limiter, each attempt is traced, and writes clear the metadata cache
+    hooks = [get_retry_policy(), limiter, active_tracer(), get_metadata_cache(proj)]
+    return wrap_backend(proj, expt, hooks)
@@ -0,0 +1,174 @@
+"""Per-timestep bundling of PRISMS-PF output written as one file per MPI process"""
+
+import os
+import re
+import tarfile
+
+# Directory, relative to the app directory, the bundles are written to
+DEFAULT_BUNDLE_DIR = os.path.join('.prismspf_mcapi', 'bundles')
+
+# Matches the file of one piece in a .pvtu index file, e.g. <Piece Source="solution-000100.0.vtu"/>
+_piece_source = re.compile(r'<Piece\s[^>]*Source\s*=\s*"([^"]*)"')
+
+
+def find_timestep_groups(file_names, base_name='solution'):
+    """
+    Group per-process output files by time step.
+
+    With 'Output separate files per process' set, PRISMS-PF writes
+    '<base>-<step>.<rank>.vtu' for every process plus a '<base>-<step>.pvtu'
+    index file per output step.
+
+    Arguments:
+
+        file_names: list of str
+          Names of the files in the app directory
+
+        base_name: str, optional (default='solution')
+          The 'Output file name (base)' from parameters.in
+
+    Returns:
+
+        groups: dict
+          Step (as written in the file name) -> sorted list of file names,
+          with the .pvtu file first
+    """
+    rank_file = re.compile('^' + re.escape(base_name) + r'-(\d+)\.(\d+)\.vtu$')
+    index_file = re.compile('^' + re.escape(base_name) + r'-(\d+)\.pvtu$')
+
+    groups = {}
+    for name in file_names:
+        match = rank_file.match(name)
+        if match is not None:
+            groups.setdefault(match.group(1), {'pvtu': [], 'vtu': []})['vtu'].append((int(match.group(2)), name))
+            continue
+        match = index_file.match(name)
+        if match is not None:
+            groups.setdefault(match.group(1), {'pvtu': [], 'vtu': []})['pvtu'].append(name)
+
+    return {step: group['pvtu'] + [name for _, name in sorted(group['vtu'])] for step, group in groups.items()}
+
+
+def pvtu_pieces(path):
+    """Return the names of the per-process files a .pvtu index file lists"""
+    with open(path) as f:
+        return [os.path.basename(source) for source in _piece_source.findall(f.read())]
+
+
+def complete_timesteps(file_names, base_name='solution', app_dir=None):
+    """
+    Return the files of the time steps that are fully written, and files that are not per-process output.
+
+    A time step is complete once its .pvtu file and every per-process file
+    the .pvtu lists are among 'file_names'.
+
+    Arguments:
+
+        file_names: list of str
+          Names of completely written files in the app directory
+
+        base_name: str, optional (default='solution')
+          The 'Output file name (base)' from parameters.in
+
+        app_dir: str, optional (default=current working directory)
+
+    Returns:
+
+        file_names: list of str
+          The subset of 'file_names' that can be bundled (see bundle_per_timestep) and uploaded
+    """
+    if app_dir is None:
+        app_dir = os.getcwd()
+    present = set(file_names)
+    grouped = set()
+    complete = set()
+    for step, names in find_timestep_groups(file_names, base_name).items():
+        grouped.update(names)
+        index_name = base_name + '-' + step + '.pvtu'
+        if index_name in present and all(name in present for name in pvtu_pieces(os.path.join(app_dir, index_name))):
+            complete.update(names)
+    return [name for name in file_names if name in complete or name not in grouped]
+
+
+def bundle_timestep(file_names, bundle_path, app_dir=None, compresslevel=6):
+    """
+    Pack the files of one time step into a gzip-compressed tar archive.
+
+    An existing bundle newer than all of its members is reused.
+
+    Arguments:
+
+        file_names: list of str
+          Files of the time step, relative to 'app_dir'
+
+        bundle_path: str
+          Path of the archive to write
+
+        app_dir: str, optional (default=current working directory)
+
+    Returns:
+
+        bundle_path: str
+    """
+    if app_dir is None:
+        app_dir = os.getcwd()
+    paths = [os.path.join(app_dir, name) for name in file_names]
+
+    if os.path.isfile(bundle_path):
+        bundle_mtime = os.path.getmtime(bundle_path)
+        if all(os.path.getmtime(path) <= bundle_mtime for path in paths):
+            return bundle_path
+
+    tmp_path = bundle_path + '.tmp'
+    with tarfile.open(tmp_path, 'w:gz', compresslevel=compresslevel) as tar:
+        for name, path in zip(file_names, paths):
+            tar.add(path, arcname=name)
+    os.replace(tmp_path, bundle_path)
+    return bundle_path
+
+
+def bundle_per_timestep(file_names, base_name='solution', app_dir=None, bundle_dir=DEFAULT_BUNDLE_DIR):
+    """
+    Replace per-process output files by one archive per time step.
+
+    Files that are not per-process output (e.g. serial .vtu files) are
+    returned unchanged.
+
+    Arguments:
+
+        file_names: list of str
+          Names of result files in the app directory
+
+        base_name: str, optional (default='solution')
+          The 'Output file name (base)' from parameters.in
+
+        app_dir: str, optional (default=current working directory)
+
+        bundle_dir: str, optional (default=DEFAULT_BUNDLE_DIR)
+          Directory, relative to 'app_dir', the archives are written to
+
+    Returns:
+
+        paths: list of str
+          Bundles (named '<base>-<step>.tar.gz') followed by the remaining
+          files, relative to 'app_dir'
+    """
+    if app_dir is None:
+        app_dir = os.getcwd()
+    groups = find_timestep_groups(file_names, base_name)
+    if not groups:
+        return list(file_names)
+
+    out_dir = os.path.join(app_dir, bundle_dir)
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    bundled = set()
+    bundles = []
+    for step in sorted(groups, key=int):
+        bundle_name = os.path.join(bundle_dir, base_name + '-' + step + '.tar.gz')
+        bundle_timestep(groups[step], os.path.join(app_dir, bundle_name), app_dir)
+        bundles.append(bundle_name)
+        bundled.update(groups[step])
+
+    return bundles + [name for name in file_names if name not in bundled]
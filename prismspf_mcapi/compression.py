@@ -0,0 +1,194 @@
+"""Streaming compression of result files before upload"""
+
+import os
+import bz2
+import lzma
+import time
+import zlib
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Codec -> (file extension, default level)
+CODECS = {
+    'gzip': ('.gz', 6),
+    'bz2': ('.bz2', 9),
+    'lzma': ('.xz', 6),
+    'zstd': ('.zst', 3),
+}
+
+# Default number of bytes read and compressed at a time
+DEFAULT_BLOCK_SIZE = 4 << 20
+
+# Directory, relative to the app directory, compressed copies are written to
+DEFAULT_STAGING_DIR = os.path.join('.prismspf_mcapi', 'compressed')
+
+# Files with these extensions are already compressed and are uploaded as they are
+COMPRESSED_EXTENSIONS = ('.gz', '.tgz', '.bz2', '.xz', '.zst', '.zip')
+
+
+def available_codecs():
+    """Return the names of the codecs that can be used in this environment"""
+    return [codec for codec in CODECS if codec != 'zstd' or zstandard is not None]
+
+
+def _make_compressor(codec, level):
+    if codec == 'gzip':
+        # wbits=31 writes a gzip header and trailer
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if codec == 'bz2':
+        return bz2.BZ2Compressor(level)
+    if codec == 'lzma':
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=level)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("The 'zstd' codec requires the zstandard package (pip install zstandard).")
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError("Unknown compression codec '" + codec + "', choose from: " + ', '.join(CODECS))
+
+
+class CompressionResult(object):
+    """
+    Outcome of compressing one file.
+
+    Attributes: path (the compressed copy), original_path, original_size,
+    compressed_size, codec, level and seconds.
+    """
+
+    def __init__(self, path, original_path, original_size, compressed_size, codec, level, seconds):
+        self.path = path
+        self.original_path = original_path
+        self.original_size = original_size
+        self.compressed_size = compressed_size
+        self.codec = codec
+        self.level = level
+        self.seconds = seconds
+
+    def metadata(self):
+        """Return the metadata recorded for the uploaded file"""
+        return {'codec': self.codec, 'level': self.level, 'original_size': self.original_size}
+
+    def remove(self):
+        """Delete the compressed copy, e.g. once it was uploaded"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamCompressor(object):
+    """
+    Compresses files in fixed-size blocks, so memory use does not depend on file size.
+
+    Compressed copies are written to a staging directory in the app
+    directory, and are meant to be deleted (see CompressionResult.remove) once
+    uploaded. The totals over all files compressed so far, and the number of
+    files uploaded as they are because they were already compressed, are
+    kept for reporting. Safe to use from several upload threads at once.
+
+    Arguments:
+
+        codec: str
+          One of CODECS
+
+        level: int, optional (default=the codec's default level)
+
+        block_size: int, optional (default=DEFAULT_BLOCK_SIZE)
+          Number of bytes read and compressed at a time
+
+        app_dir: str, optional (default=current working directory)
+          The app directory; only files in it can be compressed
+
+        staging_dir: str, optional (default=DEFAULT_STAGING_DIR in 'app_dir')
+          Directory compressed copies are written to
+    """
+
+    def __init__(self, codec, level=None, block_size=DEFAULT_BLOCK_SIZE, app_dir=None, staging_dir=None):
+        if codec not in CODECS:
+            raise ValueError("Unknown compression codec '" + codec + "', choose from: " + ', '.join(CODECS))
+        self.codec = codec
+        self.extension, default_level = CODECS[codec]
+        self.level = default_level if level is None else int(level)
+        self.block_size = max(1, int(block_size))
+        self.app_dir = app_dir or os.curdir
+        self.staging_dir = os.path.join(self.app_dir, DEFAULT_STAGING_DIR) if staging_dir is None else staging_dir
+        # Fail early if the codec is not available
+        _make_compressor(self.codec, self.level)
+
+        self._lock = threading.Lock()
+        self.n_files = 0
+        self.n_skipped = 0
+        self.original_bytes = 0
+        self.compressed_bytes = 0
+        self.seconds = 0.0
+
+    def should_compress(self, path):
+        """Return False, and count the file as skipped, if 'path' is already compressed"""
+        if path.lower().endswith(COMPRESSED_EXTENSIONS):
+            with self._lock:
+                self.n_skipped += 1
+            return False
+        return True
+
+    def compress_file(self, path):
+        """
+        Write a compressed copy of 'path' to the staging directory.
+
+        Raises:
+
+            ValueError: if 'path' is not in the app directory
+
+        Returns:
+
+            result: CompressionResult instance
+        """
+        relative_path = os.path.normpath(os.path.relpath(path, self.app_dir))
+        if relative_path == os.pardir or relative_path.startswith(os.pardir + os.sep):
+            raise ValueError('Cannot compress ' + path + ', it is not in the app directory ' + self.app_dir)
+        out_path = os.path.join(self.staging_dir, relative_path + self.extension)
+        out_dir = os.path.dirname(out_path)
+        if out_dir and not os.path.isdir(out_dir):
+            os.makedirs(out_dir, exist_ok=True)
+
+        start = time.perf_counter()
+        compressor = _make_compressor(self.codec, self.level)
+        original_size = 0
+        tmp_path = out_path + '.tmp'
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            for block in iter(lambda: src.read(self.block_size), b''):
+                original_size += len(block)
+                dst.write(compressor.compress(block))
+            dst.write(compressor.flush())
+        os.replace(tmp_path, out_path)
+        seconds = time.perf_counter() - start
+
+        result = CompressionResult(out_path, path, original_size, os.path.getsize(out_path), self.codec, self.level, seconds)
+        with self._lock:
+            self.n_files += 1
+            self.original_bytes += result.original_size
+            self.compressed_bytes += result.compressed_size
+            self.seconds += seconds
+        return result
+
+    def report(self):
+        """Return a one-line summary of bytes saved and compression throughput"""
+        skipped = ''
+        if self.n_skipped:
+            skipped = '{} already compressed file(s) (e.g. time-step bundles) uploaded as they are'.format(self.n_skipped)
+            if self.n_files == 0:
+                return 'Compressed no files with {}: {}'.format(self.codec, skipped)
+            skipped = '; ' + skipped
+        saved = self.original_bytes - self.compressed_bytes
+        ratio = self.original_bytes / self.compressed_bytes if self.compressed_bytes else 0.0
+        throughput = self.original_bytes / self.seconds / 1e6 if self.seconds > 0 else 0.0
+        return ('Compressed {} file(s) with {} (level {}): {:.1f} MB -> {:.1f} MB, saved {:.1f} MB ({:.1f}x), '
+                '{:.1f} MB/s per thread{}').format(self.n_files, self.codec, self.level, self.original_bytes / 1e6,
+                                                   self.compressed_bytes / 1e6, saved / 1e6, ratio, throughput, skipped)
+
+
+def make_compressor(codec=None, level=None, block_size=DEFAULT_BLOCK_SIZE, app_dir=None):
+    """Return a StreamCompressor for the files of 'app_dir', or None if codec is None or 'none'"""
+    if codec is None or codec == 'none':
+        return None
+    return StreamCompressor(codec, level=level, block_size=block_size, app_dir=app_dir)
@@ -4,8 +4,14 @@ import sys
 import os.path
 import subprocess
 import prismspf_mcapi
+from prismspf_mcapi.lookup import get_sample_by_id, get_processes_by_template
+from prismspf_mcapi.process_builder import ProcessBuilder
 from materials_commons.cli import ListObjects
-from materials_commons.cli.functions import make_local_project, make_local_expt
+from prismspf_mcapi.backend import make_project_and_experiment
+from prismspf_mcapi.main import subcommand_desc
+from prismspf_mcapi.profiling import profile_backend_calls, attribute_backend_calls
+from prismspf_mcapi import metadata_cache
+from materials_commons.cli.functions import _trunc_name, _format_mtime
 
 
 def get_environment_sample(expt, sample_id=None, out=sys.stdout):
@@ -28,7 +34,7 @@ def get_environment_sample(expt, sample_id=None, out=sys.stdout):
 
     """
     if sample_id is None:
-        candidate_environment = [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates['environment']]
+        candidate_environment = get_processes_by_template(expt, prismspf_mcapi.templates['environment'])
         if len(candidate_environment) == 0:
             out.write('Did not find a Computing Environment sample.\n')
             out.write('Use \'mc prismspf environment --create\' to create a Software sample, or --environment-id <id> to specify explicitly.\n')
@@ -45,26 +51,13 @@ def get_environment_sample(expt, sample_id=None, out=sys.stdout):
         environment_proc.decorate_with_output_samples()
         return environment_proc.output_samples[0]
     else:
-        # print("The sample id is: ")
-        # print(sample_id[0])
-
-        # This is broken, temporarily replaced by a more complicated work-around
-        # environment = expt.get_sample_by_id(sample_id)
-
-        sample_found = False
-        for proc in expt.get_all_processes():
-            for sample in proc.get_all_samples():
-                if sample.id == sample_id[0]:
-                    # print("Sample found with id of: ", sample.id)
-                    environment = sample
-                    sample_found = True
-                    break
-            if sample_found:
-                break
+        # expt.get_sample_by_id(sample_id) is broken, so use the shared sample index instead
+        environment = get_sample_by_id(expt, sample_id[0], out)
 
     return environment
 
 
+@attribute_backend_calls
 def create_environment_sample(expt, args, process_name=None, sample_name=None, verbose=False):
     """
     Create a PRISMS-PF Computing Environment Sample
@@ -89,27 +82,23 @@ def create_environment_sample(expt, args, process_name=None, sample_name=None, v
     template_id = prismspf_mcapi.templates['environment']
 
     print("The template ID is: " + template_id)
-    ## Process that will create samples
-    proc = expt.create_process_from_template(template_id)
-
     if process_name is None:
-        proc.rename('Set Computing Environment')
-    else:
-        proc.rename(process_name)
-
-    ## Create sample
+        process_name = 'Set Computing Environment'
     if sample_name is None:
         sample_name = "Computing Environment"
-    new_sample = proc.create_samples([sample_name])
 
-    proc = expt.get_process_by_id(proc.id)
+    ## Process that will create samples, committed at the end in as few requests as possible
+    builder = ProcessBuilder(expt, template_id, process_name)
+    builder.add_output_sample(sample_name)
+
+    measurements = builder.measurements
 
     # Add the appropriate attributes
 
     # Add the number of cores
     if int(args.num_cores[0]) > 0:
         # proc.add_integer_measurement('Number of simulation cores', int(args.num_cores[0]))
-        proc.add_string_measurement('Number of simulation cores', args.num_cores[0])
+        measurements.add_string('Number of simulation cores', args.num_cores[0])
     else:
         raise ValueError("The number of simulation cores must be explicitly given and must be > 0.")
 
@@ -120,32 +109,31 @@ def create_environment_sample(expt, args, process_name=None, sample_name=None, v
         print('Did not find the computer name. The computer name is being uploaded as \'unknown\'.\n')
         machine_name = 'unknown'
 
-    proc.add_string_measurement('Computer name', machine_name.decode('ascii'))
+    measurements.add_string('Computer name', machine_name.decode('ascii'))
 
-    # new_sample[0].pretty_print(shift=0, indent=2, out=sys.stdout)
-
-    return expt.get_process_by_id(proc.id)
+    return builder.commit()
 
 
 class EnvironmentSubcommand(ListObjects):
-    desc = "(sample) PRISMS-PF Software"
+    desc = subcommand_desc('environment')
 
     def __init__(self):
-        super(EnvironmentSubcommand, self).__init__(["prismspf", "software"], "Environment", "Environments",
+        super(EnvironmentSubcommand, self).__init__(["prismspf", "environment"], "Environment", "Environments",
             desc="Creates an entity (sample) representing the computing enviroment used for a phase field calculation.",
             expt_member=True,
             list_columns=['name', 'owner', 'template_name', 'id', 'mtime'],
             creatable=True)
 
     def get_all_from_experiment(self, expt):
-        return [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(expt, prismspf_mcapi.templates[self.cmdname[-1]])
 
     def get_all_from_project(self, proj):
-        return [proc for proc in proj.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(proj, prismspf_mcapi.templates[self.cmdname[-1]])
 
+    @profile_backend_calls
     def create(self, args, out=sys.stdout):
-        proj = make_local_project()
-        expt = make_local_expt(proj)
+        metadata_cache.configure(args.refresh)
+        proj, expt = make_project_and_experiment()
 
         if args.proc_name is None:
             proc_name = None
@@ -171,6 +159,11 @@ class EnvironmentSubcommand(ListObjects):
         process_name_help = "Set the name of the process"
         parser.add_argument('--proc-name', nargs='*', default=None, help=process_name_help)
 
+        profile_help = "Write a Chrome trace of every backend call to this file and print a per-operation latency summary"
+        parser.add_argument('--profile', default=None, help=profile_help)
+
+        metadata_cache.add_refresh_option(parser)
+
         return
 
     def list_data(self, obj):
@@ -4,17 +4,16 @@ import sys
 import os.path
 import subprocess
 import prismspf_mcapi
-from prismspf_mcapi.equations_dot_h_parser import parse_equations_file
+from prismspf_mcapi.lookup import get_sample_by_id, get_processes_by_template
+from prismspf_mcapi.equations_dot_h_parser import parse_equations_file, EquationInformation
+from prismspf_mcapi.process_builder import ProcessBuilder, commit_all
+from prismspf_mcapi.file_registry import get_file_registry
 from materials_commons.cli import ListObjects
-from materials_commons.cli.functions import make_local_project, make_local_expt
-
-
-class EquationInformation:
-    def __init__(self, _index):
-        index = _index
-        name = 'var'
-        type = 'SCALAR'
-        eq_type = 'PARABOLIC'
+from prismspf_mcapi.backend import make_project_and_experiment
+from prismspf_mcapi.main import subcommand_desc
+from prismspf_mcapi.profiling import profile_backend_calls, attribute_backend_calls
+from prismspf_mcapi import metadata_cache
+from materials_commons.cli.functions import _trunc_name, _format_mtime
 
 
 def get_equations_sample(expt, sample_id=None, out=sys.stdout):
@@ -37,7 +36,7 @@ def get_equations_sample(expt, sample_id=None, out=sys.stdout):
 
     """
     if sample_id is None:
-        candidate_equations = [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates['environment']]
+        candidate_equations = get_processes_by_template(expt, prismspf_mcapi.templates['equations'])
         if len(candidate_equations) == 0:
             out.write('Did not find a Equations sample.\n')
             out.write('Use \'mc prismspf equations --create\' to create a Equations sample, or --environment-id <id> to specify explicitly.\n')
@@ -54,27 +53,15 @@ def get_equations_sample(expt, sample_id=None, out=sys.stdout):
         equations_proc.decorate_with_output_samples()
         return equations_proc.output_samples[0]
     else:
-        # print("The sample id is: ")
-        # print(sample_id[0])
-
-        # This is broken, temporarily replaced by a more complicated work-around
-        # environment = expt.get_sample_by_id(sample_id)
-
-        sample_found = False
-        for proc in expt.get_all_processes():
-            for sample in proc.get_all_samples():
-                if sample.id == sample_id[0]:
-                    # print("Sample found with id of: ", sample.id)
-                    equations = sample
-                    sample_found = True
-                    break
-            if sample_found:
-                break
+        # expt.get_sample_by_id(sample_id) is broken, so use the shared sample index instead
+        equations = get_sample_by_id(expt, sample_id[0], out)
 
     return equations
 
 
-def create_equations_sample(expt, args, process_name=None, sample_name=None, verbose=False):
+@attribute_backend_calls
+def create_equations_sample(expt, args, process_name=None, sample_name=None, verbose=False, app_dir=None,
+                            journal=None):
     """
     Create a PRISMS-PF Equations Sample
 
@@ -90,6 +77,13 @@ def create_equations_sample(expt, args, process_name=None, sample_name=None, ver
         verbose: bool
           Print messages about uploads, etc.
 
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory equations.cc is read from
+
+        journal: prismspf_mcapi.journal.RegistrationJournal, optional (default=None)
+          If given, each process is recorded as it is created, and processes
+          the journal already records are not created again
+
     Returns:
 
         proc: mcapi.Process instance
@@ -102,58 +96,51 @@ def create_equations_sample(expt, args, process_name=None, sample_name=None, ver
     # This function is different than the others, it will create one process and one sample for each variable/governing equation
 
     # First, parse the equations file
-    file_name = "equations.cc"
+    file_name = os.path.join(app_dir or '', 'equations.cc')
     equation_information_list = parse_equations_file(file_name)
 
-    # Second, create a sample for each variable/equation
-    new_sample_list = []
-    proc_list = []
-    for equation_information in equation_information_list:
-        # Process that will create samples
-        proc = expt.create_process_from_template(template_id)
+    # The same file is attached to every variable/equation, so it is uploaded once
+    file_registry = get_file_registry(expt.project)
+    equations_file = file_registry.add_file_by_local_path(file_name, verbose=verbose)
 
+    # Second, create a sample for each variable/equation. The processes are independent, so they are committed concurrently.
+    if sample_name is None:
+        sample_name = "Equations:"
+    builders = []
+    for equation_information in equation_information_list:
         if process_name is None:
-            proc.rename('Set Equations:' + ' ' + equation_information.name)
+            builder = ProcessBuilder(expt, template_id, 'Set Equations:' + ' ' + equation_information.name)
         else:
-            proc.rename(process_name + ': ' + equation_information.name)
+            builder = ProcessBuilder(expt, template_id, process_name + ': ' + equation_information.name)
+        builder.add_output_sample(sample_name + ': ' + equation_information.name)
 
-        if sample_name is None:
-            sample_name = "Equations:"
-        new_sample_list.append(proc.create_samples([sample_name + ': ' + equation_information.name]))
+        builder.measurements.add_string('Variable Name', equation_information.name)
+        builder.measurements.add_string('Variable Index', equation_information.index)
+        builder.measurements.add_string('Variable Type', equation_information.type)
+        builder.measurements.add_string('Variable Equation Type', equation_information.equation_type)
 
-        proc.add_string_measurement('Variable Name', equation_information.name)
-        proc.add_string_measurement('Variable Index', equation_information.index)
-        proc.add_string_measurement('Variable Type', equation_information.type)
-        proc.add_string_measurement('Variable Equation Type', equation_information.equation_type)
+        builder.add_file(equations_file)
+        builders.append(builder)
 
-        equations_file = expt.project.add_file_by_local_path(file_name, verbose=verbose)
-        proc.add_files([equations_file])
-
-        for sample in new_sample_list:
-            sample[0].link_files([equations_file])
-
-        proc_list.append(proc)
-
-        # new_sample_list[-1][0].pretty_print(shift=0, indent=2, out=sys.stdout)
-
-    return proc_list
+    return commit_all(builders, journal=journal)
 
 
 class EquationsSubcommand(ListObjects):
-    desc = "(sample) PRISMS-PF Software"
+    desc = subcommand_desc('equations')
 
     def __init__(self):
         super(EquationsSubcommand, self).__init__(["prismspf", "equations"], "Equations", "Equations", desc="Creates a set of entities (samples) representing the variables and governing equations for a phase field calculation.", expt_member=True, list_columns=['name', 'owner', 'template_name', 'id', 'mtime'], creatable=True)
 
     def get_all_from_experiment(self, expt):
-        return [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(expt, prismspf_mcapi.templates[self.cmdname[-1]])
 
     def get_all_from_project(self, proj):
-        return [proc for proc in proj.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(proj, prismspf_mcapi.templates[self.cmdname[-1]])
 
+    @profile_backend_calls
     def create(self, args, out=sys.stdout):
-        proj = make_local_project()
-        expt = make_local_expt(proj)
+        metadata_cache.configure(args.refresh)
+        proj, expt = make_project_and_experiment()
 
         if args.proc_name is None:
             proc_name = None
@@ -177,6 +164,11 @@ class EquationsSubcommand(ListObjects):
         process_name_help = "Set the name of the process"
         parser.add_argument('--proc-name', nargs='*', default=None, help=process_name_help)
 
+        profile_help = "Write a Chrome trace of every backend call to this file and print a per-operation latency summary"
+        parser.add_argument('--profile', default=None, help=profile_help)
+
+        metadata_cache.add_refresh_option(parser)
+
     def list_data(self, obj):
         return {
             'name': _trunc_name(obj),
@@ -1,137 +1,110 @@
-#import subprocess
-#import shutil
-#import glob
-#import math
-#import os
-#import datetime
-#import time
-#import sys
-
-import prismspf_mcapi
-#from prismspf_mcapi.equations import EquationInformation
-
-def remove_block_comment(line, in_block_comment):
-    block_comments_fully_stripped = False
-
-    if in_block_comment:
-        if '*/' in line:
-            block_comment_end = line.find('*/') + 1
-            found_block_comment = True
-            in_block_comment = False
-
-            line = line[block_comment_end + 1:]
-        else:
-            line = ''
-            block_comments_fully_stripped = True
-
-    while not block_comments_fully_stripped:
+"""Parser for the variable attributes declared in a PRISMS-PF equations.cc file"""
 
-        remove_comment_results = remove_nonintroductory_block_comment(line, in_block_comment)
-        line = remove_comment_results[0]
-        in_block_comment = remove_comment_results[1]
-        found_block_comment1 = remove_comment_results[2]
+import re
 
-        if not found_block_comment1 or len(line) < 1:
-            block_comments_fully_stripped = True
+# Matches a variable attribute statement, e.g.: set_variable_name (0,"c");
+_attribute_statement = re.compile(r'set_variable_(name|type|equation_type)\s*\(\s*([^,()]*?)\s*,\s*([^)]*?)\s*\)\s*;')
 
-    return line, in_block_comment
+# Attribute statement name -> EquationInformation attribute
+_ATTRIBUTES = {'name': 'name', 'type': 'type', 'equation_type': 'equation_type'}
 
 
-def remove_nonintroductory_block_comment(line, in_block_comment):
+class EquationInformation(object):
+    """
+    Attributes of one variable/governing equation declared in equations.cc
 
-    found_block_comment = False
+    Attributes:
 
-    if '/*' in line:
-        block_comment_start = line.find('/*')
-        found_block_comment = True
+        index: str
+          The variable index, as written in equations.cc
 
-        if '*/' in line:
-            block_comment_end = line.find('*/') + 1
-        else:
-            block_comment_end = len(line)
-            in_block_comment = True
+        name, type, equation_type: str
+          From set_variable_name, set_variable_type and set_variable_equation_type
+    """
 
-        line = line[:block_comment_start] + line[block_comment_end + 1:]
+    def __init__(self, index):
+        self.index = index
+        self.name = 'var'
+        self.type = 'SCALAR'
+        self.equation_type = 'PARABOLIC'
 
-    return line, in_block_comment, found_block_comment
 
+def strip_comments(line, in_block_comment):
+    """
+    Remove '//' and '/* ... */' comments from one line.
 
-def parse_for_attribute_statement(line, attribute_text, equation_information_list):
-    if line[:len(attribute_text)] == attribute_text:
-        contains_attribute_statement = True
-        index_value_block = line[len(attribute_text) + 1:]
+    Arguments:
 
-        index_value_block = index_value_block.strip()
-        index_value_block = index_value_block[1:-2]
-        split_index_value_block = index_value_block.split(',')
-        index = split_index_value_block[0].strip()
-        value = split_index_value_block[1].strip()
+        line: str
 
-        value = value.replace('"', '')
+        in_block_comment: bool
+          Whether the line starts inside a block comment
 
-    else:
-        contains_attribute_statement = False
-        index = -1
-        value = ''
+    Returns:
 
-    if contains_attribute_statement:
-        # Check to see if an EquationInformation object exists for this variable/equation already
-        added_info = False
-        for equation_information in equation_information_list:
-            if equation_information.index == index:
-                if attribute_text == 'set_variable_name':
-                    equation_information.name = value
-                elif attribute_text == 'set_variable_type':
-                    equation_information.type = value
-                elif attribute_text == 'set_variable_equation_type':
-                    equation_information.equation_type = value
-
-                added_info = True
-
-        if not added_info:
-            equation_information = prismspf_mcapi.equations.EquationInformation(index)
-            if attribute_text == 'set_variable_name':
-                equation_information.name = value
-            elif attribute_text == 'set_variable_type':
-                equation_information.type = value
-            elif attribute_text == 'set_variable_equation_type':
-                equation_information.equation_type = value
+        (code, in_block_comment): the line without comments, and whether the
+          next line starts inside a block comment
+    """
+    pieces = []
+    position = 0
+    length = len(line)
+    while position < length:
+        if in_block_comment:
+            end = line.find('*/', position)
+            if end < 0:
+                return ''.join(pieces), True
+            position = end + 2
+            in_block_comment = False
+            continue
 
-            equation_information.index = index
-            equation_information_list.append(equation_information)
+        block_start = line.find('/*', position)
+        line_start = line.find('//', position)
+        if line_start >= 0 and (block_start < 0 or line_start < block_start):
+            pieces.append(line[position:line_start])
+            break
+        if block_start < 0:
+            pieces.append(line[position:])
+            break
+        pieces.append(line[position:block_start])
+        position = block_start + 2
+        in_block_comment = True
 
-    return equation_information_list
+    return ''.join(pieces), in_block_comment
 
 
 def parse_equations_file(file_name):
-    in_block_comment = False
-
-    equation_information_list = []
+    """
+    Read the variable attributes declared in equations.cc.
 
-    f = open(file_name)
-    for line in f:
-        # print('Raw line:', line)
+    The file is read once, line by line, tracking whether each line starts
+    inside a block comment. All set_variable_* statements are matched by one
+    expression and collected by variable index, so the parse is linear in the
+    size of the file.
 
-        # First make sure line isn't a comment or blank line
-        stripped_line = line.strip()
-        if len(stripped_line) < 1 or stripped_line[0:2] == '//':
-            continue
+    Arguments:
 
-        # Strip contents within a block comment
-        block_comment_removal_results = remove_block_comment(line, in_block_comment)
-        line = block_comment_removal_results[0]
-        in_block_comment = block_comment_removal_results[1]
+        file_name: str
+          Path to equations.cc
 
-        line = line.strip()
-        # print('Processed line:', line)
+    Returns:
 
-        if len(line) < 1:
-            continue
+        equation_information_list: list of EquationInformation
+          One per variable index, in the order each index first appears
+    """
+    equations = {}
+    in_block_comment = False
 
-        equation_information_list = parse_for_attribute_statement(line, 'set_variable_name', equation_information_list)
-        equation_information_list = parse_for_attribute_statement(line, 'set_variable_type', equation_information_list)
-        equation_information_list = parse_for_attribute_statement(line, 'set_variable_equation_type', equation_information_list)
+    with open(file_name) as f:
+        for line in f:
+            if in_block_comment or '/' in line:
+                line, in_block_comment = strip_comments(line, in_block_comment)
+            if 'set_variable_' not in line:
+                continue
 
-    # print(equation_information_list[0].name, equation_information_list[0].type, equation_information_list[0].equation_type)
+            for attribute, index, value in _attribute_statement.findall(line):
+                equation_information = equations.get(index)
+                if equation_information is None:
+                    equation_information = equations[index] = EquationInformation(index)
+                setattr(equation_information, _ATTRIBUTES[attribute], value.replace('"', '').strip())
 
-    return equation_information_list
+    return list(equations.values())
@@ -0,0 +1,147 @@
+"""Content-addressed registry of files uploaded during one invocation"""
+
+import os
+import hashlib
+import threading
+from prismspf_mcapi.proxy import copy_backend_object
+
+# Block size used when hashing local files
+HASH_BLOCK_SIZE = 1 << 20
+
+# project id -> FileRegistry
+_registries = {}
+_registries_lock = threading.Lock()
+
+# (absolute path, size, mtime) -> SHA-256 hex digest, shared by every registry
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path, block_size=HASH_BLOCK_SIZE):
+    """Return the SHA-256 hex digest of a local file, read in fixed-size blocks"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def stat_key(path):
+    """Return (absolute path, size, mtime in ns) of a local file, which identifies its current contents"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime_ns)
+
+
+def cached_file_digest(path):
+    """Return the SHA-256 hex digest of a local file, reusing it while size and mtime are unchanged"""
+    key = stat_key(path)
+    with _digests_lock:
+        digest = _digests.get(key)
+    if digest is None:
+        digest = file_digest(key[0])
+        with _digests_lock:
+            _digests[key] = digest
+    return digest
+
+
+def add_file_digests(digests):
+    """
+    Remember digests computed elsewhere, e.g. in a worker process.
+
+    Arguments:
+
+        digests: dict
+          stat_key(path) -> SHA-256 hex digest
+    """
+    with _digests_lock:
+        _digests.update(digests)
+
+
+class FileRegistry(object):
+    """
+    Uploads each local file at most once and links files to samples at most once.
+
+    Files are keyed by absolute path plus SHA-256 of their contents, so a file
+    that changes on disk during the invocation is uploaded again, while repeat
+    references to an unchanged file reuse the already-uploaded file. Each
+    caller gets its own copy of the file object, so attributes it sets (like
+    'direction') do not leak to other processes using the same file.
+
+    Arguments:
+
+        project: mcapi.Project object
+          The project files are uploaded to
+    """
+
+    def __init__(self, project):
+        self.project = project
+        self._files = {}
+        self._linked = set()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def digest(self, path):
+        """Return the content hash of 'path', reusing it while size and mtime are unchanged"""
+        return cached_file_digest(path)
+
+    def key(self, path):
+        return (os.path.abspath(path), self.digest(path))
+
+    def add_file_by_local_path(self, path, verbose=False):
+        """
+        Return the uploaded file object for a local file, uploading it only on first use.
+
+        Arguments:
+
+            path: str
+              Path to the local file, relative to the current working directory
+
+            verbose: bool
+              Print messages about uploads
+
+        Returns:
+
+            file: mcapi.File instance, a copy owned by the caller
+        """
+        key = self.key(path)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent requests for the same file wait for the first upload to finish
+        with key_lock:
+            if key not in self._files:
+                self._files[key] = self.project.add_file_by_local_path(path, verbose=verbose)
+            return copy_backend_object(self._files[key])
+
+    def link_files(self, samples, files):
+        """
+        Link every file to every sample, skipping links already made in this invocation.
+
+        Each sample gets a single 'link_files' request holding all of its new files.
+        """
+        for sample in samples:
+            with self._lock:
+                new_files = [f for f in files if (sample.id, f.id) not in self._linked]
+            if new_files:
+                sample.link_files(new_files)
+                with self._lock:
+                    self._linked.update((sample.id, f.id) for f in new_files)
+
+
+def get_file_registry(project):
+    """
+    Return the shared FileRegistry for a project, creating it if necessary.
+
+    Arguments:
+
+        project: mcapi.Project object
+
+    Returns:
+
+        registry: FileRegistry instance
+    """
+    with _registries_lock:
+        if project.id not in _registries:
+            _registries[project.id] = FileRegistry(project)
+        return _registries[project.id]
@@ -0,0 +1,279 @@
+"""Keep-alive HTTP connections shared by every request of one invocation"""
+
+import os
+import sys
+import time
+import threading
+from urllib.parse import urlsplit
+from http.client import HTTPConnection, HTTPSConnection
+from prismspf_mcapi.retry import next_request_key
+
+# Environment variable with the maximum number of open connections per host
+POOL_SIZE_ENV_VAR = 'PRISMSPF_MCAPI_POOL_SIZE'
+
+# Default maximum number of open connections per host
+DEFAULT_POOL_SIZE = 10
+
+# (scheme, netloc) -> ConnectionPool
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Pool size set with configure(), or None to use the environment variable or default
+_pool_size = None
+
+# The requests.Session shared by the Materials Commons API, once installed, and its pool size
+_session = None
+_session_pool_size = None
+
+# host -> [requests, connections opened] of the shared Session
+_session_counts = {}
+
+
+def configure(pool_size=None):
+    """Set the maximum number of open connections per host for pools created from now on"""
+    global _pool_size
+    _pool_size = None if pool_size is None else max(1, int(pool_size))
+
+
+def pool_size():
+    """Return the configured maximum number of open connections per host"""
+    if _pool_size is not None:
+        return _pool_size
+    return max(1, int(os.environ.get(POOL_SIZE_ENV_VAR, DEFAULT_POOL_SIZE)))
+
+
+class ConnectionPool(object):
+    """
+    A bounded set of keep-alive connections to one host, shared by all threads.
+
+    A request takes an idle connection if there is one, opens a new one if
+    fewer than 'max_size' are open, and otherwise waits for one to be
+    returned. A connection that fails is closed and not reused.
+
+    Arguments:
+
+        scheme: str
+          'http' or 'https'
+
+        netloc: str
+          'host:port'
+
+        max_size: int, optional (default=pool_size())
+          Maximum number of open connections
+
+        timeout: float, optional (default=60)
+          Socket timeout in seconds
+
+        keep_alive: bool, optional (default=True)
+          If False, every connection is closed after one request (for comparison)
+
+    Attributes:
+
+        requests, connections_opened, wait_seconds: request count, connections
+          opened, and total time requests waited for a connection
+    """
+
+    def __init__(self, scheme, netloc, max_size=None, timeout=60, keep_alive=True):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.max_size = pool_size() if max_size is None else max(1, int(max_size))
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._idle = []
+        self._open = 0
+        self._condition = threading.Condition()
+        self.requests = 0
+        self.connections_opened = 0
+        self.wait_seconds = 0.0
+
+    def _acquire(self):
+        start = time.perf_counter()
+        with self._condition:
+            while not self._idle and self._open >= self.max_size:
+                self._condition.wait()
+            self.requests += 1
+            self.wait_seconds += time.perf_counter() - start
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+            self.connections_opened += 1
+        conn_type = HTTPSConnection if self.scheme == 'https' else HTTPConnection
+        return conn_type(self.netloc, timeout=self.timeout)
+
+    def _release(self, conn, reusable):
+        if not (reusable and self.keep_alive):
+            conn.close()
+        with self._condition:
+            if reusable and self.keep_alive:
+                self._idle.append(conn)
+            else:
+                self._open -= 1
+            self._condition.notify()
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Send one request on a pooled connection.
+
+        Returns:
+
+            (response, data): http.client.HTTPResponse and its body, already read
+        """
+        conn = self._acquire()
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            data = response.read()
+        except Exception:
+            self._release(conn, False)
+            raise
+        self._release(conn, not response.will_close)
+        return response, data
+
+    @property
+    def reused(self):
+        return self.requests - self.connections_opened
+
+    def stats(self):
+        return {'host': self.netloc, 'requests': self.requests, 'connections_opened': self.connections_opened,
+                'reused': self.reused, 'max_size': self.max_size, 'wait_seconds': self.wait_seconds}
+
+    def close(self):
+        with self._condition:
+            for conn in self._idle:
+                conn.close()
+            self._open -= len(self._idle)
+            self._idle = []
+
+
+def get_connection_pool(url):
+    """
+    Return the shared ConnectionPool for the host of 'url', creating it if necessary.
+
+    Arguments:
+
+        url: str
+
+    Returns:
+
+        pool: ConnectionPool instance
+    """
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(parts.scheme, parts.netloc)
+        return _pools[key]
+
+
+def _with_idempotency_key(kwargs):
+    key = next_request_key()
+    if key is not None:
+        kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'Idempotency-Key': key})
+    return kwargs
+
+
+def _session_request(method, url, **kwargs):
+    """
+    Stands in for requests.request, which requests.get, requests.post, etc.
+    call, sending the request through the shared Session. Requests made by a
+    backend write carry its idempotency key (see prismspf_mcapi.retry).
+    """
+    return _session.request(method, url, **_with_idempotency_key(kwargs))
+
+
+def _count_session(host, port, default_port, index):
+    if port is not None and port != default_port:
+        host = '{}:{}'.format(host, port)
+    with _pools_lock:
+        counts = _session_counts.setdefault(host, [0, 0])
+        counts[index] += 1
+
+
+def _counting_pool_class(base):
+    """
+    Return a subclass of a urllib3 connection pool class that counts, per
+    host, the requests that take a connection from it and the connections
+    that are opened, in _session_counts.
+    """
+    from urllib3.connectionpool import port_by_scheme
+
+    class CountingConnection(base.ConnectionCls):
+        def connect(self):
+            _count_session(self.host, self.port, self.default_port, 1)
+            return super(CountingConnection, self).connect()
+
+    class CountingPool(base):
+        ConnectionCls = CountingConnection
+
+        def _get_conn(self, *args, **kwargs):
+            _count_session(self.host, self.port, port_by_scheme.get(self.scheme), 0)
+            return super(CountingPool, self)._get_conn(*args, **kwargs)
+
+    return CountingPool
+
+
+def share_api_session():
+    """
+    Send every Materials Commons API request of this invocation through one keep-alive requests.Session.
+
+    The Materials Commons API calls module-level requests.get, requests.post,
+    etc., which open a new connection (and TLS handshake) per call. These all
+    go through requests.request, which is replaced, so requests are sent
+    through a Session whose pools keep up to pool_size() connections per
+    host open, whenever the API modules are imported. The Session's pools
+    count requests and opened connections for connection_stats(). Safe to
+    call more than once.
+
+    Returns:
+
+        session: requests.Session instance, or None if 'requests' is not installed
+    """
+    global _session, _session_pool_size
+    try:
+        import requests
+        import requests.api
+        from requests.adapters import HTTPAdapter
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    except ImportError:
+        return None
+
+    with _pools_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session_pool_size = pool_size()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_session_pool_size, pool_block=True)
+            adapter.poolmanager.pool_classes_by_scheme = {
+                'http': _counting_pool_class(HTTPConnectionPool),
+                'https': _counting_pool_class(HTTPSConnectionPool)}
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            requests.api.request = _session_request
+            requests.request = _session_request
+    return _session
+
+
+def connection_stats():
+    """
+    Return request and connection counts of every shared pool.
+
+    Returns:
+
+        stats: list of dict
+          'host', 'requests', 'connections_opened', 'reused' and 'max_size',
+          and for upload pools 'wait_seconds'
+    """
+    with _pools_lock:
+        stats = [pool.stats() for pool in _pools.values()]
+        for host, (n_requests, n_opened) in sorted(_session_counts.items()):
+            stats.append({'host': host, 'requests': n_requests, 'connections_opened': n_opened,
+                          'reused': max(0, n_requests - n_opened), 'max_size': _session_pool_size})
+    return stats
+
+
+def report_connection_stats(out=sys.stdout):
+    """Write one line of request and connection reuse counts per host, if any requests were made"""
+    for s in connection_stats():
+        if s['requests']:
+            out.write('{}: {} request(s) over {} connection(s), {} reused ({:.0f}%), pool size {}\n'.format(
+                s['host'], s['requests'], s['connections_opened'], s['reused'],
+                100.0 * s['reused'] / s['requests'], s['max_size']))
@@ -0,0 +1,456 @@
+"""mc prismspf ingest subcommand: register a parameter sweep of PRISMS-PF runs"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from prismspf_mcapi.simulation import create_input_samples, create_simulation_sample, make_registration_journal, add_registration_options, list_app_files
+from prismspf_mcapi.backend import make_project_and_experiment, ConnectionLimiter
+from prismspf_mcapi.pipeline import thread_output, PipelineError
+from prismspf_mcapi.main import subcommand_desc
+from prismspf_mcapi.profiling import profile_backend_calls, attribute_backend_calls
+from prismspf_mcapi import metadata_cache
+from prismspf_mcapi.file_registry import stat_key, cached_file_digest, add_file_digests
+from prismspf_mcapi.prismspf_parameter_parser import load_parameters_file, add_parameters_document
+from prismspf_mcapi.vtu import scan_vtu_files, add_vtu_headers
+from prismspf_mcapi import vtu_stats
+from prismspf_mcapi import http_pool
+from prismspf_mcapi import worker_pool
+from prismspf_mcapi import retry
+
+# Maximum number of backend calls in flight at the same time, over all runs
+DEFAULT_MAX_CONNECTIONS = 8
+
+# Number of attempts made to register a run after the first one fails
+DEFAULT_RETRIES = 2
+
+# Seconds before the first retry of a run, doubled for each further retry
+DEFAULT_RETRY_DELAY = 2.0
+
+# Files every run directory must contain
+REQUIRED_FILES = ['parameters.in', 'equations.cc']
+
+
+def find_run_dirs(patterns):
+    """
+    Expand glob patterns to run directories, in order and without duplicates.
+
+    Arguments:
+
+        patterns: list of str
+          Directories or glob patterns, e.g. 'sweep/run_*'
+
+    Returns:
+
+        run_dirs: list of str
+          Matching directories
+    """
+    run_dirs = []
+    seen = set()
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            key = os.path.abspath(path)
+            if key not in seen and os.path.isdir(path):
+                seen.add(key)
+                run_dirs.append(path)
+    return run_dirs
+
+
+class RunPreparation(object):
+    """
+    The result of reading one run directory in a worker process.
+
+    Attributes:
+
+        app_dir: str
+
+        parameters: (ParametersDocument, mtime_ns, size), or None
+
+        digests: dict
+          prismspf_mcapi.file_registry.stat_key(path) -> SHA-256 of the files that will be uploaded
+
+        headers: dict
+          stat_key(path) -> prismspf_mcapi.vtu.VTUHeader of the result files, with --scan-results
+
+        n_result_files: int
+
+        seconds: float
+          Time spent preparing the run
+
+        error: str or None
+          Why the run cannot be registered
+    """
+
+    def __init__(self, app_dir):
+        self.app_dir = app_dir
+        self.parameters = None
+        self.digests = {}
+        self.headers = {}
+        self.n_result_files = 0
+        self.seconds = 0.0
+        self.error = None
+
+
+def prepare_run(app_dir, bundle=False, scan_results=False):
+    """
+    Parse and hash the local files of one run, so registering it needs no local work.
+
+    Runs in a worker process. The parameters document, file digests and
+    result file headers are sent back and added to the caches of the main
+    process with seed_caches.
+
+    Arguments:
+
+        app_dir: str
+          The run directory
+
+        bundle: bool
+          Result files will be bundled per time step, so hashing them here is pointless
+
+        scan_results: bool
+          Scan the headers of the result files (see prismspf_mcapi.vtu)
+
+    Returns:
+
+        preparation: RunPreparation
+    """
+    start = time.perf_counter()
+    preparation = RunPreparation(app_dir)
+    missing = [name for name in REQUIRED_FILES if not os.path.isfile(os.path.join(app_dir, name))]
+    if missing:
+        preparation.error = 'missing ' + ', '.join(missing)
+        return preparation
+
+    try:
+        parameters_path = os.path.join(app_dir, 'parameters.in')
+        key = stat_key(parameters_path)
+        document = load_parameters_file(parameters_path)
+        preparation.parameters = (document, key[2], key[1])
+        if document.get('Output separate files per process', 'false').strip().lower() == 'true':
+            bundle = True
+
+        result_paths = [os.path.join(app_dir, name) for name in list_app_files('*vtu', app_dir)]
+        preparation.n_result_files = len(result_paths)
+        upload_paths = [os.path.join(app_dir, name) for name in REQUIRED_FILES]
+        if not bundle:
+            upload_paths += result_paths
+        preparation.digests = {stat_key(path): cached_file_digest(path) for path in upload_paths}
+
+        if scan_results:
+            headers = scan_vtu_files(result_paths, processes=1)
+            preparation.headers = {stat_key(path): header for path, header in zip(result_paths, headers)}
+    except Exception as err:
+        preparation.error = repr(err)
+
+    preparation.seconds = time.perf_counter() - start
+    return preparation
+
+
+def seed_caches(preparation):
+    """Add what a worker process read from a run directory to the caches of this process"""
+    if preparation.parameters is not None:
+        add_parameters_document(*preparation.parameters)
+    add_file_digests(preparation.digests)
+    add_vtu_headers(preparation.headers)
+
+
+class RunResult(object):
+    """
+    Outcome and timings of registering one run.
+
+    Attributes:
+
+        app_dir: str
+
+        status: str
+          'ok', 'failed' or 'skipped' (the run directory could not be prepared)
+
+        attempts: int
+
+        prepare_seconds, register_seconds: float
+          Time spent reading the run directory, and registering it (all attempts)
+
+        processes: int
+          Number of processes created by the successful attempt
+
+        simulation_id: str or None
+
+        error: str or None
+          The last error
+
+        log: str
+          Output of the last attempt
+    """
+
+    def __init__(self, app_dir):
+        self.app_dir = app_dir
+        self.status = 'failed'
+        self.attempts = 0
+        self.prepare_seconds = 0.0
+        self.register_seconds = 0.0
+        self.processes = 0
+        self.simulation_id = None
+        self.error = None
+        self.log = ''
+
+    def to_dict(self):
+        return {
+            'app_dir': self.app_dir,
+            'status': self.status,
+            'attempts': self.attempts,
+            'prepare_seconds': self.prepare_seconds,
+            'register_seconds': self.register_seconds,
+            'processes': self.processes,
+            'simulation_id': self.simulation_id,
+            'error': self.error}
+
+
+@attribute_backend_calls
+def register_run(app_dir, args, limiter, result):
+    """
+    Create the input processes and the Simulation process of one run.
+
+    Steps are recorded in the run's RegistrationJournal, so a retry, or a
+    later ingest of the same run, resumes where a failed attempt stopped.
+
+    Arguments:
+
+        app_dir: str
+
+        limiter: prismspf_mcapi.backend.ConnectionLimiter
+          Shared by all runs
+
+        result: RunResult
+          Updated with the number of processes and the simulation id
+
+    Returns:
+
+        proc: mcapi.Process instance
+          The Simulation process
+    """
+    proj, expt = make_project_and_experiment(app_dir=app_dir, limiter=limiter)
+    journal = make_registration_journal(expt, args, app_dir, restart=args.restart and result.attempts == 1)
+    proc_lists = create_input_samples(expt, args, app_dir=app_dir, journal=journal)
+
+    sample_list = []
+    for proc_list in proc_lists:
+        for p in proc_list:
+            print('Created process: ' + p.name + ' ' + p.id)
+            sample_list.extend(p.output_samples)
+
+    proc_name = None if args.proc_name is None else " ".join(args.proc_name)
+    samp_name = None if args.samp_name is None else " ".join(args.samp_name)
+    proc = create_simulation_sample(expt, args, sample_list, proc_name, samp_name, app_dir=app_dir, journal=journal)
+    print('Created process: ' + proc.name + ' ' + proc.id)
+
+    result.processes = sum(len(proc_list) for proc_list in proc_lists) + 1
+    result.simulation_id = proc.id
+    return proc
+
+
+def register_run_with_retries(app_dir, args, limiter, result):
+    """
+    Register one run, retrying the whole run with jittered exponential backoff if it fails.
+
+    A retry resumes from the journal of the failed attempt, so the processes
+    and uploads that attempt completed are reused. The output of the last
+    attempt is kept in result.log.
+    """
+    start = time.perf_counter()
+    retries = max(0, int(args.retries))
+    while True:
+        result.attempts += 1
+        log = StringIO()
+        try:
+            with thread_output(log):
+                register_run(app_dir, args, limiter, result)
+            result.status = 'ok'
+            result.error = None
+            break
+        except Exception as err:
+            if isinstance(err, PipelineError):
+                result.error = '; '.join(name + ': ' + repr(stage_err) for name, stage_err in err.failures)
+            else:
+                result.error = repr(err)
+            if result.attempts > retries:
+                break
+            time.sleep(retry.backoff_delay(result.attempts - 1, float(args.retry_delay)))
+        finally:
+            result.log = log.getvalue()
+    result.register_seconds = time.perf_counter() - start
+    return result
+
+
+def ingest_runs(run_dirs, args, out=sys.stdout):
+    """
+    Register every run directory of a sweep.
+
+    Run directories are parsed and hashed in a process pool. As each one is
+    ready it is registered on the shared worker pool (see
+    prismspf_mcapi.worker_pool), which the stages, processes and uploads of
+    every run also use, so local work overlaps with backend calls. All runs
+    share one ConnectionLimiter, which bounds the backend calls in flight at
+    the same time to --max-connections.
+
+    Arguments:
+
+        run_dirs: list of str
+
+    Returns:
+
+        (results, limiter): list of RunResult, in the order of 'run_dirs', and the shared ConnectionLimiter
+    """
+    limiter = ConnectionLimiter(args.max_connections)
+    results = {app_dir: RunResult(app_dir) for app_dir in run_dirs}
+    bundle = args.bundle_per_timestep
+    run_workers = int(args.run_workers) if args.run_workers is not None else limiter.max_connections
+
+    # Room for every run's own concurrent calls next to the runs themselves
+    worker_pool.configure(max(worker_pool.pool_size(), run_workers + limiter.max_connections))
+
+    def ready_runs(prepared):
+        """Yield each prepared run as soon as it is ready, skipping those that could not be prepared"""
+        for future in as_completed(prepared):
+            preparation = future.result()
+            result = results[preparation.app_dir]
+            result.prepare_seconds = preparation.seconds
+            if preparation.error is not None:
+                result.status = 'skipped'
+                result.error = preparation.error
+                out.write('Skipping ' + preparation.app_dir + ': ' + preparation.error + '\n')
+                continue
+            seed_caches(preparation)
+            yield result
+
+    def register(result):
+        register_run_with_retries(result.app_dir, args, limiter, result)
+        out.write('{} {} ({} attempt(s), {:.2f} s)\n'.format(
+            result.status.upper(), result.app_dir, result.attempts, result.register_seconds))
+        out.flush()
+
+    with ProcessPoolExecutor(max_workers=args.processes) as processes:
+        prepared = [processes.submit(prepare_run, app_dir, bundle, args.scan_results) for app_dir in run_dirs]
+        worker_pool.map_items(register, ready_runs(prepared), max_workers=max(1, run_workers))
+
+    return [results[app_dir] for app_dir in run_dirs], limiter
+
+
+def write_summary(results, limiter, seconds, out=sys.stdout):
+    """Write a table of per-run timings and totals"""
+    width = max([len('run')] + [len(result.app_dir) for result in results])
+    out.write('\n{:{w}} {:>8} {:>8} {:>11} {:>12} {:>9}  {}\n'.format(
+        'run', 'status', 'attempts', 'prepare s', 'register s', 'processes', 'simulation id / error', w=width))
+    for result in results:
+        out.write('{:{w}} {:>8} {:8d} {:11.2f} {:12.2f} {:9d}  {}\n'.format(
+            result.app_dir, result.status, result.attempts, result.prepare_seconds, result.register_seconds,
+            result.processes, result.simulation_id or result.error or '', w=width))
+
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    out.write('\n' + ', '.join(str(n) + ' ' + status for status, n in sorted(counts.items())))
+    out.write(' of {} run(s) in {:.2f} s\n'.format(len(results), seconds))
+    out.write(limiter.report() + '\n')
+    http_pool.report_connection_stats(out)
+
+
+class IngestSubcommand(object):
+    desc = subcommand_desc('ingest')
+
+    def __init__(self):
+        self.cmdname = ["prismspf", "ingest"]
+
+    def __call__(self, argv):
+        parser = argparse.ArgumentParser(
+            description='Register many PRISMS-PF run directories, as with \'mc prismspf simulation --create --full-simulation\' in each of them',
+            prog='mc prismspf ingest')
+        self.add_ingest_options(parser)
+        args = parser.parse_args(argv[3:])
+        self.ingest(args)
+
+    def add_ingest_options(self, parser):
+
+        run_dirs_help = "Run directories, or glob patterns matching them (e.g. 'sweep/run_*')"
+        parser.add_argument('run_dirs', nargs='*', default=[], help=run_dirs_help)
+
+        run_list_help = "Read run directories, one per line, from this file"
+        parser.add_argument('--run-list', default=None, help=run_list_help)
+
+        processes_help = "Number of worker processes parsing and hashing run directories (default: number of CPUs)"
+        parser.add_argument('--processes', type=int, default=None, help=processes_help)
+
+        max_connections_help = "Maximum number of backend calls in flight at the same time, over all runs"
+        parser.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS, help=max_connections_help)
+
+        run_workers_help = "Number of runs registered at the same time (default: --max-connections)"
+        parser.add_argument('--run-workers', type=int, default=None, help=run_workers_help)
+
+        retries_help = "Number of times a run that failed to register is retried"
+        parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help=retries_help)
+
+        retry_delay_help = "Upper bound in seconds of the first random backoff before a run is retried, doubled for each further retry"
+        parser.add_argument('--retry-delay', type=float, default=DEFAULT_RETRY_DELAY, help=retry_delay_help)
+
+        summary_help = "Write the per-run results and timings as JSON to this file"
+        parser.add_argument('--summary', default=None, help=summary_help)
+
+        verbose_help = "Print the output of every run, not only of failed runs"
+        parser.add_argument('--verbose', action='store_true', help=verbose_help)
+
+        add_registration_options(parser)
+
+        sample_name_help = "Set the name of the results sample of each run"
+        parser.add_argument('--samp-name', nargs='*', default=None, help=sample_name_help)
+
+        process_name_help = "Set the name of the simulation process of each run"
+        parser.add_argument('--proc-name', nargs='*', default=None, help=process_name_help)
+
+        profile_help = "Write a Chrome trace of every backend call to this file and print a per-operation latency summary"
+        parser.add_argument('--profile', default=None, help=profile_help)
+
+        metadata_cache.add_refresh_option(parser)
+
+        return
+
+    @profile_backend_calls
+    def ingest(self, args, out=sys.stdout):
+        if args.field_statistics and not vtu_stats.numpy_available():
+            out.write('--field-statistics requires NumPy (pip install numpy)\n')
+            return
+
+        # Every run registered by this invocation shares the same keep-alive connections
+        http_pool.configure(args.pool_size)
+        retry.configure(args.backend_retries, args.backend_retry_delay)
+        metadata_cache.configure(args.refresh)
+
+        patterns = list(args.run_dirs)
+        if args.run_list is not None:
+            with open(args.run_list) as f:
+                patterns += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        run_dirs = find_run_dirs(patterns)
+        if not run_dirs:
+            out.write('No run directories found\n')
+            return
+
+        out.write('Registering ' + str(len(run_dirs)) + ' run(s)...\n')
+        start = time.perf_counter()
+        results, limiter = ingest_runs(run_dirs, args, out)
+        seconds = time.perf_counter() - start
+
+        for result in results:
+            if result.log and (args.verbose or result.status != 'ok'):
+                out.write('\n--- ' + result.app_dir + ' (' + result.status + ')\n' + result.log)
+
+        write_summary(results, limiter, seconds, out)
+
+        if args.summary is not None:
+            with open(args.summary, 'w') as f:
+                json.dump({'seconds': seconds, 'max_connections': limiter.max_connections,
+                           'backend_calls': limiter.calls, 'connection_wait_seconds': limiter.wait_seconds,
+                           'http_connections': http_pool.connection_stats(),
+                           'backend_retries': retry.get_retry_policy().stats(),
+                           'runs': [result.to_dict() for result in results]}, f, indent=2)
@@ -0,0 +1,163 @@
+"""Local journal of a full-simulation registration, so an interrupted one can be resumed"""
+
+import os
+import json
+import threading
+
+# Name of the journal file, stored in the app directory
+JOURNAL_FILE_NAME = '.prismspf_mcapi_journal.json'
+
+# Attributes of samples kept in the journal; the ones a sample has are what
+# is needed to use it again as a process input
+SAMPLE_ATTRIBUTES = ['id', 'name', 'property_set_id']
+
+
+class Record(object):
+    """A process, sample or file restored from the journal, with only the attributes that were recorded"""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+    def __repr__(self):
+        return 'Record(' + ', '.join(key + '=' + repr(value) for key, value in sorted(self.__dict__.items())) + ')'
+
+
+def _sample_record(sample):
+    return {name: getattr(sample, name) for name in SAMPLE_ATTRIBUTES if getattr(sample, name, None) is not None}
+
+
+def _process_record(proc):
+    return {'id': proc.id, 'name': proc.name,
+            'output_samples': [_sample_record(sample) for sample in getattr(proc, 'output_samples', None) or []]}
+
+
+def _restore_process(record):
+    return Record(id=record['id'], name=record['name'],
+                  output_samples=[Record(**sample) for sample in record['output_samples']])
+
+
+class RegistrationJournal(object):
+    """
+    Records each completed step of 'simulation --create --full-simulation'.
+
+    The journal is a JSON file in the app directory with the layout:
+
+        {
+          "fingerprint": "<what is being registered, see below>",
+          "complete": false,
+          "stages": {
+            "<stage name>": [{"id": ..., "name": ..., "output_samples": [{"id": ..., "name": ...}]}]
+          },
+          "processes": {"<process key>": {"id": ..., "name": ..., "output_samples": [...]}},
+          "steps": {"<step name>": <value>},
+          "files": {"<path relative to app dir>": {"id": ..., "name": ..., "compression": ..., "url": ...}}
+        }
+
+    It is written again after every step, so a failed or interrupted
+    registration can be resumed: completed stages are not run again, their
+    processes and samples are used from the journal, processes a stage had
+    already created are not created again (see
+    prismspf_mcapi.process_builder.ProcessBuilder.commit), and uploaded files
+    are not uploaded again. A journal is only resumed if its fingerprint, which
+    covers the experiment, the options and the input files, matches;
+    otherwise, or once the registration is complete, a new one is started.
+
+    Arguments:
+
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory the journal is stored in
+
+        fingerprint: str, optional (default=None)
+          Identifies the registration
+
+        restart: bool, optional (default=False)
+          Ignore an existing journal
+
+    Attributes:
+
+        resumed: bool
+          True if an incomplete journal with the same fingerprint was loaded
+    """
+
+    def __init__(self, app_dir=None, fingerprint=None, restart=False):
+        if app_dir is None:
+            app_dir = os.getcwd()
+        self.app_dir = app_dir
+        self.path = os.path.join(app_dir, JOURNAL_FILE_NAME)
+        self.data = {'fingerprint': fingerprint, 'complete': False, 'stages': {}, 'processes': {}, 'steps': {},
+                     'files': {}}
+        self.resumed = False
+        self._lock = threading.Lock()
+
+        if not restart and os.path.isfile(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('fingerprint') == fingerprint and not data.get('complete'):
+                self.data.update(data)
+                self.resumed = True
+
+    def stage(self, name):
+        """Return the processes a completed stage created (as Records), or None if it did not complete"""
+        with self._lock:
+            records = self.data['stages'].get(name)
+        if records is None:
+            return None
+        return [_restore_process(record) for record in records]
+
+    def record_stage(self, name, procs):
+        """Record that a stage completed, creating the processes 'procs' (with their output_samples)"""
+        with self._lock:
+            self.data['stages'][name] = [_process_record(proc) for proc in procs]
+        self.save()
+
+    def process(self, key):
+        """Return the process recorded for 'key' (as a Record), or None"""
+        with self._lock:
+            record = self.data['processes'].get(key)
+        return None if record is None else _restore_process(record)
+
+    def record_process(self, key, proc):
+        """Record that the process identified by 'key' was created as 'proc' (with its output_samples)"""
+        with self._lock:
+            self.data['processes'][key] = _process_record(proc)
+        self.save()
+
+    def step(self, name, default=None):
+        """Return the value recorded for a completed step, or 'default'"""
+        with self._lock:
+            return self.data['steps'].get(name, default)
+
+    def record_step(self, name, value=True):
+        with self._lock:
+            self.data['steps'][name] = value
+        self.save()
+
+    def files(self):
+        """Return {path: file Record} of the files uploaded so far"""
+        with self._lock:
+            return {path: Record(**record) for path, record in self.data['files'].items()}
+
+    def record_file(self, path, file_obj):
+        """Record that the file at 'path' (relative to the app directory) was uploaded as 'file_obj'"""
+        record = {'id': file_obj.id, 'name': getattr(file_obj, 'name', os.path.basename(path))}
+        for attribute in ('compression', 'url'):
+            value = getattr(file_obj, attribute, None)
+            if value:
+                record[attribute] = value
+        with self._lock:
+            self.data['files'][path] = record
+        self.save()
+
+    def complete(self):
+        """Record that the registration finished; running the command again starts a new one"""
+        with self._lock:
+            self.data['complete'] = True
+        self.save()
+
+    def save(self):
+        """Write the journal, replacing the previous version atomically"""
+        with self._lock:
+            tmp_path = self.path + '.' + str(threading.get_ident()) + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
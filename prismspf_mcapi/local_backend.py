@@ -0,0 +1,431 @@
+"""Local SQLite stand-in for the parts of Materials Commons used by prismspf_mcapi"""
+
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import datetime
+import functools
+import threading
+from prismspf_mcapi.retry import current_idempotency_key
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (id TEXT PRIMARY KEY, name TEXT, path TEXT);
+CREATE TABLE IF NOT EXISTS experiments (id TEXT PRIMARY KEY, project_id TEXT, name TEXT);
+CREATE TABLE IF NOT EXISTS processes (
+    id TEXT PRIMARY KEY, experiment_id TEXT, template_id TEXT, name TEXT, owner TEXT, mtime REAL);
+CREATE TABLE IF NOT EXISTS samples (id TEXT PRIMARY KEY, experiment_id TEXT, name TEXT, owner TEXT, mtime REAL);
+CREATE TABLE IF NOT EXISTS process_samples (process_id TEXT, sample_id TEXT, direction TEXT);
+CREATE TABLE IF NOT EXISTS measurements (
+    process_id TEXT, attribute TEXT, otype TEXT, value TEXT, seq INTEGER PRIMARY KEY AUTOINCREMENT);
+CREATE TABLE IF NOT EXISTS files (id TEXT PRIMARY KEY, project_id TEXT, name TEXT, path TEXT, size INTEGER);
+CREATE TABLE IF NOT EXISTS process_files (process_id TEXT, file_id TEXT, direction TEXT);
+CREATE TABLE IF NOT EXISTS sample_files (sample_id TEXT, file_id TEXT, UNIQUE (sample_id, file_id));
+CREATE INDEX IF NOT EXISTS processes_by_template ON processes (experiment_id, template_id);
+CREATE INDEX IF NOT EXISTS process_samples_by_process ON process_samples (process_id);
+"""
+
+
+def _new_id():
+    return uuid.uuid4().hex
+
+
+def _owner():
+    return os.environ.get('USER', 'local')
+
+
+class TransientBackendError(IOError):
+    """
+    A failure injected by LocalStore(failure_rate=...), which a retry may get past.
+
+    'sent' is False if the failure happened before the change was applied.
+    """
+    transient = True
+
+    def __init__(self, message, sent=False):
+        super(TransientBackendError, self).__init__(message)
+        self.sent = sent
+
+
+def _write(method):
+    """
+    Make a Local* method that changes the database honor the caller's idempotency key.
+
+    A call whose key was already applied returns the first call's result
+    without changing anything. With a failure rate, the store also fails some
+    calls after the change was applied, as if the response was lost.
+    """
+    @functools.wraps(method)
+    def write(self, *args, **kwargs):
+        store = self.store
+        key = current_idempotency_key()
+        if key is not None:
+            with store._lock:
+                applied = key in store.applied_writes
+                result = store.applied_writes.get(key)
+            if applied:
+                store.round_trip(method.__name__)
+                return result
+
+        result = method(self, *args, **kwargs)
+        if key is not None:
+            with store._lock:
+                store.applied_writes[key] = result
+        store.inject_failure(method.__name__ + ' (response lost)', sent=True)
+        return result
+    return write
+
+
+class LocalStore(object):
+    """
+    SQLite database holding projects, experiments, processes, samples, measurements and files.
+
+    Every method of the Local* objects that would be a request to Materials
+    Commons counts as one round trip: it sleeps for 'latency' seconds and is
+    counted in 'calls'. The sleep happens outside the database lock, so
+    concurrent callers overlap their latency like they would over a network.
+
+    Arguments:
+
+        path: str, optional (default=':memory:')
+          SQLite database file, or ':memory:' for a database that lasts as
+          long as the process
+
+        latency: float, optional (default=0.0)
+          Seconds added to every round trip
+
+        failure_rate: float, optional (default=0.0)
+          Fraction of round trips that fail with TransientBackendError, half
+          of them before and half after the change is applied
+    """
+
+    def __init__(self, path=':memory:', latency=0.0, failure_rate=0.0):
+        self.path = path
+        self.latency = float(latency)
+        self.failure_rate = float(failure_rate)
+        self.calls = {}
+        self.failures = 0
+        self.applied_writes = {}
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def round_trip(self, name):
+        """Count one round trip named 'name', wait for the injected latency, and maybe fail"""
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        self.inject_failure(name)
+
+    def inject_failure(self, name, sent=False):
+        """Raise TransientBackendError for half of 'failure_rate' of the calls"""
+        if self.failure_rate <= 0:
+            return
+        with self._lock:
+            fail = self._random.random() < self.failure_rate / 2
+            if fail:
+                self.failures += 1
+        if fail:
+            raise TransientBackendError('Injected failure: ' + name, sent=sent)
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def executemany(self, sql, rows):
+        with self._lock:
+            self._conn.executemany(sql, rows)
+            self._conn.commit()
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def report(self):
+        """Return a one-line summary of the round trips made so far"""
+        total = sum(self.calls.values())
+        details = ', '.join('{}: {}'.format(name, self.calls[name]) for name in sorted(self.calls))
+        return 'Local backend: {} round trip(s), {:.0f} ms latency each, {} injected failure(s) ({})'.format(
+            total, self.latency * 1000, self.failures, details)
+
+    def project(self, path=None, name=None):
+        """Return the project for a local directory, creating it if necessary"""
+        path = os.path.abspath(path or os.getcwd())
+        rows = self.query('SELECT id, name FROM projects WHERE path = ?', (path,))
+        if rows:
+            return LocalProject(self, rows[0][0], rows[0][1], path)
+        project = LocalProject(self, _new_id(), name or os.path.basename(path), path)
+        self.execute('INSERT INTO projects VALUES (?, ?, ?)', (project.id, project.name, path))
+        return project
+
+
+class LocalFile(object):
+    """A file uploaded to a LocalProject"""
+
+    def __init__(self, id, name, path, size, direction=None):
+        self.id = id
+        self.name = name
+        self.path = path
+        self.size = size
+        self.direction = direction
+
+
+class LocalProject(object):
+    """Stand-in for mcapi.Project"""
+
+    def __init__(self, store, id, name, path):
+        self.store = store
+        self.id = id
+        self.name = name
+        self.path = path
+
+    def experiment(self, name='Default Experiment'):
+        """Return the experiment called 'name', creating it if necessary"""
+        rows = self.store.query('SELECT id FROM experiments WHERE project_id = ? AND name = ?', (self.id, name))
+        if rows:
+            return LocalExperiment(self, rows[0][0], name)
+        expt = LocalExperiment(self, _new_id(), name)
+        self.store.execute('INSERT INTO experiments VALUES (?, ?, ?)', (expt.id, self.id, name))
+        return expt
+
+    @_write
+    def add_file_by_local_path(self, path, verbose=False):
+        self.store.round_trip('add_file_by_local_path')
+        f = LocalFile(_new_id(), os.path.basename(path), os.path.relpath(os.path.abspath(path), self.path),
+                      os.path.getsize(path))
+        self.store.execute('INSERT INTO files VALUES (?, ?, ?, ?, ?)', (f.id, self.id, f.name, f.path, f.size))
+        if verbose:
+            print('Uploaded ' + f.path)
+        return f
+
+    def get_all_processes(self):
+        self.store.round_trip('get_all_processes')
+        return _load_processes(self.store, 'experiment_id IN (SELECT id FROM experiments WHERE project_id = ?)', (self.id,))
+
+    def get_processes_by_template(self, template_id, offset=0, limit=None):
+        self.store.round_trip('get_processes_by_template')
+        return _load_processes(self.store,
+                               'experiment_id IN (SELECT id FROM experiments WHERE project_id = ?) AND template_id = ?',
+                               (self.id, template_id), offset, limit)
+
+
+class LocalExperiment(object):
+    """Stand-in for mcapi.Experiment"""
+
+    def __init__(self, project, id, name):
+        self.project = project
+        self.store = project.store
+        self.id = id
+        self.name = name
+
+    @_write
+    def create_process_from_template(self, template_id):
+        self.store.round_trip('create_process_from_template')
+        proc = LocalProcess(self.store, _new_id(), self.id, template_id, None, _owner(), time.time())
+        proc.name = proc.template_name
+        self.store.execute('INSERT INTO processes VALUES (?, ?, ?, ?, ?, ?)',
+                           (proc.id, self.id, template_id, proc.name, proc.owner, proc._mtime))
+        return proc
+
+    @_write
+    def create_process(self, template_id, name=None, sample_names=(), input_samples=(), measurements=(), files=(),
+                       linked_files=()):
+        """Create a process with its samples, inputs, measurements and files in one round trip"""
+        self.store.round_trip('create_process')
+        now = time.time()
+        proc = LocalProcess(self.store, _new_id(), self.id, template_id, None, _owner(), now)
+        proc.name = name if name is not None else proc.template_name
+        samples = [LocalSample(self.store, _new_id(), self.id, sample_name, proc.owner, now, 'out')
+                   for sample_name in sample_names]
+
+        self.store.execute('INSERT INTO processes VALUES (?, ?, ?, ?, ?, ?)',
+                           (proc.id, self.id, template_id, proc.name, proc.owner, now))
+        self.store.executemany('INSERT INTO samples VALUES (?, ?, ?, ?, ?)',
+                               [(s.id, self.id, s.name, s.owner, now) for s in samples])
+        self.store.executemany('INSERT INTO process_samples VALUES (?, ?, ?)',
+                               [(proc.id, s.id, 'out') for s in samples] + [(proc.id, s.id, 'in') for s in input_samples])
+        self.store.executemany('INSERT INTO measurements (process_id, attribute, otype, value) VALUES (?, ?, ?, ?)',
+                               [(proc.id, m['attribute'], m['otype'], json.dumps(m['value'])) for m in measurements])
+        self.store.executemany('INSERT INTO process_files VALUES (?, ?, ?)',
+                               [(proc.id, f.id, getattr(f, 'direction', None)) for f in files])
+        self.store.executemany('INSERT OR IGNORE INTO sample_files VALUES (?, ?)',
+                               [(s.id, f.id) for s in samples for f in linked_files])
+
+        proc.input_samples = list(input_samples)
+        proc.output_samples = samples
+        return proc
+
+    def get_process_by_id(self, process_id):
+        self.store.round_trip('get_process_by_id')
+        processes = _load_processes(self.store, 'id = ?', (process_id,))
+        if not processes:
+            raise KeyError('No process with id: ' + process_id)
+        return processes[0]
+
+    def get_all_processes(self):
+        self.store.round_trip('get_all_processes')
+        return _load_processes(self.store, 'experiment_id = ?', (self.id,))
+
+    def get_processes_by_template(self, template_id, offset=0, limit=None):
+        self.store.round_trip('get_processes_by_template')
+        return _load_processes(self.store, 'experiment_id = ? AND template_id = ?', (self.id, template_id), offset, limit)
+
+    def get_all_samples(self):
+        self.store.round_trip('get_all_samples')
+        return _load_samples(self.store, 'experiment_id = ?', (self.id,))
+
+    def get_sample_by_id(self, sample_id):
+        self.store.round_trip('get_sample_by_id')
+        samples = _load_samples(self.store, 'id = ?', (sample_id,))
+        return samples[0] if samples else None
+
+
+class LocalSample(object):
+    """Stand-in for mcapi.Sample"""
+
+    def __init__(self, store, id, experiment_id, name, owner, mtime, direction=None):
+        self.store = store
+        self.id = id
+        self.experiment_id = experiment_id
+        self.name = name
+        self.owner = owner
+        self._mtime = mtime
+        self.direction = direction
+
+    @property
+    def mtime(self):
+        return datetime.datetime.fromtimestamp(self._mtime)
+
+    @_write
+    def link_files(self, files):
+        self.store.round_trip('link_files')
+        self.store.executemany('INSERT OR IGNORE INTO sample_files VALUES (?, ?)', [(self.id, f.id) for f in files])
+
+    def get_linked_files(self):
+        return [row[0] for row in self.store.query('SELECT file_id FROM sample_files WHERE sample_id = ?', (self.id,))]
+
+
+class LocalProcess(object):
+    """Stand-in for mcapi.Process"""
+
+    def __init__(self, store, id, experiment_id, template_id, name, owner, mtime):
+        self.store = store
+        self.id = id
+        self.experiment_id = experiment_id
+        self.template_id = template_id
+        self.name = name
+        self.owner = owner
+        self._mtime = mtime
+        self.input_samples = []
+        self.output_samples = []
+
+    @property
+    def template_name(self):
+        return self.template_id[len('global_'):] if self.template_id.startswith('global_') else self.template_id
+
+    @property
+    def mtime(self):
+        return datetime.datetime.fromtimestamp(self._mtime)
+
+    @_write
+    def rename(self, name):
+        self.store.round_trip('rename')
+        self.store.execute('UPDATE processes SET name = ?, mtime = ? WHERE id = ?', (name, time.time(), self.id))
+        self.name = name
+        return self
+
+    @_write
+    def create_samples(self, sample_names):
+        self.store.round_trip('create_samples')
+        now = time.time()
+        samples = [LocalSample(self.store, _new_id(), self.experiment_id, name, _owner(), now, 'out')
+                   for name in sample_names]
+        self.store.executemany('INSERT INTO samples VALUES (?, ?, ?, ?, ?)',
+                               [(s.id, self.experiment_id, s.name, s.owner, now) for s in samples])
+        self.store.executemany('INSERT INTO process_samples VALUES (?, ?, ?)', [(self.id, s.id, 'out') for s in samples])
+        self.output_samples.extend(samples)
+        return samples
+
+    @_write
+    def add_input_samples_to_process(self, samples):
+        self.store.round_trip('add_input_samples_to_process')
+        self.store.executemany('INSERT INTO process_samples VALUES (?, ?, ?)', [(self.id, s.id, 'in') for s in samples])
+        self.input_samples.extend(samples)
+        return self
+
+    def decorate_with_output_samples(self):
+        self.store.round_trip('decorate_with_output_samples')
+        self.output_samples = _load_samples(
+            self.store, "id IN (SELECT sample_id FROM process_samples WHERE process_id = ? AND direction = 'out')", (self.id,))
+        return self
+
+    def get_all_samples(self):
+        self.store.round_trip('get_all_samples')
+        return _load_samples(self.store, 'id IN (SELECT sample_id FROM process_samples WHERE process_id = ?)', (self.id,))
+
+    @_write
+    def add_files(self, files):
+        self.store.round_trip('add_files')
+        self.store.executemany('INSERT INTO process_files VALUES (?, ?, ?)',
+                               [(self.id, f.id, getattr(f, 'direction', None)) for f in files])
+        return self
+
+    @_write
+    def add_measurements(self, measurements):
+        """Add a list of {'attribute', 'otype', 'value'} measurements (with 'value_type' for lists) in one round trip"""
+        self.store.round_trip('add_measurements')
+        self.store.executemany('INSERT INTO measurements (process_id, attribute, otype, value) VALUES (?, ?, ?, ?)',
+                               [(self.id, m['attribute'], m['otype'], json.dumps(m['value'])) for m in measurements])
+
+    @_write
+    def _add_measurement(self, otype, attrname, value):
+        self.store.round_trip('add_' + otype + '_measurement')
+        self.store.execute('INSERT INTO measurements (process_id, attribute, otype, value) VALUES (?, ?, ?, ?)',
+                           (self.id, attrname, otype, json.dumps(value)))
+
+    def add_string_measurement(self, attrname, value):
+        self._add_measurement('string', attrname, value)
+
+    def add_integer_measurement(self, attrname, value):
+        self._add_measurement('integer', attrname, value)
+
+    def add_number_measurement(self, attrname, value):
+        self._add_measurement('number', attrname, value)
+
+    def add_boolean_measurement(self, attrname, value):
+        self._add_measurement('boolean', attrname, value)
+
+    def add_list_measurement(self, attrname, value, value_type):
+        """Add a list measurement; 'value_type' is the otype of the elements, as mcapi requires"""
+        if value_type not in ('string', 'integer', 'number', 'boolean'):
+            raise ValueError('Invalid list value type: ' + repr(value_type))
+        self._add_measurement('list', attrname, value)
+
+    def get_measurements(self):
+        """Return the process's measurements as a list of (attribute, otype, value), in the order added"""
+        rows = self.store.query('SELECT attribute, otype, value FROM measurements WHERE process_id = ? ORDER BY seq', (self.id,))
+        return [(attribute, otype, json.loads(value)) for attribute, otype, value in rows]
+
+    def get_files(self):
+        """Return the ids of the files added to the process"""
+        return [row[0] for row in self.store.query('SELECT file_id FROM process_files WHERE process_id = ?', (self.id,))]
+
+
+def _load_processes(store, where, params, offset=0, limit=None):
+    sql = 'SELECT id, experiment_id, template_id, name, owner, mtime FROM processes WHERE ' + where + ' ORDER BY rowid'
+    if limit is not None:
+        sql += ' LIMIT {:d} OFFSET {:d}'.format(int(limit), int(offset))
+    elif offset:
+        sql += ' LIMIT -1 OFFSET {:d}'.format(int(offset))
+    return [LocalProcess(store, *row) for row in store.query(sql, params)]
+
+
+def _load_samples(store, where, params):
+    sql = 'SELECT id, experiment_id, name, owner, mtime FROM samples WHERE ' + where + ' ORDER BY rowid'
+    return [LocalSample(store, *row) for row in store.query(sql, params)]
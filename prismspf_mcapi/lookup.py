@@ -0,0 +1,219 @@
+"""Shared lookup indices for Materials Commons experiments and projects"""
+
+from prismspf_mcapi.metadata_cache import get_metadata_cache
+
+# Number of processes requested per page from backends that filter by template
+DEFAULT_PAGE_SIZE = 500
+
+# experiment id -> SampleIndex, built at most once per invocation
+_sample_indexes = {}
+
+# (container type, container id) -> TemplateIndex, built at most once per invocation
+_template_indexes = {}
+
+
+class SampleIndex(object):
+    """
+    Maps sample id -> mcapi.Sample for every sample in an experiment.
+
+    The index is filled on first use, from the project's metadata cache if it
+    holds the experiment's samples (see prismspf_mcapi.metadata_cache), and
+    otherwise with a single bulk 'get_all_samples' request where the
+    experiment supports it or one scan over the samples of every process. A
+    sample missing from a cached listing may have been created since, so the
+    listing is then invalidated and fetched again, once.
+
+    Arguments:
+
+        expt: mcapi.Experiment object
+    """
+
+    def __init__(self, expt):
+        self.expt = expt
+        self._samples = None
+        self._cache = None
+
+    def _build(self):
+        cache = get_metadata_cache(self.expt)
+        cached = None if cache is None else cache.samples_of(self.expt)
+        if cached is not None:
+            self._samples = {sample.id: sample for sample in cached}
+            self._cache = cache
+            return
+        self._cache = None
+
+        samples = {}
+        if hasattr(self.expt, 'get_all_samples'):
+            for sample in self.expt.get_all_samples():
+                samples[sample.id] = sample
+        else:
+            for proc in get_template_index(self.expt).processes():
+                for sample in proc.get_all_samples():
+                    samples.setdefault(sample.id, sample)
+        self._samples = samples
+        if cache is not None:
+            cache.add_samples_of(self.expt, list(samples.values()))
+
+    def get(self, sample_id):
+        """Return the mcapi.Sample with id 'sample_id', or None if it is not in the experiment"""
+        if self._samples is None:
+            self._build()
+        sample = self._samples.get(sample_id)
+        if sample is None and self._cache is not None:
+            self._cache.invalidate(self.expt)
+            self._build()
+            sample = self._samples.get(sample_id)
+        return sample
+
+    def add(self, samples):
+        """Record newly created samples so they can be found without rebuilding the index"""
+        if self._samples is None:
+            return
+        for sample in samples:
+            self._samples[sample.id] = sample
+
+    def invalidate(self):
+        self._samples = None
+
+
+def get_sample_index(expt):
+    """
+    Return the shared SampleIndex for an experiment, creating it if necessary.
+
+    Arguments:
+
+        expt: mcapi.Experiment object
+
+    Returns:
+
+        index: SampleIndex instance
+    """
+    if expt.id not in _sample_indexes:
+        _sample_indexes[expt.id] = SampleIndex(expt)
+    return _sample_indexes[expt.id]
+
+
+def get_sample_by_id(expt, sample_id, out=None):
+    """
+    Return the sample with the given id from an experiment.
+
+    Arguments:
+
+        expt: mcapi.Experiment object
+
+        sample_id: str
+          Sample id to find
+
+        out: stream, optional (default=None)
+          If given, a message is written to it when the sample is not found
+
+    Returns:
+
+        sample: mcapi.Sample instance, or None if not found
+    """
+    sample = get_sample_index(expt).get(sample_id)
+    if sample is None and out is not None:
+        out.write('Did not find a sample with id: ' + sample_id + '\n')
+    return sample
+
+
+class TemplateIndex(object):
+    """
+    Maps template id -> list of processes for an experiment or project.
+
+    Used for backends that cannot filter processes by template. All processes
+    are fetched once, on first use, and every later listing or lookup in the
+    same invocation is served from the index.
+
+    Arguments:
+
+        container: mcapi.Experiment or mcapi.Project object
+    """
+
+    def __init__(self, container):
+        self.container = container
+        self._processes = None
+        self._by_template = None
+
+    def processes(self):
+        """Return every process in the container"""
+        if self._processes is None:
+            self._processes = list(self.container.get_all_processes())
+        return self._processes
+
+    def get(self, template_id):
+        """Return the processes created from 'template_id'"""
+        if self._by_template is None:
+            by_template = {}
+            for proc in self.processes():
+                by_template.setdefault(proc.template_id, []).append(proc)
+            self._by_template = by_template
+        return self._by_template.get(template_id, [])
+
+    def invalidate(self):
+        self._processes = None
+        self._by_template = None
+
+
+def get_template_index(container):
+    """
+    Return the shared TemplateIndex for an experiment or project, creating it if necessary.
+
+    Arguments:
+
+        container: mcapi.Experiment or mcapi.Project object
+
+    Returns:
+
+        index: TemplateIndex instance
+    """
+    key = (type(container).__name__, container.id)
+    if key not in _template_indexes:
+        _template_indexes[key] = TemplateIndex(container)
+    return _template_indexes[key]
+
+
+def get_processes_by_template(container, template_id, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return the processes in an experiment or project that were created from a template.
+
+    The result is served from the project's metadata cache if it holds it
+    (see prismspf_mcapi.metadata_cache). Otherwise, if the backend supports
+    it, the filter is applied server side with
+    'get_processes_by_template(template_id, offset, limit)', fetched one page
+    at a time, so the cost is proportional to the size of the result, or else
+    the shared TemplateIndex is used. Fetched results are added to the cache.
+
+    Arguments:
+
+        container: mcapi.Experiment or mcapi.Project object
+
+        template_id: str
+
+        page_size: int, optional (default=DEFAULT_PAGE_SIZE)
+          Number of processes per request for backends that filter server side
+
+    Returns:
+
+        processes: list of mcapi.Process, or of prismspf_mcapi.metadata_cache.CachedProcess
+          if the project has a metadata cache
+    """
+    cache = get_metadata_cache(container)
+    if cache is not None:
+        cached = cache.processes_by_template(container, template_id)
+        if cached is not None:
+            return cached
+
+    if hasattr(container, 'get_processes_by_template'):
+        processes = []
+        while True:
+            page = container.get_processes_by_template(template_id, offset=len(processes), limit=page_size)
+            processes.extend(page)
+            if len(page) < page_size:
+                break
+    else:
+        processes = get_template_index(container).get(template_id)
+
+    if cache is not None:
+        return cache.add_processes_by_template(container, template_id, processes)
+    return processes
@@ -1,29 +1,44 @@
 """CASM - Materials Commons CLI"""
 
 import argparse
+import importlib
 import sys
 from io import BytesIO     # for handling byte strings
 from io import StringIO    # for handling unicode strings
-from prismspf_mcapi.numerical_parameters import NumParametersSubcommand
-from prismspf_mcapi.model_parameters import ModParametersSubcommand
-from prismspf_mcapi.software import SoftwareSubcommand
-from prismspf_mcapi.equations import EquationsSubcommand
-from prismspf_mcapi.environment import EnvironmentSubcommand
-from prismspf_mcapi.simulation import SimulationSubcommand
+from prismspf_mcapi import metadata_cache
 
 
 # import prismspf_mcapi.samples
 
+# Subcommands are only imported and constructed when they are dispatched to, because each one
+# pulls in materials_commons.cli. Each subcommand class takes its 'desc' from here (see subcommand_desc).
 prismspf_usage = [
-    {'name':'numerical-parameters', 'desc': NumParametersSubcommand.desc, 'subcommand': NumParametersSubcommand()},
-    {'name':'model-parameters', 'desc': ModParametersSubcommand.desc, 'subcommand': ModParametersSubcommand()},
-    {'name':'software', 'desc': SoftwareSubcommand.desc, 'subcommand': SoftwareSubcommand()},
-    {'name':'equations', 'desc': EquationsSubcommand.desc, 'subcommand': EquationsSubcommand()},
-    {'name':'environment', 'desc': EnvironmentSubcommand.desc, 'subcommand': EnvironmentSubcommand()},
-    {'name':'simulation', 'desc': SimulationSubcommand.desc, 'subcommand': SimulationSubcommand()}
+    {'name':'numerical-parameters', 'desc': "(sample) PRISMS-PF Numerical Parameters", 'module': 'prismspf_mcapi.numerical_parameters', 'class': 'NumParametersSubcommand'},
+    {'name':'model-parameters', 'desc': "(sample) PRISMS-PF Model Parameters", 'module': 'prismspf_mcapi.model_parameters', 'class': 'ModParametersSubcommand'},
+    {'name':'software', 'desc': "(sample) PRISMS-PF Software", 'module': 'prismspf_mcapi.software', 'class': 'SoftwareSubcommand'},
+    {'name':'equations', 'desc': "(sample) PRISMS-PF Equations", 'module': 'prismspf_mcapi.equations', 'class': 'EquationsSubcommand'},
+    {'name':'environment', 'desc': "(sample) PRISMS-PF Computing Environment", 'module': 'prismspf_mcapi.environment', 'class': 'EnvironmentSubcommand'},
+    {'name':'simulation', 'desc': "(sample) PRISMS-PF Simulation", 'module': 'prismspf_mcapi.simulation', 'class': 'SimulationSubcommand'},
+    {'name':'ingest', 'desc': "Register a sweep of PRISMS-PF runs, one app directory each", 'module': 'prismspf_mcapi.ingest', 'class': 'IngestSubcommand'}
 ]
 
 
+def subcommand_desc(name):
+    """Return the 'desc' of a subcommand in prismspf_usage"""
+    for interface in prismspf_usage:
+        if interface['name'] == name:
+            return interface['desc']
+    raise KeyError(name)
+
+
+def load_subcommand(interface):
+    """Import and construct the subcommand for a prismspf_usage entry, on first use"""
+    if 'subcommand' not in interface:
+        module = importlib.import_module(interface['module'])
+        interface['subcommand'] = getattr(module, interface['class'])()
+    return interface['subcommand']
+
+
 def prismspf_subcommand(argv=sys.argv):
     usage_help = StringIO()
     usage_help.write("mc prismspf <command> [<args>]\n\n")
@@ -47,7 +62,9 @@ def prismspf_subcommand(argv=sys.argv):
     args = parser.parse_args(argv[2:3])
 
     if args.command in interfaces:
-        interfaces[args.command]['subcommand'](argv)
+        # Before the subcommand runs, so that listing its objects also honours --refresh
+        metadata_cache.configure_from_argv(argv)
+        load_subcommand(interfaces[args.command])(argv)
     else:
         print('Unrecognized command')
         parser.print_help()
@@ -0,0 +1,105 @@
+"""Local manifest of the result files uploaded for each Simulation process"""
+
+import os
+import json
+from prismspf_mcapi.file_registry import cached_file_digest
+
+# Name of the manifest file, stored in the app directory
+MANIFEST_FILE_NAME = '.prismspf_mcapi_manifest.json'
+
+
+class UploadManifest(object):
+    """
+    Records path, size, mtime and hash of every file uploaded to a Simulation process.
+
+    The manifest is a JSON file in the app directory with the layout:
+
+        {
+          "last_simulation_process": "<process id>",
+          "processes": {
+            "<process id>": {
+              "files": {
+                "<path relative to app dir>": {"size": ..., "mtime": ..., "sha256": ..., "file_id": ...}
+              }
+            }
+          }
+        }
+
+    Arguments:
+
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory the manifest is stored in
+    """
+
+    def __init__(self, app_dir=None):
+        if app_dir is None:
+            app_dir = os.getcwd()
+        self.app_dir = app_dir
+        self.path = os.path.join(app_dir, MANIFEST_FILE_NAME)
+        self.data = {'last_simulation_process': None, 'processes': {}}
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                self.data.update(json.load(f))
+
+    @property
+    def last_simulation_process(self):
+        return self.data['last_simulation_process']
+
+    def files(self, process_id):
+        """Return the {path: record} dict of files uploaded to a process"""
+        return self.data['processes'].setdefault(process_id, {'files': {}})['files']
+
+    def _key(self, path):
+        return os.path.relpath(os.path.join(self.app_dir, path), self.app_dir)
+
+    def changed_files(self, process_id, paths):
+        """
+        Return the paths that are new or changed since they were uploaded to a process.
+
+        Size and mtime are compared first. The file is only hashed if they
+        differ, so unchanged files are skipped without being read.
+        """
+        records = self.files(process_id)
+        changed = []
+        for path in paths:
+            record = records.get(self._key(path))
+            full_path = os.path.join(self.app_dir, path)
+            if record is None:
+                changed.append(path)
+                continue
+            stat = os.stat(full_path)
+            if stat.st_size == record['size'] and stat.st_mtime == record['mtime']:
+                continue
+            if stat.st_size == record['size'] and cached_file_digest(full_path) == record['sha256']:
+                # Touched but not modified
+                record['mtime'] = stat.st_mtime
+                continue
+            changed.append(path)
+        return changed
+
+    def record(self, process_id, path, file_obj, sha256=None, metadata=None):
+        """
+        Record that 'path' was uploaded to a process as 'file_obj'.
+
+        'metadata' (e.g. the codec and original size of a compressed upload) is
+        stored with the record.
+        """
+        full_path = os.path.join(self.app_dir, path)
+        stat = os.stat(full_path)
+        if sha256 is None:
+            sha256 = cached_file_digest(full_path)
+        self.files(process_id)[self._key(path)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': sha256,
+            'file_id': file_obj.id}
+        if metadata:
+            self.files(process_id)[self._key(path)].update(metadata)
+        self.data['last_simulation_process'] = process_id
+
+    def save(self):
+        """Write the manifest, replacing the previous version atomically"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
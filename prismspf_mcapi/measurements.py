@@ -0,0 +1,112 @@
+"""Batched measurement upload for PRISMS-PF processes"""
+
+from prismspf_mcapi import worker_pool
+
+# Largest number of measurements sent to the backend in a single request
+DEFAULT_CHUNK_SIZE = 100
+
+# Number of concurrent requests used when the backend has no bulk endpoint
+DEFAULT_MAX_WORKERS = 8
+
+
+def list_value_type(value):
+    """Return the otype of the elements of a list measurement: boolean, integer, number or string"""
+    if len(value) == 0:
+        return 'string'
+    if all(isinstance(x, bool) for x in value):
+        return 'boolean'
+    if all(isinstance(x, int) and not isinstance(x, bool) for x in value):
+        return 'integer'
+    if all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in value):
+        return 'number'
+    return 'string'
+
+
+class MeasurementBatch(object):
+    """
+    Collects measurements for a process locally and commits them together.
+
+    If the process provides a bulk 'add_measurements' method, each chunk of
+    measurements is sent in one request. Otherwise the individual
+    'add_<otype>_measurement' calls for a chunk are issued concurrently on a
+    bounded thread pool, so the wall time is set by the chunk count rather than
+    the measurement count.
+
+    Arguments:
+
+        proc: mcapi.Process object
+          The process the measurements are added to
+
+        chunk_size: int, optional (default=DEFAULT_CHUNK_SIZE)
+          Maximum number of measurements committed per request
+
+        max_workers: int, optional (default=DEFAULT_MAX_WORKERS)
+          Maximum number of concurrent requests for backends without a bulk endpoint
+    """
+
+    def __init__(self, proc, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=DEFAULT_MAX_WORKERS):
+        self.proc = proc
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_workers = max(1, int(max_workers))
+        self.measurements = []
+
+    def __len__(self):
+        return len(self.measurements)
+
+    def add(self, attrname, value, otype='string', value_type=None):
+        """
+        Queue a measurement of type 'otype' (string, integer, number, boolean, list).
+
+        For a list, 'value_type' is the otype of its elements, found from the
+        elements if None (see list_value_type).
+        """
+        measurement = {'attribute': attrname, 'otype': otype, 'value': value}
+        if otype == 'list':
+            measurement['value_type'] = list_value_type(value) if value_type is None else value_type
+        self.measurements.append(measurement)
+
+    def add_string(self, attrname, value):
+        self.add(attrname, value, 'string')
+
+    def add_integer(self, attrname, value):
+        self.add(attrname, value, 'integer')
+
+    def add_number(self, attrname, value):
+        self.add(attrname, value, 'number')
+
+    def add_boolean(self, attrname, value):
+        self.add(attrname, value, 'boolean')
+
+    def add_list(self, attrname, value, value_type=None):
+        self.add(attrname, value, 'list', value_type)
+
+    def commit(self):
+        """
+        Send all queued measurements to the backend and clear the batch.
+
+        Returns:
+
+            n: int
+              The number of measurements committed
+        """
+        measurements = self.measurements
+        self.measurements = []
+
+        chunks = [measurements[i:i + self.chunk_size] for i in range(0, len(measurements), self.chunk_size)]
+
+        if hasattr(self.proc, 'add_measurements'):
+            for chunk in chunks:
+                self.proc.add_measurements(chunk)
+        else:
+            for chunk in chunks:
+                # Re-raises the first failed request before moving on to the next chunk
+                worker_pool.map_items(self._add_single, chunk, max_workers=self.max_workers)
+
+        return len(measurements)
+
+    def _add_single(self, measurement):
+        add_measurement = getattr(self.proc, 'add_' + measurement['otype'] + '_measurement')
+        if measurement['otype'] == 'list':
+            return add_measurement(measurement['attribute'], measurement['value'], measurement['value_type'])
+        return add_measurement(measurement['attribute'], measurement['value'])
+
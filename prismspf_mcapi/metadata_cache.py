@@ -0,0 +1,352 @@
+"""On-disk cache of the processes and samples of Materials Commons experiments and projects"""
+
+import os
+import argparse
+import json
+import time
+import datetime
+import threading
+from prismspf_mcapi.retry import WRITE_METHODS
+
+# Name of the cache file, stored in the project's .mc directory
+CACHE_FILE_NAME = 'prismspf_metadata_cache.json'
+
+# Environment variable with the number of seconds cached listings are used without revalidation
+TTL_ENV_VAR = 'PRISMSPF_MCAPI_CACHE_TTL'
+
+# Default number of seconds cached listings are used without revalidation
+DEFAULT_TTL = 300
+
+# Process and sample attributes kept in the cache
+PROCESS_ATTRIBUTES = ['id', 'name', 'owner', 'template_id', 'template_name', 'mtime']
+SAMPLE_ATTRIBUTES = ['id', 'name', 'owner', 'mtime', 'property_set_id']
+
+# Set by configure(): ignore cached entries and fetch everything again
+_refresh = False
+
+# .mc directory -> MetadataCache
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def configure(refresh=None):
+    """Set whether cached entries are ignored (and replaced) for the rest of the invocation; None keeps the current value"""
+    global _refresh
+    if refresh is not None:
+        _refresh = bool(refresh)
+
+
+def add_refresh_option(parser):
+    """Add the --refresh option, shared by every subcommand that reads cached listings"""
+    refresh_help = "Ignore the cached listings of processes and samples in the project's .mc directory and fetch them again"
+    parser.add_argument('--refresh', action='store_true', help=refresh_help)
+
+
+def configure_from_argv(argv):
+    """Apply --refresh from the arguments of a subcommand ('mc prismspf <command> [<args>]'), before it lists or creates anything"""
+    parser = argparse.ArgumentParser(add_help=False)
+    add_refresh_option(parser)
+    args, unknown = parser.parse_known_args(argv[3:])
+    configure(args.refresh)
+
+
+def cache_ttl():
+    """Return the configured TTL in seconds; 0 disables the cache"""
+    return max(0.0, float(os.environ.get(TTL_ENV_VAR, DEFAULT_TTL)))
+
+
+def _to_json(value):
+    if isinstance(value, datetime.datetime):
+        return {'datetime': value.timestamp()}
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, dict) and 'datetime' in value:
+        return datetime.datetime.fromtimestamp(value['datetime'])
+    return value
+
+
+def _record(obj, attributes):
+    record = {}
+    for name in attributes:
+        value = getattr(obj, name, None)
+        if value is not None:
+            record[name] = _to_json(value)
+    return record
+
+
+def _validator(container):
+    """Return the ETag, or else the mtime, of an experiment or project as fetched this invocation, or None"""
+    for name in ('etag', 'mtime'):
+        value = getattr(container, name, None)
+        if value is not None:
+            return _to_json(value)
+    return None
+
+
+def _container_key(container):
+    # Experiments have a 'project'; the type name would be that of a wrapper for backend objects behind a proxy
+    return ('experiment:' if hasattr(container, 'project') else 'project:') + container.id
+
+
+class CachedSample(object):
+    """A sample served from the cache, with the attributes in SAMPLE_ATTRIBUTES that it had"""
+
+    def __init__(self, record):
+        for name, value in record.items():
+            setattr(self, name, _from_json(value))
+
+
+class CachedProcess(object):
+    """
+    A process served from, or added to, the cache.
+
+    Has the attributes in PROCESS_ATTRIBUTES. decorate_with_output_samples()
+    is answered from the cache once the output samples of the process were
+    recorded. Any other attribute is read from the backend process, which is
+    fetched with container.get_process_by_id if the CachedProcess was served
+    from the cache.
+    """
+
+    def __init__(self, cache, container, record, proc=None):
+        self._cache = cache
+        self._container = container
+        self._record = record
+        self._proc = proc
+        for name, value in record.items():
+            if name != 'output_samples':
+                setattr(self, name, _from_json(value))
+
+    def _backend_process(self):
+        if self._proc is None:
+            self._proc = self._container.get_process_by_id(self.id)
+        return self._proc
+
+    def decorate_with_output_samples(self):
+        sample_ids = self._record.get('output_samples')
+        if sample_ids is not None:
+            samples = self._cache.samples(sample_ids)
+            if samples is not None:
+                self.output_samples = samples
+                return self
+
+        proc = self._backend_process()
+        proc.decorate_with_output_samples()
+        self.output_samples = proc.output_samples
+        self._cache.add_output_samples(self.id, proc.output_samples)
+        return self
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._backend_process(), name)
+
+
+class MetadataCache(object):
+    """
+    Processes, samples, and the template and output sample relationships of
+    experiments and projects, kept in a JSON file in a project's .mc directory.
+
+    The file has the layout:
+
+        {
+          "containers": {
+            "<container type>:<id>": {
+              "checked": <time the listings were fetched or revalidated>,
+              "validator": <ETag or mtime of the container at that time>,
+              "templates": {"<template id>": ["<process id>", ...]},
+              "samples": ["<sample id>", ...]
+            }
+          },
+          "processes": {"<process id>": {"id": ..., "name": ..., "template_id": ..., "output_samples": [...]}},
+          "samples": {"<sample id>": {"id": ..., "name": ...}}
+        }
+
+    Listings of a container are used for 'ttl' seconds after they were
+    fetched. After that they are used only if the container's ETag, or else
+    its mtime, is unchanged, and then for another 'ttl' seconds. A container
+    with neither is fetched again. Any write through a backend object with
+    this cache as a hook (see prismspf_mcapi.proxy) clears the cache, as does
+    running a subcommand with --refresh.
+
+    Arguments:
+
+        path: str
+          The cache file
+
+        ttl: float, optional (default=cache_ttl())
+          Seconds listings are used without revalidation
+    """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = cache_ttl() if ttl is None else float(ttl)
+        self._data = None
+        self._cleared = False
+        self._lock = threading.RLock()
+
+    def _empty(self):
+        return {'containers': {}, 'processes': {}, 'samples': {}}
+
+    def _load(self):
+        if self._data is None:
+            self._data = self._empty()
+            if not _refresh and os.path.isfile(self.path):
+                try:
+                    with open(self.path) as f:
+                        self._data.update(json.load(f))
+                except ValueError:
+                    pass
+        return self._data
+
+    def _save(self):
+        tmp_path = self.path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.path)
+        self._cleared = False
+
+    def _fresh_container(self, container):
+        """Return the cached entry of a container if it can be used, revalidating it if its TTL expired"""
+        entry = self._load()['containers'].get(_container_key(container))
+        if entry is None:
+            return None
+        now = time.time()
+        if now - entry['checked'] < self.ttl:
+            return entry
+        validator = _validator(container)
+        if validator is not None and validator == entry.get('validator'):
+            entry['checked'] = now
+            self._save()
+            return entry
+        return None
+
+    def _container_entry(self, container):
+        containers = self._load()['containers']
+        key = _container_key(container)
+        entry = self._fresh_container(container)
+        if entry is None:
+            entry = containers[key] = {'checked': time.time(), 'validator': _validator(container),
+                                       'templates': {}, 'samples': None}
+        return entry
+
+    def samples(self, sample_ids):
+        """Return CachedSamples for 'sample_ids', or None if any of them is not cached"""
+        with self._lock:
+            records = self._load()['samples']
+            if not all(sample_id in records for sample_id in sample_ids):
+                return None
+            return [CachedSample(records[sample_id]) for sample_id in sample_ids]
+
+    def processes_by_template(self, container, template_id):
+        """Return the CachedProcesses of a container created from a template, or None if not cached"""
+        with self._lock:
+            entry = self._fresh_container(container)
+            process_ids = None if entry is None else entry['templates'].get(template_id)
+            if process_ids is None:
+                return None
+            records = self._data['processes']
+            return [CachedProcess(self, container, records[process_id]) for process_id in process_ids]
+
+    def add_processes_by_template(self, container, template_id, processes):
+        """Cache the processes of a container created from a template, and return them as CachedProcesses"""
+        with self._lock:
+            entry = self._container_entry(container)
+            records = self._data['processes']
+            cached = []
+            for proc in processes:
+                record = _record(proc, PROCESS_ATTRIBUTES)
+                if proc.id in records and 'output_samples' in records[proc.id]:
+                    record['output_samples'] = records[proc.id]['output_samples']
+                records[proc.id] = record
+                cached.append(CachedProcess(self, container, record, proc))
+            entry['templates'][template_id] = [proc.id for proc in processes]
+            self._save()
+            return cached
+
+    def add_output_samples(self, process_id, samples):
+        """Record the output samples of a cached process"""
+        with self._lock:
+            data = self._load()
+            for sample in samples:
+                data['samples'][sample.id] = _record(sample, SAMPLE_ATTRIBUTES)
+            if process_id in data['processes']:
+                data['processes'][process_id]['output_samples'] = [sample.id for sample in samples]
+            self._save()
+
+    def samples_of(self, container):
+        """Return the CachedSamples of every sample in a container, or None if not cached"""
+        with self._lock:
+            entry = self._fresh_container(container)
+            sample_ids = None if entry is None else entry['samples']
+            if sample_ids is None:
+                return None
+            records = self._data['samples']
+            return [CachedSample(records[sample_id]) for sample_id in sample_ids]
+
+    def add_samples_of(self, container, samples):
+        """Cache every sample in a container"""
+        with self._lock:
+            entry = self._container_entry(container)
+            records = self._data['samples']
+            for sample in samples:
+                records[sample.id] = _record(sample, SAMPLE_ATTRIBUTES)
+            entry['samples'] = [sample.id for sample in samples]
+            self._save()
+
+    def invalidate(self, container):
+        """Forget the listings of a container, so they are fetched again"""
+        with self._lock:
+            if self._load()['containers'].pop(_container_key(container), None) is not None:
+                self._save()
+
+    def clear(self):
+        """Forget everything, in memory and on disk"""
+        with self._lock:
+            if self._cleared:
+                return
+            self._data = self._empty()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._cleared = True
+
+    def call(self, method, fn, args, kwargs):
+        """Clear the cache after a write (a prismspf_mcapi.proxy.BackendProxy hook)"""
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if method in WRITE_METHODS:
+                self.clear()
+
+
+def _project_path(container):
+    path = getattr(container, 'path', None)
+    if path is None:
+        path = getattr(getattr(container, 'project', None), 'path', None)
+    return path
+
+
+def get_metadata_cache(container):
+    """
+    Return the MetadataCache of the project an experiment or project belongs to.
+
+    Arguments:
+
+        container: mcapi.Experiment or mcapi.Project object
+
+    Returns:
+
+        cache: MetadataCache instance, or None if the project has no local
+          .mc directory or the cache is disabled (a TTL of 0)
+    """
+    project_path = _project_path(container)
+    if not isinstance(project_path, str) or cache_ttl() <= 0:
+        return None
+    mc_dir = os.path.join(project_path, '.mc')
+    if not os.path.isdir(mc_dir):
+        return None
+    with _caches_lock:
+        if mc_dir not in _caches:
+            _caches[mc_dir] = MetadataCache(os.path.join(mc_dir, CACHE_FILE_NAME))
+        return _caches[mc_dir]
@@ -1,10 +1,18 @@
 """mc prismspf model-parameters subcommand"""
 
+import os
 import sys
 import prismspf_mcapi
-from prismspf_mcapi.prismspf_parameter_parser import parse_parameters_file
+from prismspf_mcapi.lookup import get_sample_by_id, get_processes_by_template
+from prismspf_mcapi.prismspf_parameter_parser import load_parameters_file
+from prismspf_mcapi.process_builder import ProcessBuilder
+from prismspf_mcapi.file_registry import get_file_registry
 from materials_commons.cli import ListObjects
-from materials_commons.cli.functions import make_local_project, make_local_expt
+from prismspf_mcapi.backend import make_project_and_experiment
+from prismspf_mcapi.main import subcommand_desc
+from prismspf_mcapi.profiling import profile_backend_calls, attribute_backend_calls
+from prismspf_mcapi import metadata_cache
+from materials_commons.cli.functions import _trunc_name, _format_mtime
 
 
 def get_parameters_sample(expt, sample_id=None, out=sys.stdout):
@@ -27,7 +35,7 @@ def get_parameters_sample(expt, sample_id=None, out=sys.stdout):
 
     """
     if sample_id is None:
-        candidate_parameters = [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates['model_parameters']]
+        candidate_parameters = get_processes_by_template(expt, prismspf_mcapi.templates['model-parameters'])
         if len(candidate_parameters) == 0:
             out.write('Did not find a model Parameters sample.\n')
             out.write('Use \'mc prismspf model-parameters --create\' to create a Model Parameters sample, or --parameters-id <id> to specify explicitly.\n')
@@ -44,27 +52,14 @@ def get_parameters_sample(expt, sample_id=None, out=sys.stdout):
         parameters_proc.decorate_with_output_samples()
         return parameters_proc.output_samples[0]
     else:
-        # print("The sample id is: ")
-        # print(sample_id[0])
-
-        # This is broken, temporarily replaced by a more complicated work-around
-        # parameters = expt.get_sample_by_id(sample_id)
-
-        sample_found = False
-        for proc in expt.get_all_processes():
-            for sample in proc.get_all_samples():
-                if sample.id == sample_id[0]:
-                    # print("Sample found with id of: ", sample.id)
-                    parameters = sample
-                    sample_found = True
-                    break
-            if sample_found:
-                break
+        # expt.get_sample_by_id(sample_id) is broken, so use the shared sample index instead
+        parameters = get_sample_by_id(expt, sample_id[0], out)
 
     return parameters
 
 
-def create_parameters_sample(expt, args, process_name=None, sample_name=None, verbose=False):
+@attribute_backend_calls
+def create_parameters_sample(expt, args, process_name=None, sample_name=None, verbose=False, app_dir=None):
     """
     Create a PRISMS-PF Model Parameters Sample
 
@@ -80,6 +75,9 @@ def create_parameters_sample(expt, args, process_name=None, sample_name=None, ve
         verbose: bool
           Print messages about uploads, etc.
 
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory parameters.in is read from
+
     Returns:
 
         proc: mcapi.Process instance
@@ -88,22 +86,18 @@ def create_parameters_sample(expt, args, process_name=None, sample_name=None, ve
     template_id = prismspf_mcapi.templates['model-parameters']
 
     print("The template ID is: " + template_id)
-    ## Process that will create samples
-    proc = expt.create_process_from_template(template_id)
-
     if process_name is None:
-        proc.rename('Set Model Parameters')
-    else:
-        proc.rename(process_name)
-
-    ## Create sample
+        process_name = 'Set Model Parameters'
     if sample_name is None:
         sample_name = "Model Parameters"
-    new_sample = proc.create_samples([sample_name])
 
-    proc = expt.get_process_by_id(proc.id)
+    ## Process that will create samples, committed at the end in as few requests as possible
+    builder = ProcessBuilder(expt, template_id, process_name)
+    builder.add_output_sample(sample_name)
+
+    parameter_dictionary = load_parameters_file(os.path.join(app_dir or '', 'parameters.in')).parameters
 
-    parameter_dictionary = parse_parameters_file()
+    measurements = builder.measurements
 
     model_constant_prefix = 'Model constant'
 
@@ -130,25 +124,20 @@ def create_parameters_sample(expt, args, process_name=None, sample_name=None, ve
                 proc.add_string_measurement(parameter_description, ', '.join(split_parameter_value_type_set[:-1]))
             '''
             if parameter_type.casefold() in single_parameter_types:
-                proc.add_string_measurement(parameter_description, split_parameter_value_type_set[0])
+                measurements.add_string(parameter_description, split_parameter_value_type_set[0])
             else:
                 # For tensors and elastic constants (currently just a string is uploaded, in the future I'd like to do much more formatting)
-                proc.add_string_measurement(parameter_description, ', '.join(split_parameter_value_type_set[:-1]))
-
-    # new_sample[0].pretty_print(shift=0, indent=2, out=sys.stdout)
-
-    parameters_file = expt.project.add_file_by_local_path('parameters.in', verbose=verbose)  # I need to pass in the path to the PRISMS-PF app folder
-    parameters_file.direction = "in"
-    proc.add_files([parameters_file])
+                measurements.add_string(parameter_description, ', '.join(split_parameter_value_type_set[:-1]))
 
-    for sample in new_sample:
-        sample.link_files([parameters_file])
+    file_registry = get_file_registry(expt.project)
+    parameters_file = file_registry.add_file_by_local_path(os.path.join(app_dir or '', 'parameters.in'), verbose=verbose)
+    builder.add_file(parameters_file, direction="in")
 
-    return expt.get_process_by_id(proc.id)
+    return builder.commit()
 
 
 class ModParametersSubcommand(ListObjects):
-    desc = "(sample) PRISMS-PF Model Parameters"
+    desc = subcommand_desc('model-parameters')
 
     def __init__(self):
         super(ModParametersSubcommand, self).__init__(["prismspf", "model-parameters"], "Model Parameters", "Model Parameters",
@@ -158,14 +147,15 @@ class ModParametersSubcommand(ListObjects):
             creatable=True)
 
     def get_all_from_experiment(self, expt):
-        return [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(expt, prismspf_mcapi.templates[self.cmdname[-1]])
 
     def get_all_from_project(self, proj):
-        return [proc for proc in proj.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(proj, prismspf_mcapi.templates[self.cmdname[-1]])
 
+    @profile_backend_calls
     def create(self, args, out=sys.stdout):
-        proj = make_local_project()
-        expt = make_local_expt(proj)
+        metadata_cache.configure(args.refresh)
+        proj, expt = make_project_and_experiment()
 
         if args.proc_name is None:
             proc_name = None
@@ -188,6 +178,11 @@ class ModParametersSubcommand(ListObjects):
         process_name_help = "Set the name of the process"
         parser.add_argument('--proc-name', nargs='*', default=None, help=process_name_help)
 
+        profile_help = "Write a Chrome trace of every backend call to this file and print a per-operation latency summary"
+        parser.add_argument('--profile', default=None, help=profile_help)
+
+        metadata_cache.add_refresh_option(parser)
+
         return
 
     def list_data(self, obj):
@@ -1,10 +1,85 @@
 """mc prismspf parameters subcommand"""
 
+import os
 import sys
 import prismspf_mcapi
-from prismspf_mcapi.prismspf_parameter_parser import parse_parameters_file
+from prismspf_mcapi.lookup import get_sample_by_id, get_processes_by_template
+from prismspf_mcapi.prismspf_parameter_parser import load_parameters_file
+from prismspf_mcapi.parameter_schema import ParameterSchema
+from prismspf_mcapi.process_builder import ProcessBuilder
+from prismspf_mcapi.file_registry import get_file_registry
 from materials_commons.cli import ListObjects
-from materials_commons.cli.functions import make_local_project, make_local_expt
+from prismspf_mcapi.backend import make_project_and_experiment
+from prismspf_mcapi.main import subcommand_desc
+from prismspf_mcapi.profiling import profile_backend_calls, attribute_backend_calls
+from prismspf_mcapi import metadata_cache
+from materials_commons.cli.functions import _trunc_name, _format_mtime
+
+# The numerical parameters of parameters.in, as "descriptor string in parameters.in", "type", "default value",
+# "the subsection path" ('' at the top level). Subsection parameters are recorded for every instance of the
+# subsection, e.g. 'Linear solver parameters (phi): Tolerance value'.
+NUMERICAL_PARAMETERS = [
+    ('Domain size X', 'double', '-1', ''),
+    ('Domain size Y', 'double', '-1', ''),
+    ('Domain size Z', 'double', '-1', ''),
+    ('Element degree', 'int', '1', ''),
+    ('Number of dimensions', 'int', '-1', ''),
+    ('Subdivisions X', 'int', '1', ''),
+    ('Subdivisions Y', 'int', '1', ''),
+    ('Subdivisions Z', 'int', '1', ''),
+    ('Refine factor', 'int', '-1', ''),
+    ('Mesh adaptivity', 'bool', 'false', ''),
+    ('Max refinement level', 'int', '-1', ''),
+    ('Min refinement level', 'int', '-1', ''),
+    ('Refinement criteria fields', 'list of strings', '', ''),
+    ('Refinement window max', 'list of doubles', '', ''),
+    ('Refinement window min', 'list of doubles', '', ''),
+    ('Steps between remeshing operations', 'int', '1', ''),
+    ('Number of time steps', 'int', '-1', ''),
+    ('Time step', 'double', '0', ''),
+    ('Simulation end time', 'double', '0', ''),
+    ('Output file name (base)', 'string', 'solution', ''),
+    ('Output file type', 'string', 'vtu', ''),
+    ('Output separate files per process', 'bool', 'false', ''),
+    ('Output condition', 'string', 'EQUAL_SPACING', ''),
+    ('List of time steps to output', 'list of ints', '0', ''),
+    ('Number of outputs', 'int', '10', ''),
+    ('Skip print steps', 'int', '1', ''),
+    ('Load initial conditions', 'bool', 'false', ''),
+    ('Load parallel file', 'bool', 'false', ''),
+    ('File names', 'list of strings', '', ''),
+    ('Variable names in the files', 'list of strings', '', ''),
+    ('Load from a checkpoint', 'bool', 'false', ''),
+    ('Checkpoint condition', 'string', 'EQUAL_SPACING', ''),
+    ('List of time steps to save checkpoints', 'list of ints', '0', ''),
+    ('Number of checkpoints', 'int', '1', ''),
+
+    ('Tolerance type', 'string', 'RELATIVE_RESIDUAL_CHANGE', 'Linear solver parameters'),
+    ('Tolerance value', 'double', '1.0e-10', 'Linear solver parameters'),
+    ('Maximum linear solver iterations', 'int', '1000', 'Linear solver parameters'),
+
+    ('Maximum nonlinear solver iterations', 'int', '100', ''),
+    ('Tolerance type', 'string', 'ABSOLUTE_CHANGE', 'Nonlinear solver parameters'),
+    ('Tolerance value', 'double', '1.0e-10', 'Nonlinear solver parameters'),
+    ('Use backtracking line search damping', 'bool', 'true', 'Nonlinear solver parameters'),
+    ('Backtracking step size modifier', 'double', '0.5', 'Nonlinear solver parameters'),
+    ('Backtracking residual decrease coefficient', 'double', '1.0', 'Nonlinear solver parameters'),
+    ('Constant damping value', 'double', '1.0', 'Nonlinear solver parameters'),
+    ('Use Laplace\'s equation to determine the initial guess', 'bool', 'false', 'Nonlinear solver parameters'),
+
+    ('Minimum allowed distance between nuclei', 'double', '-1', ''),
+    ('Order parameter cutoff value', 'double', '0.01', ''),
+    ('Time steps between nucleation attempts', 'int', '100', ''),
+
+    ('Nucleus semiaxes (x, y, z)', 'list of doubles', '0,0,0', 'Nucleation parameters'),
+    ('Nucleus rotation in degrees (x, y, z)', 'list of doubles', '0,0,0', 'Nucleation parameters'),
+    ('Freeze zone semiaxes (x, y, z)', 'list of doubles', '0,0,0', 'Nucleation parameters'),
+    ('Freeze time following nucleation', 'double', '0', 'Nucleation parameters'),
+    ('Nucleation-free border thickness', 'double', '0', 'Nucleation parameters'),
+]
+
+# Built and its defaults checked once, when the module is imported
+NUMERICAL_PARAMETER_SCHEMA = ParameterSchema(NUMERICAL_PARAMETERS)
 
 
 def get_parameters_sample(expt, sample_id=None, out=sys.stdout):
@@ -27,7 +102,7 @@ def get_parameters_sample(expt, sample_id=None, out=sys.stdout):
 
     """
     if sample_id is None:
-        candidate_parameters = [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates['numerial_parameters']]
+        candidate_parameters = get_processes_by_template(expt, prismspf_mcapi.templates['numerical-parameters'])
         if len(candidate_parameters) == 0:
             out.write('Did not find a Numerical Parameters sample.\n')
             out.write('Use \'mc prismspf numerical-parameters --create\' to create a Numerical Parameters sample, or --parameters-id <id> to specify explicitly.\n')
@@ -44,27 +119,14 @@ def get_parameters_sample(expt, sample_id=None, out=sys.stdout):
         parameters_proc.decorate_with_output_samples()
         return parameters_proc.output_samples[0]
     else:
-        # print("The sample id is: ")
-        # print(sample_id[0])
-
-        # This is broken, temporarily replaced by a more complicated work-around
-        # parameters = expt.get_sample_by_id(sample_id)
-
-        sample_found = False
-        for proc in expt.get_all_processes():
-            for sample in proc.get_all_samples():
-                if sample.id == sample_id[0]:
-                    # print("Sample found with id of: ", sample.id)
-                    parameters = sample
-                    sample_found = True
-                    break
-            if sample_found:
-                break
+        # expt.get_sample_by_id(sample_id) is broken, so use the shared sample index instead
+        parameters = get_sample_by_id(expt, sample_id[0], out)
 
     return parameters
 
 
-def create_parameters_sample(expt, args, process_name=None, sample_name=None, verbose=False):
+@attribute_backend_calls
+def create_parameters_sample(expt, args, process_name=None, sample_name=None, verbose=False, app_dir=None):
     """
     Create a PRISMS-PF Numerical Parameters Sample
 
@@ -80,6 +142,9 @@ def create_parameters_sample(expt, args, process_name=None, sample_name=None, ve
         verbose: bool
           Print messages about uploads, etc.
 
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory parameters.in is read from
+
     Returns:
 
         proc: mcapi.Process instance
@@ -88,153 +153,33 @@ def create_parameters_sample(expt, args, process_name=None, sample_name=None, ve
     template_id = prismspf_mcapi.templates['numerical-parameters']
 
     print("The template ID is: " + template_id)
-    ## Process that will create samples
-    proc = expt.create_process_from_template(template_id)
-
     if process_name is None:
-        proc.rename('Set Numerical Parameters')
-    else:
-        proc.rename(process_name)
-
-    ## Create sample
+        process_name = 'Set Numerical Parameters'
     if sample_name is None:
         sample_name = "Numerical Parameters"
-    new_sample = proc.create_samples([sample_name])
-
-    proc = expt.get_process_by_id(proc.id)
-
-    # Populate the list of numerical parameter descriptors used in parameters.in (skipping anything in a subsection for now)
-    # The order of entries is "descriptor string in parameters.in", "type", "default value", "the subsection name" (if applicable)
-    parameter_descriptor_list = []
-    parameter_descriptor_list.append(('Domain size X', 'double', '-1', ''))
-    parameter_descriptor_list.append(('Domain size Y', 'double', '-1', ''))
-    parameter_descriptor_list.append(('Domain size Z', 'double', '-1', ''))
-    parameter_descriptor_list.append(('Element degree', 'int', '1', ''))
-    parameter_descriptor_list.append(('Number of dimensions', 'int', '-1', ''))
-    parameter_descriptor_list.append(('Subdivisions X', 'int', '1', ''))
-    parameter_descriptor_list.append(('Subdivisions Y', 'int', '1', ''))
-    parameter_descriptor_list.append(('Subdivisions Z', 'int', '1', ''))
-    parameter_descriptor_list.append(('Refine factor', 'int', '-1', ''))
-    parameter_descriptor_list.append(('Mesh adaptivity', 'bool', 'false', ''))
-    parameter_descriptor_list.append(('Max refinement level', 'int', '-1', ''))
-    parameter_descriptor_list.append(('Min refinement level', 'int', '-1', ''))
-    parameter_descriptor_list.append(('Refinement criteria fields', 'string', '', ''))  # Actually a list of strings
-    parameter_descriptor_list.append(('Refinement window max', 'string', '', ''))  # Actually a list of doubles
-    parameter_descriptor_list.append(('Refinement window min', 'string', '', ''))  # Actually a list of doubles
-    parameter_descriptor_list.append(('Steps between remeshing operations', 'int', '1', ''))
-    parameter_descriptor_list.append(('Number of time steps', 'int', '-1', ''))
-    parameter_descriptor_list.append(('Time step', 'double', '0', ''))
-    parameter_descriptor_list.append(('Simulation end time', 'double', '0', ''))
-    parameter_descriptor_list.append(('Output file name (base)', 'string', 'solution', ''))
-    parameter_descriptor_list.append(('Output file type', 'string', 'vtu', ''))
-    parameter_descriptor_list.append(('Output separate files per process', 'bool', 'false', ''))
-    parameter_descriptor_list.append(('Output condition', 'string', 'EQUAL_SPACING', ''))
-    parameter_descriptor_list.append(('List of time steps to output', 'string', '0', ''))  # Actually a list of ints
-    parameter_descriptor_list.append(('Number of outputs', 'int', '10', ''))
-    parameter_descriptor_list.append(('Skip print steps', 'int', '1', ''))
-    parameter_descriptor_list.append(('Load initial conditions', 'bool', 'false', ''))
-    parameter_descriptor_list.append(('Load parallel file', 'bool', 'false', ''))
-    parameter_descriptor_list.append(('File names', 'string', '', ''))  # Actually a list of strings
-    parameter_descriptor_list.append(('Variable names in the files', 'string', '', ''))  # Actually a list of strings
-    parameter_descriptor_list.append(('Load from a checkpoint', 'bool', 'false', ''))
-    parameter_descriptor_list.append(('Checkpoint condition', 'string', 'EQUAL_SPACING', ''))
-    parameter_descriptor_list.append(('List of time steps to save checkpoints', 'string', '0', ''))  # Actually a list of ints
-    parameter_descriptor_list.append(('Number of checkpoints', 'int', '1', ''))
-
-    parameter_descriptor_list.append(('Tolerance type', 'string', 'RELATIVE_RESIDUAL_CHANGE', 'Linear solver parameters:'))
-    parameter_descriptor_list.append(('Tolerance value', 'double', '1.0e-10', 'Linear solver parameters:'))
-    parameter_descriptor_list.append(('Maximum linear solver iterations', 'int', '1000', 'Linear solver parameters:'))
-
-    parameter_descriptor_list.append(('Maximum nonlinear solver iterations', 'int', '100', ''))
-    parameter_descriptor_list.append(('Tolerance type', 'string', 'ABSOLUTE_CHANGE', 'Nonlinear solver parameters:'))
-    parameter_descriptor_list.append(('Tolerance value', 'double', '1.0e-10', 'Nonlinear solver parameters:'))
-    parameter_descriptor_list.append(('Use backtracking line search damping', 'bool', 'true', 'Nonlinear solver parameters:'))
-    parameter_descriptor_list.append(('Backtracking step size modifier', 'double', '0.5', 'Nonlinear solver parameters:'))
-    parameter_descriptor_list.append(('Backtracking residual decrease coefficient', 'double', '1.0', 'Nonlinear solver parameters:'))
-    parameter_descriptor_list.append(('Constant damping value', 'double', '1.0', 'Nonlinear solver parameters:'))
-    parameter_descriptor_list.append(('Use Laplace\'s equation to determine the initial guess', 'bool', 'false', 'Nonlinear solver parameters:'))
-
-    parameter_descriptor_list.append(('Minimum allowed distance between nuclei', 'double', '-1', ''))
-    parameter_descriptor_list.append(('Order parameter cutoff value', 'double', '0.01', ''))
-    parameter_descriptor_list.append(('Time steps between nucleation attempts', 'int', '100', ''))
-
-    parameter_descriptor_list.append(('Nucleus semiaxes (x, y, z)', 'string', '0,0,0', 'Nucleation parameters:'))  # Actually a list of doubles
-    parameter_descriptor_list.append(('Nucleus rotation in degrees (x, y, z)', 'string', '0,0,0', 'Nucleation parameters:'))  # Actually a list of doubles
-    parameter_descriptor_list.append(('Freeze zone semiaxes (x, y, z)', 'string', '0,0,0', 'Nucleation parameters:'))  # Actually a list of doubles
-    parameter_descriptor_list.append(('Freeze time following nucleation', 'double', '0', 'Nucleation parameters:'))
-    parameter_descriptor_list.append(('Nucleation-free border thickness', 'double', '0', 'Nucleation parameters:'))
-
-    parameter_dictionary = parse_parameters_file()
-
-    for parameter_descriptor in parameter_descriptor_list:
-        # The standard case where a parameter is directly set in the parameters file
-        if parameter_descriptor[0] in parameter_dictionary:
-            parameter_value = parameter_dictionary[parameter_descriptor[0]]
-            parameter_description = parameter_descriptor[0]
-            '''
-            if parameter_descriptor[1] == 'double':
-                proc.add_number_measurement(parameter_description, parameter_value)
-            elif parameter_descriptor[1] == 'int':
-                proc.add_integer_measurement(parameter_description, parameter_value)
-            elif parameter_descriptor[1] == 'string':
-                proc.add_string_measurement(parameter_description, parameter_value)
-            elif parameter_descriptor[1] == 'bool':
-                proc.add_boolean_measurement(parameter_description, parameter_value)
-            '''
-            proc.add_string_measurement(parameter_description, parameter_value)
-
-        # The default value if the parameter isn't set in the parameters file
-        elif len(parameter_descriptor[3]) < 1:
-            parameter_value = parameter_descriptor[2]
-            parameter_description = parameter_descriptor[0]
-            '''
-            if parameter_descriptor[1] == 'double':
-                proc.add_number_measurement(parameter_description, parameter_value)
-            elif parameter_descriptor[1] == 'int':
-                proc.add_integer_measurement(parameter_description, parameter_value)
-            elif parameter_descriptor[1] == 'string':
-                proc.add_string_measurement(parameter_description, parameter_value)
-            elif parameter_descriptor[1] == 'bool':
-                proc.add_boolean_measurement(parameter_description, parameter_value)
-            '''
-            proc.add_string_measurement(parameter_description, parameter_value)
-        else:
-            # Need to find all versions of the parameters in subsections
-            base_subsection_name = parameter_descriptor[3]
-            base_subsection_name = base_subsection_name[:-1]
 
-            for entry in parameter_dictionary:
-                if entry[:len(base_subsection_name)] == base_subsection_name and entry[-len(parameter_descriptor[0]):] == parameter_descriptor[0]:
-                    parameter_value = parameter_dictionary[entry]
-                    parameter_description = entry
-                    '''
-                    if parameter_descriptor[1] == 'double':
-                        proc.add_number_measurement(parameter_description, parameter_value)
-                    elif parameter_descriptor[1] == 'int':
-                        proc.add_integer_measurement(parameter_description, parameter_value)
-                    elif parameter_descriptor[1] == 'string':
-                        proc.add_string_measurement(parameter_description, parameter_value)
-                    elif parameter_descriptor[1] == 'bool':
-                        proc.add_boolean_measurement(parameter_description, parameter_value)
-                    '''
-                    proc.add_string_measurement(parameter_description, parameter_value)
+    ## Process that will create samples, committed at the end in as few requests as possible
+    builder = ProcessBuilder(expt, template_id, process_name)
+    builder.add_output_sample(sample_name)
 
+    parameters_document = load_parameters_file(os.path.join(app_dir or '', 'parameters.in'))
+    values, errors = NUMERICAL_PARAMETER_SCHEMA.values(parameters_document)
+    for key, message in errors:
+        print('Warning: ' + key + ' in parameters.in is invalid (' + message + '), recording it as a string')
 
+    measurements = builder.measurements
+    for key, otype, value in values:
+        measurements.add(key, value, otype)
 
-    # new_sample[0].pretty_print(shift=0, indent=2, out=sys.stdout)
+    file_registry = get_file_registry(expt.project)
+    parameters_file = file_registry.add_file_by_local_path(os.path.join(app_dir or '', 'parameters.in'), verbose=verbose)
+    builder.add_file(parameters_file, direction="in")
 
-    parameters_file = expt.project.add_file_by_local_path('parameters.in', verbose=verbose)  # I need to pass in the path to the PRISMS-PF app folder
-    parameters_file.direction = "in"
-    proc.add_files([parameters_file])
-
-    for sample in new_sample:
-        sample.link_files([parameters_file])
-
-    return expt.get_process_by_id(proc.id)
+    return builder.commit()
 
 
 class NumParametersSubcommand(ListObjects):
-    desc = "(sample) PRISMS-PF Numerical Parameters"
+    desc = subcommand_desc('numerical-parameters')
 
     def __init__(self):
         super(NumParametersSubcommand, self).__init__(["prismspf", "numerical-parameters"], "Numerical Parameters", "Numerical_Parameters",
@@ -244,14 +189,15 @@ class NumParametersSubcommand(ListObjects):
             creatable=True)
 
     def get_all_from_experiment(self, expt):
-        return [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(expt, prismspf_mcapi.templates[self.cmdname[-1]])
 
     def get_all_from_project(self, proj):
-        return [proc for proc in proj.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(proj, prismspf_mcapi.templates[self.cmdname[-1]])
 
+    @profile_backend_calls
     def create(self, args, out=sys.stdout):
-        proj = make_local_project()
-        expt = make_local_expt(proj)
+        metadata_cache.configure(args.refresh)
+        proj, expt = make_project_and_experiment()
 
         if args.proc_name is None:
             proc_name = None
@@ -274,6 +220,11 @@ class NumParametersSubcommand(ListObjects):
         process_name_help = "Set the name of the process"
         parser.add_argument('--proc-name', nargs='*', default=None, help=process_name_help)
 
+        profile_help = "Write a Chrome trace of every backend call to this file and print a per-operation latency summary"
+        parser.add_argument('--profile', default=None, help=profile_help)
+
+        metadata_cache.add_refresh_option(parser)
+
         return
 
     def list_data(self, obj):
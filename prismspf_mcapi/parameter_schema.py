@@ -0,0 +1,218 @@
+"""Typed schema of PRISMS-PF input file parameters, compiled once at import"""
+
+import re
+
+# Parameter type -> measurement otype (see prismspf_mcapi.measurements.MeasurementBatch)
+OTYPES = {
+    'int': 'integer',
+    'double': 'number',
+    'bool': 'boolean',
+    'string': 'string',
+    'list of ints': 'list',
+    'list of doubles': 'list',
+    'list of strings': 'list'}
+
+# Instance suffix of a subsection in a parsed key, e.g. ' (var0)' in 'Linear solver parameters (var0): Tolerance value'
+_INSTANCE_SUFFIX = re.compile(r' \([^():]*\)(?=: )')
+
+
+def _to_bool(value):
+    word = value.strip().lower()
+    if word in ('true', 'yes', 'on', '1'):
+        return True
+    if word in ('false', 'no', 'off', '0'):
+        return False
+    raise ValueError('not a bool: ' + repr(value))
+
+
+def _split_list(value):
+    return [word.strip() for word in value.split(',') if word.strip()]
+
+
+def _to_int(value):
+    return int(value.strip())
+
+
+def _to_double(value):
+    return float(value.strip())
+
+
+# Parameter type -> function converting one value from its text in parameters.in
+_CONVERTERS = {
+    'int': _to_int,
+    'double': _to_double,
+    'bool': _to_bool,
+    'string': lambda value: value.strip(),
+    'list of ints': lambda value: [_to_int(word) for word in _split_list(value)],
+    'list of doubles': lambda value: [_to_double(word) for word in _split_list(value)],
+    'list of strings': _split_list}
+
+
+def schema_key(key):
+    """Return the schema key of a parsed parameter key, i.e. with the subsection instance names removed"""
+    return _INSTANCE_SUFFIX.sub('', key)
+
+
+def convert_values(ptype, values):
+    """
+    Convert the text of many parameters of the same type at once.
+
+    Arguments:
+
+        ptype: str
+          A key of OTYPES
+
+        values: list of str
+
+    Returns:
+
+        (converted, errors): converted is a list the same length as 'values'
+          holding None where a value could not be converted; errors is a list
+          of (index, message)
+    """
+    convert = _CONVERTERS[ptype]
+    try:
+        return [convert(value) for value in values], []
+    except ValueError:
+        pass
+
+    # Only when some value is invalid: convert one by one to find which
+    converted = []
+    errors = []
+    for i, value in enumerate(values):
+        try:
+            converted.append(convert(value))
+        except ValueError as err:
+            converted.append(None)
+            errors.append((i, str(err)))
+    return converted, errors
+
+
+class TypedParameter(object):
+    """
+    A parameter of the schema.
+
+    Attributes:
+
+        key: str
+          Full key with the subsection path, without instance names, e.g.
+          'Linear solver parameters: Tolerance value'
+
+        subsection: str
+          The subsection path part of 'key' ('' at the top level)
+
+        name: str
+
+        ptype: str
+          A key of OTYPES
+
+        otype: str
+          The measurement type it is uploaded as
+
+        default: the default value, already converted
+    """
+
+    def __init__(self, name, ptype, default, subsection=''):
+        self.subsection = subsection
+        self.name = name
+        self.key = subsection + ': ' + name if subsection else name
+        self.ptype = ptype
+        self.otype = OTYPES[ptype]
+        converted, errors = convert_values(ptype, [default])
+        if errors:
+            raise ValueError('Invalid default for ' + self.key + ': ' + errors[0][1])
+        self.default = converted[0]
+
+
+class ParameterSchema(object):
+    """
+    Typed parameters keyed by full subsection path, matched against a parsed input file.
+
+    Arguments:
+
+        descriptors: list of (name, type, default, subsection path) tuples
+          Defaults are the text PRISMS-PF uses when the parameter is not set.
+          Subsection paths are without instance names and joined with ': ',
+          e.g. 'Nucleation parameters'; '' for the top level.
+
+    Attributes:
+
+        parameters: dict
+          key -> TypedParameter, in the order of 'descriptors'
+
+        subsections: dict
+          subsection path -> list of TypedParameter in that subsection
+    """
+
+    def __init__(self, descriptors):
+        self.parameters = {}
+        self.subsections = {}
+        for name, ptype, default, subsection in descriptors:
+            parameter = TypedParameter(name, ptype, default, subsection)
+            if parameter.key in self.parameters:
+                raise ValueError('Parameter ' + parameter.key + ' is described twice')
+            self.parameters[parameter.key] = parameter
+            self.subsections.setdefault(subsection, []).append(parameter)
+
+    def values(self, document):
+        """
+        Return the typed value of every schema parameter of a parsed input file.
+
+        Top-level parameters that are not set get their default. Subsection
+        parameters are reported once per instance of the subsection in the
+        file (e.g. once per variable), with the default for those the instance
+        does not set. Parameters set in a subsection of the schema that the
+        schema does not describe are kept, as strings.
+
+        Arguments:
+
+            document: prismspf_mcapi.prismspf_parameter_parser.ParametersDocument
+
+        Returns:
+
+            (values, errors): values is a list of (key, otype, value), with the
+              key as in the file, e.g. 'Linear solver parameters (var0): Tolerance value';
+              errors is a list of (key, message) for values of the wrong type,
+              which are kept in 'values' as strings
+        """
+        # Every (key, parameter, text) to report, in file order, then defaults
+        entries = []
+        for key, text in document.parameters.items():
+            parameter = self.parameters.get(schema_key(key))
+            if parameter is not None:
+                entries.append((key, parameter, text))
+            elif ': ' in key and schema_key(key).rsplit(': ', 1)[0] in self.subsections:
+                entries.append((key, None, text))
+
+        for parameter in self.subsections.get('', []):
+            if parameter.key not in document.parameters:
+                entries.append((parameter.key, parameter, None))
+        for subsection_path in document.subsections:
+            parameters = self.subsections.get(schema_key(subsection_path + ': ')[:-2], [])
+            for parameter in parameters:
+                key = subsection_path + ': ' + parameter.name
+                if key not in document.parameters:
+                    entries.append((key, parameter, None))
+
+        # Convert all set values of each type together
+        converted = {}
+        errors = []
+        by_type = {}
+        for i, (key, parameter, text) in enumerate(entries):
+            if parameter is not None and text is not None:
+                by_type.setdefault(parameter.ptype, []).append(i)
+        for ptype, indices in by_type.items():
+            type_values, type_errors = convert_values(ptype, [entries[i][2] for i in indices])
+            converted.update(zip(indices, type_values))
+            errors.extend((entries[indices[j]][0], message) for j, message in type_errors)
+        failed = set(key for key, message in errors)
+
+        values = []
+        for i, (key, parameter, text) in enumerate(entries):
+            if parameter is None or key in failed:
+                values.append((key, 'string', text))
+            elif text is None:
+                values.append((key, parameter.otype, parameter.default))
+            else:
+                values.append((key, parameter.otype, converted[i]))
+        return values, errors
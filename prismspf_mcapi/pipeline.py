@@ -0,0 +1,148 @@
+"""Concurrent execution of independent registration stages"""
+
+import sys
+import threading
+import contextlib
+import contextvars
+from io import StringIO
+from prismspf_mcapi import worker_pool
+
+# Default number of stages run at the same time
+DEFAULT_MAX_WORKERS = 5
+
+
+class PipelineError(Exception):
+    """
+    Raised when one or more stages of a pipeline fail.
+
+    Attributes:
+
+        results: list
+          The result of each stage in stage order, or None for stages that failed
+
+        failures: list of (str, Exception)
+          The name and exception of each failed stage, in stage order
+    """
+
+    def __init__(self, results, failures):
+        self.results = results
+        self.failures = failures
+        message = ', '.join(name + ' (' + repr(err) + ')' for name, err in failures)
+        super(PipelineError, self).__init__('Failed stage(s): ' + message)
+
+
+# Buffer the output of the current context is captured in, see thread_output()
+_output_buffer = contextvars.ContextVar('prismspf_mcapi_output_buffer', default=None)
+
+
+class _ThreadOutputRouter(object):
+    """Stream that sends writes made in a capturing context to that context's buffer"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = _output_buffer.get()
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        if _output_buffer.get() is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+# The router installed as sys.stdout, shared by every thread capturing output, and its number of users
+_router = None
+_router_users = 0
+_router_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def thread_output(buffer):
+    """
+    Send what the current thread prints to stdout to 'buffer' while the context is active.
+
+    The buffer is kept in a context variable, so work handed to the shared
+    worker pool inside the block (see prismspf_mcapi.worker_pool) prints to
+    it as well.
+    Other threads keep printing to the real stdout, unless they capture their
+    own output. Captures nest and may be active in many threads at once.
+
+    Arguments:
+
+        buffer: stream
+          Where the current thread's output is written
+    """
+    global _router, _router_users
+    with _router_lock:
+        if _router_users == 0:
+            _router = _ThreadOutputRouter(sys.stdout)
+            sys.stdout = _router
+        _router_users += 1
+
+    token = _output_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _output_buffer.reset(token)
+        with _router_lock:
+            _router_users -= 1
+            if _router_users == 0:
+                sys.stdout = _router.stream
+                _router = None
+
+
+def run_stages(stages, max_workers=DEFAULT_MAX_WORKERS, out=None):
+    """
+    Run independent stages concurrently on the shared worker pool.
+
+    Anything a stage prints to stdout is captured and written to 'out' once
+    all stages have finished, in stage order, so the output does not depend on
+    which stage happens to finish first. Every stage is allowed to finish even
+    if another one fails.
+
+    Arguments:
+
+        stages: list of (str, callable)
+          Stage name and a function taking no arguments
+
+        max_workers: int, optional (default=DEFAULT_MAX_WORKERS)
+          Maximum number of stages run at the same time
+
+        out: stream, optional (default=sys.stdout)
+          Where the captured stage output is written
+
+    Returns:
+
+        results: list
+          The return value of each stage, in stage order
+
+    Raises:
+
+        PipelineError: if any stage raised an exception
+    """
+    if out is None:
+        out = sys.stdout
+
+    buffers = [StringIO() for _ in stages]
+
+    def run(index):
+        with thread_output(buffers[index]):
+            return stages[index][1]()
+
+    outcomes = worker_pool.map_items(run, range(len(stages)), max_workers=max_workers, return_exceptions=True)
+    errors = [outcome if isinstance(outcome, Exception) else None for outcome in outcomes]
+
+    for buffer in buffers:
+        out.write(buffer.getvalue())
+
+    results = [None if err is not None else outcome for outcome, err in zip(outcomes, errors)]
+    failures = [(stage[0], err) for stage, err in zip(stages, errors) if err is not None]
+    if failures:
+        raise PipelineError(results, failures)
+
+    return results
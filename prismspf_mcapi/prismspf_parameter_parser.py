@@ -6,32 +6,14 @@ import os
 import datetime
 import time
 import sys
+import threading
 
 
 # ----------------------------------------------------------------------------------------
 # Function to extract a specific parameter from a PRISMS-PF input file
 # ----------------------------------------------------------------------------------------
 def parameter_extractor(file_name, entry_name):
-    parameter_value = 0
-
-    num_words_in_entry_name = len(entry_name.split())
-    entry_name_no_whitespace = "".join(entry_name.split())
-
-    f = open(file_name)
-    for line in f:
-        words_in_line = line.split()
-        if len(words_in_line) > 0:
-            if words_in_line[0] == "set":
-                if (len(words_in_line) > num_words_in_entry_name+2):
-                    prospective_match = ""
-                    for word in range(1, 1+num_words_in_entry_name):
-                        prospective_match += words_in_line[word]
-                    if (prospective_match == entry_name_no_whitespace):
-                        if len(words_in_line) >= 2+num_words_in_entry_name:
-                            parameter_value = words_in_line[2+num_words_in_entry_name]
-
-    f.close()
-    return parameter_value
+    return load_parameters_file(file_name).lookup_compact(entry_name, 0)
 
 
 # ----------------------------------------------------------------------------------------
@@ -56,45 +38,152 @@ def parse_line(split_line):
     return entry_name, entry_value
 
 
+# ----------------------------------------------------------------------------------------
+# Function to turn a 'subsection' line into the name used for the subsection
+# ----------------------------------------------------------------------------------------
+# 'subsection Nucleation parameters: n' gives 'Nucleation parameters (n)'
+def parse_subsection_name(split_line):
+    if len(split_line) > 2 and split_line[-2][-1] == ':':
+        subsection_name = ' '.join(split_line[1:-1])
+        subsection_name = subsection_name[:-1]
+        return subsection_name + " (" + split_line[-1] + ")"
+    return ' '.join(split_line[1:])
+
+
+# ----------------------------------------------------------------------------------------
+# Parsed representation of a PRISMS-PF input file
+# ----------------------------------------------------------------------------------------
+class ParametersDocument(object):
+    """
+    A PRISMS-PF input file parsed in a single pass.
+
+    Attributes:
+
+        parameters: dict
+          Full key -> value. Keys of parameters inside subsections are prefixed
+          with the subsection path, e.g. 'Nucleation parameters (n): Freeze time
+          following nucleation'. This is the dictionary parse_parameters_file returns.
+
+        subsections: dict
+          Subsection path -> {key: value} for the parameters set directly in it.
+          Nested subsection paths are joined with ': '.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.parameters = {}
+        self.subsections = {}
+        self._subsections_by_name = {}
+        self._compact = {}
+
+        with open(file_name) as f:
+            self._parse(f)
+
+    def _parse(self, lines):
+        subsection_stack = []
+        subsection_path = ''
+
+        for line in lines:
+            # First make sure line isn't a comment or blank line
+            stripped_line = line.strip()
+            if len(stripped_line) < 1 or stripped_line[0] == "#":
+                continue
+
+            split_line = stripped_line.split()
+            if split_line[0] == "subsection":
+                subsection_name = parse_subsection_name(split_line)
+                subsection_stack.append(subsection_name)
+                subsection_path = ': '.join(subsection_stack)
+                self.subsections.setdefault(subsection_path, {})
+                self._subsections_by_name.setdefault(subsection_name.split(' (')[0], []).append(subsection_path)
+
+            elif split_line[0] == "end":
+                if subsection_stack:
+                    subsection_stack.pop()
+                subsection_path = ': '.join(subsection_stack)
+
+            elif split_line[0] == "set":
+                entry_name, entry_value = parse_line(split_line)
+                if subsection_path:
+                    self.parameters[subsection_path + ": " + entry_name] = entry_value
+                    self.subsections[subsection_path][entry_name] = entry_value
+                else:
+                    self.parameters[entry_name] = entry_value
+
+                # parameter_extractor matches names ignoring whitespace and returns the first word of the value
+                value_words = entry_value.split()
+                if value_words and entry_value != "Invalid Entry":
+                    self._compact["".join(entry_name.split())] = value_words[0]
+
+    def __contains__(self, key):
+        return key in self.parameters
+
+    def get(self, key, default=None):
+        """Return the value for a full key, or 'default' if it is not set"""
+        return self.parameters.get(key, default)
+
+    def get_in(self, subsection_path, key, default=None):
+        """Return the value of 'key' set directly in a subsection, or 'default'"""
+        return self.subsections.get(subsection_path, {}).get(key, default)
+
+    def subsection(self, subsection_path):
+        """Return the {key: value} dict of a subsection (empty if it does not exist)"""
+        return self.subsections.get(subsection_path, {})
+
+    def find_subsections(self, name):
+        """Return the paths of every subsection with base name 'name', e.g. 'Nucleation parameters'"""
+        return self._subsections_by_name.get(name, [])
+
+    def lookup_compact(self, entry_name, default=None):
+        """Return the first word of the value of 'entry_name', ignoring whitespace in the name"""
+        return self._compact.get("".join(entry_name.split()), default)
+
+
+# Absolute path -> (mtime, size, ParametersDocument)
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+def load_parameters_file(file_name="parameters.in"):
+    """
+    Return the ParametersDocument for a PRISMS-PF input file.
+
+    The parsed document is memoized by path, mtime and size, so a file is only
+    read and tokenized again after it changes on disk.
+    """
+    path = os.path.abspath(file_name)
+    stat = os.stat(path)
+    with _documents_lock:
+        cached = _documents.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    document = ParametersDocument(path)
+    with _documents_lock:
+        _documents[path] = (stat.st_mtime_ns, stat.st_size, document)
+    return document
+
+
+def add_parameters_document(document, mtime_ns, size):
+    """
+    Memoize a ParametersDocument parsed elsewhere, e.g. in a worker process.
+
+    Arguments:
+
+        document: ParametersDocument
+          Parsed from an absolute path
+
+        mtime_ns, size: int
+          mtime and size of the file when it was parsed
+    """
+    with _documents_lock:
+        _documents[os.path.abspath(document.file_name)] = (mtime_ns, size, document)
+
+
 # ----------------------------------------------------------------------------------------
 # PRISMS-PF input file parsing script
 # ----------------------------------------------------------------------------------------
 # This file reads a PRISMS-PF input file and turns it into a set of key-value pairs that
 # are stored in a dictionary
-def parse_parameters_file():
-
-    file_name = "parameters.in"
-
-    parameter_set = {}
-    in_subsection = False
-
-    f = open(file_name)
-    for line in f:
-
-        # First make sure line isn't a comment or blank line
-        stripped_line = line.strip()
-        if len(stripped_line) < 1 or stripped_line[0] is "#":
-            continue
-
-        # Check if entering or leaving a subsection (not needed once updates are complete)
-        split_line = stripped_line.split()
-        if split_line[0] == "subsection":
-            in_subsection = True
-            subsection_name = ' '.join(split_line[1:-1])
-            subsection_name = subsection_name[:-1]
-            subsection_name = subsection_name + " (" + split_line[-1] + ")"
-            # print("subsection name: " + subsection_name)
-
-        elif split_line[0] == "end":
-            in_subsection = False
-
-        # For non-subsection variables
-        if in_subsection is False and split_line[0] == "set":
-            parameter_key_value_pair = parse_line(split_line)
-            parameter_set[parameter_key_value_pair[0]] = parameter_key_value_pair[1]
-        elif in_subsection is True and split_line[0] == "set":
-            parameter_key_value_pair = parse_line(split_line)
-            parameter_set[subsection_name + ": " + parameter_key_value_pair[0]] = parameter_key_value_pair[1]
-            # print(subsection_name + ": " + parameter_key_value_pair[0])
-
-    return parameter_set
+def parse_parameters_file(file_name="parameters.in"):
+    return dict(load_parameters_file(file_name).parameters)
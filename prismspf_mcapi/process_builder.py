@@ -0,0 +1,142 @@
+"""Create a process with its samples, measurements and files in as few requests as possible"""
+
+from prismspf_mcapi.measurements import MeasurementBatch
+from prismspf_mcapi.file_registry import get_file_registry
+from prismspf_mcapi import worker_pool
+
+# Number of processes committed at the same time by commit_all
+DEFAULT_MAX_WORKERS = 8
+
+
+class ProcessBuilder(object):
+    """
+    Collects the name, output samples, input samples, measurements and files of
+    a new process locally, then creates it all in one commit.
+
+    If the experiment provides a bulk 'create_process' method, the commit is a
+    single request. Otherwise the process is created from its template, then
+    renamed, given its output and input samples, measurements and files, one
+    request after another because each updates the same process. Only the
+    chunks of the measurements are sent concurrently. Files are then linked
+    to the output samples. The process is never fetched again; its 'name' and
+    'output_samples' are set from what was sent. Independent processes are
+    committed concurrently by commit_all.
+
+    Arguments:
+
+        expt: mcapi.Experiment object
+
+        template_id: str
+
+        name: str, optional (default=None)
+          Process name; the template's default name is kept if None
+
+    Attributes:
+
+        measurements: prismspf_mcapi.measurements.MeasurementBatch
+          Queue measurements here with add_string, add_integer, etc.
+    """
+
+    def __init__(self, expt, template_id, name=None):
+        self.expt = expt
+        self.template_id = template_id
+        self.name = name
+        self.sample_names = []
+        self.input_samples = []
+        self.measurements = MeasurementBatch(None)
+        self.files = []
+        self.linked_files = []
+        self.proc = None
+
+    def add_output_sample(self, sample_name):
+        self.sample_names.append(sample_name)
+
+    def add_input_samples(self, samples):
+        for sample in samples:
+            sample.direction = 'in'
+        self.input_samples.extend(samples)
+
+    def add_file(self, f, direction=None, link=True):
+        """Add an uploaded file to the process, and link it to the output samples if 'link'"""
+        if direction is not None:
+            f.direction = direction
+        self.files.append(f)
+        if link:
+            self.linked_files.append(f)
+
+    def journal_key(self):
+        """Return the key the process is recorded under in a RegistrationJournal"""
+        return '/'.join([self.template_id, self.name or '', ','.join(self.sample_names)])
+
+    def commit(self, journal=None):
+        """
+        Create the process.
+
+        Arguments:
+
+            journal: prismspf_mcapi.journal.RegistrationJournal, optional (default=None)
+              If given, the process is recorded in it once created, and if the
+              journal already records it, it is not created again
+
+        Returns:
+
+            proc: mcapi.Process instance
+              The new process, with 'output_samples' set, or its Record from 'journal'
+        """
+        if self.proc is not None:
+            raise RuntimeError('ProcessBuilder.commit was already called')
+
+        if journal is not None:
+            self.proc = journal.process(self.journal_key())
+            if self.proc is not None:
+                return self.proc
+            proc = self._create()
+            journal.record_process(self.journal_key(), proc)
+            return proc
+        return self._create()
+
+    def _create(self):
+        if hasattr(self.expt, 'create_process'):
+            self.proc = self.expt.create_process(
+                self.template_id, name=self.name, sample_names=self.sample_names, input_samples=self.input_samples,
+                measurements=self.measurements.measurements, files=self.files, linked_files=self.linked_files)
+            self.measurements.measurements = []
+            return self.proc
+
+        proc = self.expt.create_process_from_template(self.template_id)
+        self.measurements.proc = proc
+
+        # One after another: each of these updates the same process, on the server and in 'proc'
+        output_samples = []
+        if self.name is not None:
+            proc.rename(self.name)
+            proc.name = self.name
+        if self.sample_names:
+            output_samples = proc.create_samples(self.sample_names)
+        if self.input_samples:
+            proc.add_input_samples_to_process(self.input_samples)
+        proc.output_samples = output_samples
+
+        # Measurements attach to the output samples; their chunks are sent concurrently
+        if len(self.measurements):
+            self.measurements.commit()
+        if self.files:
+            proc.add_files(self.files)
+
+        if self.linked_files and output_samples:
+            get_file_registry(self.expt.project).link_files(output_samples, self.linked_files)
+
+        self.proc = proc
+        return proc
+
+
+def commit_all(builders, max_workers=DEFAULT_MAX_WORKERS, journal=None):
+    """
+    Commit independent ProcessBuilders concurrently and return their processes, in order.
+
+    With a 'journal', each process is recorded as soon as it is created, so
+    if some fail, running again only creates the missing ones (see ProcessBuilder.commit).
+    """
+    if len(builders) == 0:
+        return []
+    return worker_pool.map_items(lambda builder: builder.commit(journal), builders, max_workers=max_workers)
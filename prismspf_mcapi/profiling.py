@@ -0,0 +1,206 @@
+"""Tracing of backend calls, written as Chrome trace events (--profile)"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import functools
+import threading
+import contextvars
+from prismspf_mcapi.http_pool import report_connection_stats
+from prismspf_mcapi.retry import get_retry_policy
+
+# Module of a function decorated with attribute_backend_calls -> subcommand it belongs to
+SUBCOMMAND_MODULES = {
+    'prismspf_mcapi.numerical_parameters': 'numerical-parameters',
+    'prismspf_mcapi.model_parameters': 'model-parameters',
+    'prismspf_mcapi.software': 'software',
+    'prismspf_mcapi.equations': 'equations',
+    'prismspf_mcapi.environment': 'environment',
+    'prismspf_mcapi.simulation': 'simulation',
+    'prismspf_mcapi.ingest': 'ingest',
+}
+
+# Upper bounds, in ms, of the latency histogram buckets (the last bucket is unbounded)
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+# The Tracer of the running subcommand, if it was started with --profile
+_active_tracer = None
+
+# The subcommand backend calls are attributed to. Worker threads see it when
+# their tasks run in a copy of the submitting context (see prismspf_mcapi.worker_pool.in_current_context).
+_subcommand = contextvars.ContextVar('prismspf_mcapi_subcommand', default=None)
+
+
+def attribute_backend_calls(fn):
+    """
+    Decorator attributing the backend calls made while 'fn' runs, including
+    those of the tasks it hands to worker threads, to the subcommand of fn's
+    module (see SUBCOMMAND_MODULES).
+    """
+    subcommand = SUBCOMMAND_MODULES[fn.__module__]
+
+    @functools.wraps(fn)
+    def attributed(*args, **kwargs):
+        token = _subcommand.set(subcommand)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _subcommand.reset(token)
+    return attributed
+
+
+def _request_bytes(method, args, kwargs):
+    """Estimate the request size of a backend call: file size for uploads, JSON size otherwise"""
+    if method == 'add_file_by_local_path' and args and os.path.isfile(args[0]):
+        return os.path.getsize(args[0])
+    payload = [getattr(a, 'id', a) for a in args]
+    payload = [[getattr(x, 'id', x) for x in a] if isinstance(a, (list, tuple)) else a for a in payload]
+    return len(json.dumps([payload, kwargs], default=str))
+
+
+class Tracer(object):
+    """
+    Collects one complete ('X') Chrome trace event per backend call.
+
+    Arguments:
+
+        subcommand: str
+          The subcommand that was run, used for calls not attributed to
+          another one (see attribute_backend_calls)
+    """
+
+    def __init__(self, subcommand):
+        self.subcommand = subcommand
+        self.start = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def record(self, method, start, stop, request_bytes, subcommand, error=None):
+        event = {
+            'name': method,
+            'cat': subcommand,
+            'ph': 'X',
+            'ts': (start - self.start) * 1e6,
+            'dur': (stop - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {'subcommand': subcommand, 'request_bytes': request_bytes}}
+        if error is not None:
+            event['args']['error'] = error
+        with self._lock:
+            self.events.append(event)
+
+    def call(self, method, fn, args, kwargs):
+        """Make a backend call and record it (a prismspf_mcapi.proxy.BackendProxy hook)"""
+        subcommand = _subcommand.get() or self.subcommand
+        request_bytes = _request_bytes(method, args, kwargs)
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as err:
+            self.record(method, start, time.perf_counter(), request_bytes, subcommand, error=repr(err))
+            raise
+        self.record(method, start, time.perf_counter(), request_bytes, subcommand)
+        return result
+
+    def histogram(self):
+        """
+        Return per-operation latency statistics.
+
+        Returns:
+
+            summary: dict
+              method -> {'count', 'total_ms', 'mean_ms', 'p50_ms', 'p90_ms',
+              'max_ms', 'request_bytes', 'buckets'}, where 'buckets' counts calls
+              per HISTOGRAM_BUCKETS_MS upper bound (plus one unbounded bucket)
+        """
+        durations = {}
+        request_bytes = {}
+        for event in self.events:
+            durations.setdefault(event['name'], []).append(event['dur'] / 1000)
+            request_bytes[event['name']] = request_bytes.get(event['name'], 0) + event['args']['request_bytes']
+
+        summary = {}
+        for method, values in durations.items():
+            values.sort()
+            buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+            for value in values:
+                buckets[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value)] += 1
+            summary[method] = {
+                'count': len(values),
+                'total_ms': sum(values),
+                'mean_ms': sum(values) / len(values),
+                'p50_ms': values[len(values) // 2],
+                'p90_ms': values[min(len(values) - 1, int(0.9 * len(values)))],
+                'max_ms': values[-1],
+                'request_bytes': request_bytes[method],
+                'buckets': buckets}
+        return summary
+
+    def write(self, path):
+        """Write the events in Chrome trace-event format, with the histogram as metadata"""
+        with self._lock:
+            events = list(self.events)
+        trace = {
+            'traceEvents': sorted(events, key=lambda event: event['ts']),
+            'displayTimeUnit': 'ms',
+            'otherData': {'subcommand': self.subcommand, 'histogram_buckets_ms': HISTOGRAM_BUCKETS_MS,
+                          'operations': self.histogram()}}
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+
+    def report(self, out=sys.stdout):
+        """Write a table of per-operation latency and a histogram of call durations"""
+        summary = self.histogram()
+        out.write('{:32} {:>6} {:>10} {:>9} {:>9} {:>9} {:>12}\n'.format(
+            'operation', 'calls', 'total ms', 'mean ms', 'p90 ms', 'max ms', 'bytes'))
+        for method in sorted(summary, key=lambda m: -summary[m]['total_ms']):
+            s = summary[method]
+            out.write('{:32} {:6d} {:10.1f} {:9.2f} {:9.2f} {:9.2f} {:12d}\n'.format(
+                method, s['count'], s['total_ms'], s['mean_ms'], s['p90_ms'], s['max_ms'], s['request_bytes']))
+
+        labels = ['<=' + str(bound) + 'ms' for bound in HISTOGRAM_BUCKETS_MS] + ['>' + str(HISTOGRAM_BUCKETS_MS[-1]) + 'ms']
+        totals = [sum(s['buckets'][i] for s in summary.values()) for i in range(len(labels))]
+        widest = max(totals) if totals and max(totals) > 0 else 1
+        out.write('\nLatency histogram (all operations):\n')
+        for label, count in zip(labels, totals):
+            if count:
+                out.write('  {:>9} {:6d} {}\n'.format(label, count, '#' * max(1, int(40 * count / widest))))
+
+
+def active_tracer():
+    """Return the Tracer of the running subcommand, or None if it is not profiled"""
+    return _active_tracer
+
+
+def profile_backend_calls(create):
+    """
+    Decorator for a subcommand's 'create' method that implements --profile.
+
+    If args.profile is set, backend objects from make_project_and_experiment
+    are traced while 'create' runs, with the Tracer as a BackendProxy hook.
+    The Chrome trace is then written to args.profile and the latency summary
+    to 'out'. Retries of backend calls, if there were any, are always
+    summarized.
+    """
+    @functools.wraps(create)
+    def profiled_create(self, args, out=sys.stdout):
+        global _active_tracer
+        path = getattr(args, 'profile', None)
+        if path is not None:
+            _active_tracer = Tracer(self.cmdname[-1])
+        try:
+            return create(self, args, out)
+        finally:
+            get_retry_policy().report(out)
+            if path is not None:
+                tracer = _active_tracer
+                _active_tracer = None
+                tracer.write(path)
+                out.write('\nBackend calls (trace written to ' + path + '):\n')
+                tracer.report(out)
+                out.write('\nHTTP connections:\n')
+                report_connection_stats(out)
+    return profiled_create
@@ -0,0 +1,103 @@
+"""Wrapping of backend objects so every call passes through a chain of hooks"""
+
+import copy
+import functools
+
+
+def _unwrap(value):
+    if isinstance(value, BackendProxy):
+        return object.__getattribute__(value, '_target')
+    if isinstance(value, list):
+        return [_unwrap(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_unwrap(v) for v in value)
+    return value
+
+
+def _is_backend_object(value):
+    return hasattr(value, 'id') and not isinstance(value, (str, bytes, int, float, dict))
+
+
+def _wrap(value, hooks):
+    if isinstance(value, BackendProxy):
+        return value
+    if isinstance(value, list) and value and all(_is_backend_object(v) for v in value):
+        return [BackendProxy(v, hooks) for v in value]
+    if _is_backend_object(value):
+        return BackendProxy(value, hooks)
+    return value
+
+
+def _chain(hook, method, fn):
+    def hooked(*args, **kwargs):
+        return hook.call(method, fn, args, kwargs)
+    return hooked
+
+
+class BackendProxy(object):
+    """
+    Wraps a backend object (project, experiment, process, sample or file) so
+    every method call passes through a list of hooks.
+
+    A hook is an object with a 'call(method, fn, args, kwargs)' method that
+    returns fn(*args, **kwargs), doing its work around that call. The first
+    hook is the outermost one.
+
+    Backend objects returned by calls, or held in attributes like
+    'output_samples' and 'project', are wrapped too. Proxies passed as
+    arguments are unwrapped before the real call. Attribute assignments go to
+    the wrapped object.
+
+    Arguments:
+
+        target: backend object
+
+        hooks: list
+          Hooks, outermost first
+    """
+
+    def __init__(self, target, hooks):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_hooks', hooks)
+
+    def __getattr__(self, name):
+        target = object.__getattribute__(self, '_target')
+        hooks = object.__getattribute__(self, '_hooks')
+        value = getattr(target, name)
+        if name.startswith('_'):
+            return value
+        if not callable(value):
+            return _wrap(value, hooks)
+
+        call = value
+        for hook in reversed(hooks):
+            call = _chain(hook, name, call)
+
+        @functools.wraps(value)
+        def hooked(*args, **kwargs):
+            args = [_unwrap(a) for a in args]
+            kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+            return _wrap(call(*args, **kwargs), hooks)
+        return hooked
+
+    def __setattr__(self, name, value):
+        setattr(object.__getattribute__(self, '_target'), name, _unwrap(value))
+
+    def __repr__(self):
+        return 'BackendProxy(' + repr(object.__getattribute__(self, '_target')) + ')'
+
+
+def copy_backend_object(value):
+    """Return a shallow copy of a backend object, wrapped with the same hooks if 'value' is a BackendProxy"""
+    if isinstance(value, BackendProxy):
+        return BackendProxy(copy.copy(object.__getattribute__(value, '_target')),
+                            object.__getattribute__(value, '_hooks'))
+    return copy.copy(value)
+
+
+def wrap_backend(proj, expt, hooks):
+    """Return (proj, expt) wrapped in BackendProxy objects, or unchanged if there are no hooks"""
+    hooks = [hook for hook in hooks if hook is not None]
+    if not hooks:
+        return proj, expt
+    return BackendProxy(proj, hooks), BackendProxy(expt, hooks)
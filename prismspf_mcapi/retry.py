@@ -0,0 +1,223 @@
+"""Retries of backend calls with jittered exponential backoff and idempotency keys"""
+
+import sys
+import time
+import uuid
+import random
+import threading
+
+# Backend methods that change something. Each call gets an idempotency key,
+# which stays the same when the call is retried.
+WRITE_METHODS = frozenset([
+    'add_file_by_local_path', 'create_process_from_template', 'create_process', 'rename', 'create_samples',
+    'add_input_samples_to_process', 'add_files', 'add_measurements', 'link_files',
+    'add_string_measurement', 'add_integer_measurement', 'add_number_measurement',
+    'add_boolean_measurement', 'add_list_measurement'])
+
+# Default number of times a failed backend call is retried
+DEFAULT_MAX_RETRIES = 5
+
+# Default upper bound, in seconds, of the first backoff; doubled for each further retry
+DEFAULT_BASE_DELAY = 0.5
+
+# Upper bound, in seconds, of any one backoff
+DEFAULT_MAX_DELAY = 30.0
+
+# Names of the requests and urllib3 exception classes for connection failures and timeouts
+_TRANSIENT_ERROR_NAMES = frozenset([
+    'ConnectionError', 'Timeout', 'NewConnectionError', 'ConnectTimeoutError', 'ReadTimeoutError', 'ProtocolError'])
+
+# Names of the requests and urllib3 exception classes for connections that could not be opened
+_UNSENT_ERROR_NAMES = frozenset(['ConnectTimeout', 'NewConnectionError', 'ConnectTimeoutError'])
+
+# The idempotency key of the call running in each thread, and the number of requests sent with it
+_local = threading.local()
+
+# The RetryPolicy shared by every backend object of this invocation
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def current_idempotency_key():
+    """Return the idempotency key of the backend write running in this thread, or None"""
+    return getattr(_local, 'key', None)
+
+
+def next_request_key():
+    """
+    Return the idempotency key for the next HTTP request of the running backend write.
+
+    A write may send several requests; they get the keys '<key>.1', '<key>.2',
+    etc., in order, and the numbering restarts on each retry so a retried
+    request carries the same key as the original. Returns None outside a write.
+    """
+    key = getattr(_local, 'key', None)
+    if key is None:
+        return None
+    _local.requests += 1
+    return key + '.' + str(_local.requests)
+
+
+def _http_error_names(err):
+    """Return the names of the requests and urllib3 classes 'err' is an instance of"""
+    return set(cls.__name__ for cls in type(err).__mro__ if cls.__module__.split('.')[0] in ('requests', 'urllib3'))
+
+
+def is_transient(err):
+    """
+    Return True if a failed call may succeed when retried.
+
+    Connection errors, timeouts and HTTP 5xx responses are transient. Other
+    HTTP errors, invalid requests (e.g. a malformed URL) and local errors
+    (e.g. a missing file) are not.
+    """
+    if getattr(err, 'transient', False):
+        return True
+    status = getattr(getattr(err, 'response', None), 'status_code', None)
+    if status is not None:
+        return status >= 500
+    if isinstance(err, (ConnectionError, TimeoutError)):
+        return True
+    return bool(_http_error_names(err) & _TRANSIENT_ERROR_NAMES)
+
+
+def is_unsent(err):
+    """
+    Return True if a failed call certainly did not reach the server, so
+    retrying it cannot apply a write twice.
+
+    That is the case when the connection could not be opened. After a read
+    timeout or a dropped connection the request may have been applied.
+    """
+    sent = getattr(err, 'sent', None)
+    if sent is not None:
+        return not sent
+    if isinstance(err, ConnectionRefusedError):
+        return True
+    if _http_error_names(err) & _UNSENT_ERROR_NAMES:
+        return True
+    # requests wraps the urllib3 error: ConnectionError(MaxRetryError(reason=NewConnectionError(...)))
+    reason = getattr(err.args[0], 'reason', None) if err.args else None
+    return isinstance(reason, Exception) and is_unsent(reason)
+
+
+def backoff_delay(attempt, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """Return a random delay between 0 and min(max_delay, base_delay * 2**attempt) ("full jitter")"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class RetryPolicy(object):
+    """
+    Retries backend calls that fail transiently (a prismspf_mcapi.proxy.BackendProxy hook).
+
+    Every write (see WRITE_METHODS) gets a fresh idempotency key, available to
+    the backend through current_idempotency_key() and next_request_key()
+    while the call runs, and reused by all of its retries. The shared
+    Materials Commons session sends it as the 'Idempotency-Key' header, but
+    the server may ignore it, so by default a write is only retried when it
+    certainly did not reach the server (see is_unsent). With 'keyed_writes',
+    for backends that apply a write at most once per key (the local
+    backend), writes are retried after any transient failure.
+
+    Arguments:
+
+        max_retries: int, optional (default=DEFAULT_MAX_RETRIES)
+
+        base_delay, max_delay: float, optional
+          See backoff_delay
+
+        keyed_writes: bool, optional (default=False)
+          The backend honors idempotency keys
+
+    Attributes:
+
+        retries: dict
+          method -> number of retries
+
+        gave_up: dict
+          method -> number of calls that still failed after max_retries retries
+
+        backoff_seconds: float
+          Total time spent waiting before retries
+    """
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 keyed_writes=False):
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.keyed_writes = keyed_writes
+        self.retries = {}
+        self.gave_up = {}
+        self.backoff_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_retry(self, method, delay):
+        with self._lock:
+            self.retries[method] = self.retries.get(method, 0) + 1
+            self.backoff_seconds += delay
+
+    def call(self, method, fn, args, kwargs):
+        saved_key = getattr(_local, 'key', None)
+        saved_requests = getattr(_local, 'requests', 0)
+        _local.key = uuid.uuid4().hex if method in WRITE_METHODS else None
+        try:
+            attempt = 0
+            while True:
+                _local.requests = 0
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as err:
+                    if not is_transient(err):
+                        raise
+                    if method in WRITE_METHODS and not self.keyed_writes and not is_unsent(err):
+                        # The write may have been applied; retrying could apply it twice
+                        raise
+                    if attempt >= self.max_retries:
+                        with self._lock:
+                            self.gave_up[method] = self.gave_up.get(method, 0) + 1
+                        raise
+                    delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                    self.record_retry(method, delay)
+                    time.sleep(delay)
+                    attempt += 1
+        finally:
+            _local.key = saved_key
+            _local.requests = saved_requests
+
+    def stats(self):
+        with self._lock:
+            return {'retries': dict(self.retries), 'gave_up': dict(self.gave_up), 'backoff_seconds': self.backoff_seconds}
+
+    def report(self, out=sys.stdout):
+        """Write one line about retries, if any call was retried"""
+        stats = self.stats()
+        n_retries = sum(stats['retries'].values())
+        if n_retries == 0 and not stats['gave_up']:
+            return
+        details = ', '.join('{}: {}'.format(method, n) for method, n in sorted(stats['retries'].items()))
+        out.write('Retried backend calls {} time(s) ({}), {:.2f} s backing off'.format(
+            n_retries, details, stats['backoff_seconds']))
+        if stats['gave_up']:
+            out.write(', gave up on {} call(s)'.format(sum(stats['gave_up'].values())))
+        out.write('\n')
+
+
+def configure(max_retries=None, base_delay=None, keyed_writes=None):
+    """Set the retry limit, base backoff and 'keyed_writes' of the shared RetryPolicy; None keeps the current value"""
+    policy = get_retry_policy()
+    if max_retries is not None:
+        policy.max_retries = max(0, int(max_retries))
+    if base_delay is not None:
+        policy.base_delay = float(base_delay)
+    if keyed_writes is not None:
+        policy.keyed_writes = bool(keyed_writes)
+
+
+def get_retry_policy():
+    """Return the RetryPolicy shared by every backend object of this invocation, creating it if necessary"""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = RetryPolicy()
+        return _policy
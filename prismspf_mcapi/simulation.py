@@ -1,11 +1,38 @@
 """mc prismspf simulation subcommand"""
 
+import os
 import sys
 import glob
+import json
+import hashlib
 import prismspf_mcapi
-from prismspf_mcapi.numerical_parameters import get_parameters_sample
+from prismspf_mcapi.lookup import get_sample_by_id, get_processes_by_template
+from prismspf_mcapi.manifest import UploadManifest
+from prismspf_mcapi.journal import RegistrationJournal
+from prismspf_mcapi.bundling import bundle_per_timestep, complete_timesteps
+from prismspf_mcapi.measurements import MeasurementBatch
+from prismspf_mcapi.process_builder import ProcessBuilder
+from prismspf_mcapi.vtu import scan_vtu_files
+from prismspf_mcapi import http_pool
+from prismspf_mcapi import retry
+from prismspf_mcapi.file_registry import get_file_registry, cached_file_digest
+from prismspf_mcapi.equations_dot_h_parser import parse_equations_file
+from prismspf_mcapi.compression import make_compressor, available_codecs
+from prismspf_mcapi.prismspf_parameter_parser import load_parameters_file
+from prismspf_mcapi.watch import ResultWatcher, DEFAULT_POLL_INTERVAL, DEFAULT_PATTERN, DEFAULT_IDLE_TIMEOUT
+from prismspf_mcapi.pipeline import run_stages, PipelineError, DEFAULT_MAX_WORKERS
 from materials_commons.cli import ListObjects
-from materials_commons.cli.functions import make_local_project, make_local_expt
+from prismspf_mcapi.backend import make_project_and_experiment, BACKEND_ENV_VAR
+from prismspf_mcapi.main import subcommand_desc
+from prismspf_mcapi.profiling import profile_backend_calls, attribute_backend_calls
+from prismspf_mcapi import metadata_cache
+from materials_commons.cli.functions import _trunc_name, _format_mtime
+
+# Options that change what a full-simulation registration creates; a journal
+# written with different values is not resumed
+JOURNAL_OPTIONS = ['compress', 'compress_level', 'scan_results', 'field_statistics', 'bundle_per_timestep',
+                   'num_cores', 'version', 'upload_url', 'proc_name', 'samp_name']
+
 
 def get_simulation_sample(expt, sample_id=None, out=sys.stdout):
     """
@@ -27,7 +54,7 @@ def get_simulation_sample(expt, sample_id=None, out=sys.stdout):
 
     """
     if sample_id is None:
-        candidate_simulation = [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates['simulation']]
+        candidate_simulation = get_processes_by_template(expt, prismspf_mcapi.templates['simulation'])
         if len(candidate_simulation) == 0:
             out.write('Did not find a Phase Field Simulation sample.\n')
             out.write('Use \'mc prismspf simulation --create\' to create a Simulation sample, or --simulation -id <id> to specify explicitly.\n')
@@ -44,27 +71,164 @@ def get_simulation_sample(expt, sample_id=None, out=sys.stdout):
         simulation_proc.decorate_with_output_samples()
         return simulation_proc.output_samples[0]
     else:
-        # print("The sample id is: ")
-        # print(sample_id[0])
-
-        # This is broken, temporarily replaced by a more complicated work-around
-        # simulation = expt.get_sample_by_id(sample_id)
-
-        sample_found = False
-        for proc in expt.get_all_processes():
-            for sample in proc.get_all_samples():
-                if sample.id == sample_id[0]:
-                    # print("Sample found with id of: ", sample.id)
-                    simulation = sample
-                    sample_found = True
-                    break
-            if sample_found:
-                break
+        # expt.get_sample_by_id(sample_id) is broken, so use the shared sample index instead
+        simulation = get_sample_by_id(expt, sample_id[0], out)
 
     return simulation
 
 
-def create_simulation_sample(expt, args, sample_list, process_name=None, sample_name=None, verbose=False):
+def result_file_layout(args, app_dir=None):
+    """
+    Return (bundle, base_name): whether result files are bundled per time step, and the output file name base
+
+    Files are bundled with --bundle-per-timestep, or if parameters.in sets
+    'Output separate files per process'.
+    """
+    bundle = args.bundle_per_timestep
+    base_name = 'solution'
+    parameters_file = os.path.join(app_dir or '', 'parameters.in')
+    if os.path.isfile(parameters_file):
+        parameters_document = load_parameters_file(parameters_file)
+        if parameters_document.get('Output separate files per process', 'false').strip().lower() == 'true':
+            bundle = True
+        base_name = parameters_document.get('Output file name (base)', base_name).strip()
+    return bundle, base_name
+
+
+def get_result_file_names(args, app_dir=None):
+    """
+    Return the result files in the app directory to upload for a PRISMS-PF Simulation
+
+    If the simulation wrote separate files per process ('Output separate files
+    per process' in parameters.in, or --bundle-per-timestep), the per-process
+    .vtu files and the .pvtu file of each time step are replaced by one
+    compressed archive per time step.
+
+    Arguments:
+
+        app_dir: str, optional (default=current working directory)
+
+    Returns:
+
+        file_names: list of str
+          Paths relative to 'app_dir'
+    """
+    vtu_file_names = list_app_files('*vtu', app_dir)
+
+    bundle, base_name = result_file_layout(args, app_dir)
+    if bundle:
+        vtu_file_names = bundle_per_timestep(vtu_file_names, base_name, app_dir)
+    return vtu_file_names
+
+
+def list_app_files(pattern, app_dir=None):
+    """Return the sorted names of the files in the app directory that match a glob pattern"""
+    return sorted(os.path.basename(path) for path in glob.glob(os.path.join(app_dir or '', pattern)))
+
+
+def add_result_file_measurements(proc, file_names, processes=None, app_dir=None):
+    """
+    Record mesh and field metadata of .vtu/.pvtu result files as measurements
+
+    Only the XML structure of each file is read (see prismspf_mcapi.vtu). For
+    each file, the number of points and cells, the field names, the time step
+    index and the file size are added, named '<file name>: <quantity>'.
+
+    Arguments:
+
+        proc: mcapi.Process object, or prismspf_mcapi.measurements.MeasurementBatch
+          The Simulation process, whose output samples get the measurements.
+          If a MeasurementBatch (e.g. of a ProcessBuilder) is given, the
+          measurements are queued in it and not committed.
+
+        file_names: list of str
+          Result files; anything that is not a .vtu or .pvtu file is skipped
+
+        processes: int, optional (default=None)
+          Size of the process pool used for scanning (default: number of CPUs)
+
+        app_dir: str, optional (default=current working directory)
+          Directory 'file_names' are relative to
+
+    Returns:
+
+        headers: list of prismspf_mcapi.vtu.VTUHeader
+    """
+    vtu_file_names = [name for name in file_names if name.endswith('.vtu') or name.endswith('.pvtu')]
+    headers = scan_vtu_files([os.path.join(app_dir or '', name) for name in vtu_file_names], processes=processes)
+
+    measurements = proc if isinstance(proc, MeasurementBatch) else MeasurementBatch(proc)
+    for name, header in zip(vtu_file_names, headers):
+        measurements.add_integer(name + ': Number of points', header.number_of_points)
+        measurements.add_integer(name + ': Number of cells', header.number_of_cells)
+        measurements.add_string(name + ': Fields', ', '.join(header.field_names))
+        if header.time_step is not None:
+            measurements.add_integer(name + ': Time step', header.time_step)
+        measurements.add_integer(name + ': File size', header.file_size)
+    if measurements is not proc:
+        measurements.commit()
+
+    return headers
+
+
+def add_field_statistics_table(expt, proc, samples, file_names, table_path=None, verbose=False, app_dir=None):
+    """
+    Attach a time-series table of per-field summary statistics to a Simulation process
+
+    The min, max, mean and L2 norm of each field are computed for every time
+    step (see prismspf_mcapi.vtu_stats), written as CSV and uploaded. Fields
+    are limited to the variables named in equations.cc, if it exists.
+
+    Arguments:
+
+        expt: mcapi.Experiment object
+
+        proc: mcapi.Process object
+          The Simulation process
+
+        samples: list of mcapi.Sample
+          Samples the table is linked to
+
+        file_names: list of str
+          Result files; anything that is not a .vtu file is skipped
+
+        table_path: str, optional (default=vtu_stats.DEFAULT_TABLE_PATH)
+          Where the CSV table is written, relative to 'app_dir'
+
+        app_dir: str, optional (default=current working directory)
+          Directory 'file_names' and 'table_path' are relative to
+
+    Returns:
+
+        rows: list of lists, as returned by vtu_stats.compute_field_statistics
+    """
+    from prismspf_mcapi import vtu_stats
+
+    if table_path is None:
+        table_path = vtu_stats.DEFAULT_TABLE_PATH
+    table_path = os.path.join(app_dir or '', table_path)
+
+    field_names = None
+    equations_file = os.path.join(app_dir or '', 'equations.cc')
+    if os.path.isfile(equations_file):
+        field_names = [equation_information.name for equation_information in parse_equations_file(equations_file)]
+
+    rows = vtu_stats.compute_field_statistics(
+        [os.path.join(app_dir or '', name) for name in file_names if name.endswith('.vtu')], field_names)
+    vtu_stats.write_statistics_table(rows, table_path)
+
+    file_registry = get_file_registry(expt.project)
+    table_file = file_registry.add_file_by_local_path(table_path, verbose=verbose)
+    table_file.direction = 'out'
+    proc.add_files([table_file])
+    file_registry.link_files(samples, [table_file])
+
+    return rows
+
+
+@attribute_backend_calls
+def create_simulation_sample(expt, args, sample_list, process_name=None, sample_name=None, verbose=False, app_dir=None,
+                             journal=None):
     """
     Create a PRISMS-PF Simulation Sample
 
@@ -82,60 +246,384 @@ def create_simulation_sample(expt, args, sample_list, process_name=None, sample_
         verbose: bool
           Print messages about uploads, etc.
 
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory with the result files
+
+        journal: prismspf_mcapi.journal.RegistrationJournal, optional (default=None)
+          If given, each step is recorded as it completes, steps the journal
+          already records are skipped, and the journal is marked complete at the end
+
     Returns:
 
         proc: mcapi.Process instance
           The Process that created the sample
     """
+    from prismspf_mcapi.upload import make_transport, upload_result_files
+
     template_id = prismspf_mcapi.templates['simulation']
 
     print("The template ID is: " + template_id)
-    # Process that will create samples
-    proc = expt.create_process_from_template(template_id)
-
     if process_name is None:
-        proc.rename('Run Simulation')
+        process_name = 'Run Simulation'
+    if sample_name is None:
+        sample_name = "Simulation Results"
+
+    recorded = None if journal is None else journal.stage('simulation')
+    if recorded is None:
+        # Process that will create samples, committed in as few requests as possible
+        builder = ProcessBuilder(expt, template_id, process_name)
+        builder.add_input_samples(sample_list)
+        builder.add_output_sample(sample_name)
+
+        # Record the mesh and fields of the raw result files before they are bundled or compressed
+        if args.scan_results:
+            add_result_file_measurements(builder.measurements, list_app_files('*vtu', app_dir), app_dir=app_dir)
+
+        print("Creating the simulation process with " + str(len(sample_list)) + " input sample(s)...")
+        proc = builder.commit()
+        if journal is not None:
+            journal.record_stage('simulation', [proc])
+    else:
+        print("Resuming the simulation process " + recorded[0].id + " recorded in " + journal.path)
+        proc = expt.get_process_by_id(recorded[0].id)
+        proc.decorate_with_output_samples()
+    new_sample = proc.output_samples
+
+    # Summarize each field per time step, also from the raw result files
+    if args.field_statistics and (journal is None or not journal.step('field-statistics')):
+        add_field_statistics_table(expt, proc, new_sample, list_app_files('*.vtu', app_dir), verbose=verbose, app_dir=app_dir)
+        if journal is not None:
+            journal.record_step('field-statistics')
+
+    transport = make_transport(expt.project, args.upload_url)
+    compressor = make_compressor(args.compress, args.compress_level, app_dir=app_dir)
+    uploaded = {} if journal is None else journal.files()
+
+    if journal is not None and journal.step('attach-files'):
+        # An interrupted run already uploaded and attached the result files
+        vtu_file_names = sorted(uploaded)
+        result_files = [uploaded[name] for name in vtu_file_names]
     else:
-        proc.rename(process_name)
+        # Get the names of all of the *.vtu files in the app directory
+        vtu_file_names = get_result_file_names(args, app_dir)
+        print(vtu_file_names)
+        paths = [os.path.join(app_dir or '', name) for name in vtu_file_names]
+
+        # Files an interrupted run uploaded are attached without being sent again
+        on_upload = None
+        if journal is not None:
+            names = dict(zip(paths, vtu_file_names))
+            uploaded = {path: uploaded[name] for path, name in names.items() if name in uploaded}
+            on_upload = lambda path, result_file: journal.record_file(names[path], result_file)
+            if uploaded:
+                print("Skipping " + str(len(uploaded)) + " result file(s) uploaded before the registration was interrupted")
+
+        # Upload the result files in parallel, then add and link them in bulk
+        result_files = upload_result_files(proc, new_sample, paths, transport, workers=int(args.upload_workers),
+                                           chunk_size=int(args.chunk_size), compressor=compressor, verbose=verbose,
+                                           uploaded=uploaded, on_upload=on_upload)
+        if compressor is not None:
+            print(compressor.report())
+        if journal is not None:
+            journal.record_step('attach-files')
+
+    # Remember what was uploaded so later runs can send only new or changed files
+    manifest = UploadManifest(app_dir)
+    for vtu_file, result_file in zip(vtu_file_names, result_files):
+        manifest.record(proc.id, vtu_file, result_file, metadata=getattr(result_file, 'compression', None))
+    manifest.data['last_simulation_process'] = proc.id
+    manifest.save()
+
+    if journal is not None:
+        journal.complete()
+    return proc
+
+
+def make_registration_journal(expt, args, app_dir=None, restart=False):
+    """
+    Return the RegistrationJournal of a full-simulation registration of an app directory
 
-    proc = expt.get_process_by_id(proc.id)
+    The journal is resumed only if it was written for the same project,
+    experiment and backend, the same registration options, and the same
+    parameters.in and equations.cc.
 
-    print("Adding input sample(s)...")
-    for sample in sample_list:
-        sample.direction = 'in'
+    Arguments:
 
-    proc.add_input_samples_to_process(sample_list)
-    print("Finshed adding input sample(s).")
+        expt: mcapi.Experiment object
 
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory
 
-    ## Create sample
-    if sample_name is None:
-        sample_name = "Simulation Results"
-    new_sample = proc.create_samples([sample_name])
+        restart: bool, optional (default=False)
+          Start a new journal even if an interrupted one matches
+
+    Returns:
+
+        journal: prismspf_mcapi.journal.RegistrationJournal instance
+    """
+    options = {name: getattr(args, name, None) for name in JOURNAL_OPTIONS}
+    inputs = {}
+    for name in ['parameters.in', 'equations.cc']:
+        path = os.path.join(app_dir or '', name)
+        inputs[name] = cached_file_digest(path) if os.path.isfile(path) else None
+    key = {'project': expt.project.id, 'experiment': expt.id, 'backend': os.environ.get(BACKEND_ENV_VAR),
+           'options': options, 'inputs': inputs}
+    fingerprint = hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+    return RegistrationJournal(app_dir, fingerprint, restart=restart)
+
+
+def create_input_samples(expt, args, verbose=False, app_dir=None, out=None, journal=None):
+    """
+    Create the input processes of a full simulation, running the independent stages concurrently
+
+    Arguments:
+
+        expt: mcapi.Experiment object
+
+        verbose: bool
+          Print messages about uploads, etc.
+
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory
+
+        out: stream, optional (default=sys.stdout)
+          Where the output of the stages is written, in stage order
+
+        journal: prismspf_mcapi.journal.RegistrationJournal, optional (default=None)
+          If given, each stage is recorded as it completes, and a stage the
+          journal already records is not run again: the processes it created
+          are returned from the journal instead. The equations stage also
+          records each of its processes, so an interrupted one only creates
+          the missing processes when run again
+
+    Returns:
+
+        proc_lists: list of lists of mcapi.Process
+          The processes created by the numerical-parameters, model-parameters,
+          environment, equations and software stages
+
+    Raises:
+
+        prismspf_mcapi.pipeline.PipelineError: if any stage failed
+    """
+    # The stage modules are only needed here, so the simulation subcommand does not load them otherwise
+    import prismspf_mcapi.numerical_parameters
+    import prismspf_mcapi.model_parameters
+    import prismspf_mcapi.environment
+    import prismspf_mcapi.equations
+    import prismspf_mcapi.software
+
+    stages = [
+        ('numerical-parameters', lambda: [prismspf_mcapi.numerical_parameters.create_parameters_sample(expt, args, verbose=verbose, app_dir=app_dir)]),
+        ('model-parameters', lambda: [prismspf_mcapi.model_parameters.create_parameters_sample(expt, args, verbose=verbose, app_dir=app_dir)]),
+        ('environment', lambda: [prismspf_mcapi.environment.create_environment_sample(expt, args, verbose=verbose)]),
+        ('equations', lambda: prismspf_mcapi.equations.create_equations_sample(expt, args, verbose=verbose, app_dir=app_dir, journal=journal)),
+        ('software', lambda: [prismspf_mcapi.software.create_software_sample(expt, args, verbose=verbose, app_dir=app_dir)])
+    ]
+    if journal is not None:
+        stages = [(name, _journaled_stage(journal, name, create)) for name, create in stages]
+    return run_stages(stages, max_workers=int(args.max_workers), out=out)
+
+
+def _journaled_stage(journal, name, create):
+    def run():
+        procs = journal.stage(name)
+        if procs is not None:
+            print("Using the " + name + " process(es) recorded in " + journal.path)
+            return procs
+        procs = create()
+        journal.record_stage(name, procs)
+        return procs
+    return run
+
+
+def update_simulation_results(expt, args, process_id=None, verbose=False, out=sys.stdout):
+    """
+    Upload new or changed result files to an existing PRISMS-PF Simulation process
+
+    Files are compared against the local upload manifest in the app directory,
+    so only files that are new, or whose contents changed since they were
+    uploaded to the process, are sent.
+
+    Arguments:
+
+        expt: mcapi.Experiment object
+
+        process_id: str, optional (default=None)
+          Id of the Simulation process, default is the last one recorded in the manifest
+
+        verbose: bool
+          Print messages about uploads, etc.
+
+    Returns:
+
+        proc: mcapi.Process instance, or None
+          The updated Simulation process, or None if no process was given or recorded
+    """
+    from prismspf_mcapi.upload import make_transport, upload_result_files
+
+    manifest = UploadManifest()
+    if process_id is None:
+        process_id = manifest.last_simulation_process
+    if process_id is None:
+        out.write('No Simulation process is recorded in ' + manifest.path + '\n')
+        out.write('Use --simulation-id <id> to specify explicitly.\n')
+        out.write('Aborting\n')
+        return None
+
+    proc = expt.get_process_by_id(process_id)
+    proc.decorate_with_output_samples()
+
+    vtu_file_names = manifest.changed_files(process_id, get_result_file_names(args))
+    out.write('Found ' + str(len(vtu_file_names)) + ' new or changed result file(s).\n')
+
+    transport = make_transport(expt.project, args.upload_url)
+    compressor = make_compressor(args.compress, args.compress_level)
+    result_files = upload_result_files(proc, proc.output_samples, vtu_file_names, transport,
+                                       workers=int(args.upload_workers), chunk_size=int(args.chunk_size), compressor=compressor, verbose=verbose)
+    if compressor is not None:
+        out.write(compressor.report() + '\n')
+
+    for vtu_file, result_file in zip(vtu_file_names, result_files):
+        manifest.record(process_id, vtu_file, result_file, metadata=getattr(result_file, 'compression', None))
+    manifest.data['last_simulation_process'] = process_id
+    manifest.save()
+
+    return proc
+
+
+def watch_simulation_results(expt, args, proc, verbose=False, out=sys.stdout):
+    """
+    Upload result files to a PRISMS-PF Simulation process as the running simulation writes them
+
+    Each result file is uploaded and attached as soon as it is fully
+    written. Files recorded for the process in the upload manifest are
+    skipped while their size and mtime are unchanged, so a file that was
+    still being written when the process was created is uploaded again once
+    complete. Per-process files are bundled per time step as by
+    get_result_file_names, each step once its .pvtu and every piece it lists
+    are written, so the run is stored in the same layout as with --create
+    alone. Returns when the run ends (see prismspf_mcapi.watch.ResultWatcher):
+    when the --watch-pid process exits, or after --watch-timeout seconds
+    without a new file (DEFAULT_IDLE_TIMEOUT if neither option is given).
+
+    Arguments:
+
+        expt: mcapi.Experiment object
+
+        proc: mcapi.Process object
+          The Simulation process, with output_samples
+
+        verbose: bool
+          Print messages about uploads, etc.
+
+    Returns:
+
+        n: int
+          The number of files uploaded while watching
+    """
+    from prismspf_mcapi.upload import make_transport, upload_result_files
+
+    manifest = UploadManifest()
+    pid = None if args.watch_pid is None else int(args.watch_pid)
+    if args.watch_timeout is not None:
+        idle_timeout = float(args.watch_timeout)
+    else:
+        # Without a process to watch, stop once the run has been idle for a while rather than never
+        idle_timeout = DEFAULT_IDLE_TIMEOUT if pid is None else None
+    bundle, base_name = result_file_layout(args)
+    watcher = ResultWatcher(pattern=args.watch_pattern, poll_interval=float(args.watch_interval),
+                            pid=pid, idle_timeout=idle_timeout)
+
+    transport = make_transport(expt.project, args.upload_url)
+    compressor = make_compressor(args.compress, args.compress_level)
+    out.write('Watching for result files matching ' + args.watch_pattern + '...\n')
+    out.flush()
+
+    def upload(file_names):
+        if bundle:
+            file_names = bundle_per_timestep(file_names, base_name)
+        vtu_file_names = manifest.changed_files(proc.id, file_names)
+        result_files = upload_result_files(proc, proc.output_samples, vtu_file_names, transport,
+                                           workers=int(args.upload_workers), chunk_size=int(args.chunk_size), compressor=compressor, verbose=verbose)
+        for vtu_file, result_file in zip(vtu_file_names, result_files):
+            manifest.record(proc.id, vtu_file, result_file, metadata=getattr(result_file, 'compression', None))
+            out.write('Attached result file: ' + vtu_file + '\n')
+        manifest.save()
+        out.flush()
+        return len(result_files)
+
+    # Written files of time steps that are not complete yet
+    waiting = []
+    n_uploaded = 0
+    for paths in watcher.batches():
+        file_names = waiting + [os.path.relpath(path) for path in paths]
+        ready = complete_timesteps(file_names, base_name) if bundle else file_names
+        waiting = [name for name in file_names if name not in ready]
+        n_uploaded += upload(ready)
+
+    # The run is over: bundle what was written of any step left incomplete
+    if waiting:
+        n_uploaded += upload(waiting)
+
+    out.write('Simulation run finished, ' + str(n_uploaded) + ' result file(s) uploaded while watching.\n')
+    if compressor is not None:
+        out.write(compressor.report() + '\n')
+    return n_uploaded
+
+
+def add_registration_options(parser):
+    """Add the options that control how a run is registered, shared by 'simulation --create' and 'ingest'"""
+    from prismspf_mcapi.upload import DEFAULT_UPLOAD_WORKERS, DEFAULT_CHUNK_SIZE
+
+    compress_help = "Compress result files with this codec before uploading them"
+    parser.add_argument('--compress', default=None, choices=['none'] + available_codecs(), help=compress_help)
+
+    compress_level_help = "Compression level for --compress (default depends on the codec)"
+    parser.add_argument('--compress-level', default=None, help=compress_level_help)
+
+    scan_results_help = "Record the number of points and cells, field names, time step and size of each result file as measurements"
+    parser.add_argument('--scan-results', action='store_true', help=scan_results_help)
+
+    field_statistics_help = "Attach a table of the min, max, mean and L2 norm of each field per time step (requires NumPy)"
+    parser.add_argument('--field-statistics', action='store_true', help=field_statistics_help)
+
+    bundle_help = "Upload per-process result files as one compressed archive per time step (automatic if parameters.in sets 'Output separate files per process')"
+    parser.add_argument('--bundle-per-timestep', action='store_true', help=bundle_help)
 
-    # Get the names of all of the *.vtu files in the cwd
-    vtu_file_names = glob.glob('*vtu')
-    print(vtu_file_names)
+    num_cores_help = "Add the number of cores to be used in the simulation"
+    parser.add_argument('--num-cores', nargs=1, default=['-1'], help=num_cores_help)
 
-    result_files = []
-    for vtu_file in vtu_file_names:
-        result_files.append(expt.project.add_file_by_local_path(vtu_file, verbose=verbose))
+    max_workers_help = "Maximum number of input processes created at the same time with --full-simulation"
+    parser.add_argument('--max-workers', default=DEFAULT_MAX_WORKERS, help=max_workers_help)
 
-      # I need to pass in the path to the PRISMS-PF app folder
-    for file in result_files:
-        file.direction = 'out'
+    version_help = "Set the version of the software"
+    parser.add_argument('--version', nargs='*', default=None, help=version_help)
 
-    proc.add_files(result_files)
+    upload_workers_help = "Number of result files uploaded at the same time"
+    parser.add_argument('--upload-workers', default=DEFAULT_UPLOAD_WORKERS, help=upload_workers_help)
 
-    #new_sample.link_files(result_files)
-    for sample in new_sample:
-        sample.link_files(result_files)
+    chunk_size_help = "Number of bytes sent per request when uploading to --upload-url"
+    parser.add_argument('--chunk-size', default=DEFAULT_CHUNK_SIZE, help=chunk_size_help)
 
-    return expt.get_process_by_id(proc.id)
+    upload_url_help = "Upload result files to this resumable chunked upload endpoint instead of the Materials Commons project; their locations are recorded as measurements of the Simulation process"
+    parser.add_argument('--upload-url', default=None, help=upload_url_help)
+
+    pool_size_help = "Maximum number of keep-alive connections per server, shared by all requests (default: $" + http_pool.POOL_SIZE_ENV_VAR + " or " + str(http_pool.DEFAULT_POOL_SIZE) + ")"
+    parser.add_argument('--pool-size', type=int, default=None, help=pool_size_help)
+
+    backend_retries_help = "Number of times a backend call that fails transiently is retried (default: " + str(retry.DEFAULT_MAX_RETRIES) + ")"
+    parser.add_argument('--backend-retries', type=int, default=None, help=backend_retries_help)
+
+    backend_retry_delay_help = "Upper bound in seconds of the first random backoff before a retry, doubled for each further retry (default: " + str(retry.DEFAULT_BASE_DELAY) + ")"
+    parser.add_argument('--backend-retry-delay', type=float, default=None, help=backend_retry_delay_help)
+
+    restart_help = "Start a new registration even if the journal in the app directory records an interrupted one"
+    parser.add_argument('--restart', action='store_true', help=restart_help)
 
 
 class SimulationSubcommand(ListObjects):
-    desc = "(sample) PRISMS-PF Simulation"
+    desc = subcommand_desc('simulation')
 
     def __init__(self):
         super(SimulationSubcommand, self).__init__(["prismspf", "simulation"], "Simulation", "Simulations",
@@ -145,41 +633,57 @@ class SimulationSubcommand(ListObjects):
             creatable=True)
 
     def get_all_from_experiment(self, expt):
-        return [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(expt, prismspf_mcapi.templates[self.cmdname[-1]])
 
     def get_all_from_project(self, proj):
-        return [proc for proc in proj.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(proj, prismspf_mcapi.templates[self.cmdname[-1]])
 
+    @profile_backend_calls
     def create(self, args, out=sys.stdout):
-        proj = make_local_project()
-        expt = make_local_expt(proj)
+        from prismspf_mcapi import vtu_stats
+
+        if args.field_statistics and not vtu_stats.numpy_available():
+            out.write('--field-statistics requires NumPy (pip install numpy)\n')
+            return
+
+        http_pool.configure(args.pool_size)
+        retry.configure(args.backend_retries, args.backend_retry_delay)
+        metadata_cache.configure(args.refresh)
+        proj, expt = make_project_and_experiment()
+
+        if args.update_results:
+            simulation_id = None if args.simulation_id is None else args.simulation_id[0]
+            proc = update_simulation_results(expt, args, simulation_id, verbose=True, out=out)
+            if proc is not None:
+                out.write('Updated process: ' + proc.name + ' ' + proc.id + '\n')
+            return
 
         # Get the necessary input samples
         sample_list = []
 
+        journal = None
         if args.full_simulation:
+            # Steps are journaled, so running the same command again after a failure resumes where it stopped
+            journal = make_registration_journal(expt, args, restart=args.restart)
+            if journal.resumed:
+                out.write('Resuming the registration recorded in ' + journal.path + '\n')
             print("Creating input samples/processes for the simulation....")
 
-            proc = prismspf_mcapi.numerical_parameters.create_parameters_sample(expt, args, verbose=True)
-            out.write('Created process: ' + proc.name + ' ' + proc.id + '\n')
-            sample_list.extend(proc.output_samples)
-
-            proc = prismspf_mcapi.model_parameters.create_parameters_sample(expt, args, verbose=True)
-            out.write('Created process: ' + proc.name + ' ' + proc.id + '\n')
-            sample_list.extend(proc.output_samples)
-
-            proc = prismspf_mcapi.environment.create_environment_sample(expt, args, verbose=True)
-            out.write('Created process: ' + proc.name + ' ' + proc.id + '\n')
-            sample_list.extend(proc.output_samples)
-
-            proc_list = prismspf_mcapi.equations.create_equations_sample(expt, args, verbose=True)
-            for p in proc_list:
-                out.write('Created process: ' + p.name + ' ' + p.id + '\n')
-                sample_list.extend(p.output_samples)
-
-            proc = prismspf_mcapi.software.create_software_sample(expt, args, verbose=True)
-            out.write('Created process: ' + proc.name + ' ' + proc.id + '\n')
-            sample_list.extend(proc.output_samples)
+            try:
+                stage_results = create_input_samples(expt, args, verbose=True, out=out, journal=journal)
+            except PipelineError as err:
+                for proc_list in err.results:
+                    for p in proc_list or []:
+                        out.write('Created process: ' + p.name + ' ' + p.id + '\n')
+                for name, stage_err in err.failures:
+                    out.write('Failed to create the ' + name + ' process: ' + str(stage_err) + '\n')
+                out.write('Aborting; run the same command again to resume\n')
+                raise
+
+            for proc_list in stage_results:
+                for p in proc_list:
+                    out.write('Created process: ' + p.name + ' ' + p.id + '\n')
+                    sample_list.extend(p.output_samples)
 
             out.write('List of samples created as inputs for the simulation sample:\n')
             for s in sample_list:
@@ -188,16 +692,10 @@ class SimulationSubcommand(ListObjects):
 
         else:
             for sample_id in args.input_sample_ids:
-                sample_found = False
-                for proc in expt.get_all_processes():
-                    for sample in proc.get_all_samples():
-                        if sample.id == sample_id:
-                            # print("Sample found with id of: ", sample.id)
-                            matching_sample = sample
-                            sample_found = True
-                            break
-                    if sample_found:
-                        break
+                matching_sample = get_sample_by_id(expt, sample_id, out)
+                if matching_sample is None:
+                    out.write('Aborting\n')
+                    return
                 sample_list.append(matching_sample)
 
         # parameters_sample = get_parameters_sample(expt, args.input_sample_ids[0], out)
@@ -212,20 +710,40 @@ class SimulationSubcommand(ListObjects):
         else:
             samp_name = " ".join(args.samp_name)
 
-        proc = create_simulation_sample(expt, args, sample_list, proc_name, samp_name, verbose=True)
+        proc = create_simulation_sample(expt, args, sample_list, proc_name, samp_name, verbose=True, journal=journal)
         out.write('Created process: ' + proc.name + ' ' + proc.id + '\n')
 
+        if args.watch:
+            watch_simulation_results(expt, args, proc, verbose=True, out=out)
+
 
     def add_create_options(self, parser):
 
         full_simulation_help = "Create the simulation process as well as all of the necessary input samples and processes"
         parser.add_argument('--full-simulation', action='store_true', help=full_simulation_help)
 
-        num_cores_help = "Add the number of cores to be used in the simulation"
-        parser.add_argument('--num-cores', nargs=1, default=-1, help=num_cores_help)
+        update_results_help = "Upload only new or changed result files and attach them to an existing simulation process"
+        parser.add_argument('--update-results', action='store_true', help=update_results_help)
+
+        simulation_id_help = "Simulation process to update with --update-results (default: the last one created from this directory)"
+        parser.add_argument('--simulation-id', nargs=1, default=None, help=simulation_id_help)
+
+        add_registration_options(parser)
+
+        watch_help = "After creating the simulation process, keep uploading result files as they are written until the run ends"
+        parser.add_argument('--watch', action='store_true', help=watch_help)
 
-        version_help = "Set the version of the software"
-        parser.add_argument('--version', nargs='*', default=None, help=version_help)
+        watch_pid_help = "With --watch, stop when the simulation process with this id exits"
+        parser.add_argument('--watch-pid', default=None, help=watch_pid_help)
+
+        watch_timeout_help = "With --watch, stop after this many seconds without a new result file (default: " + str(int(DEFAULT_IDLE_TIMEOUT)) + " without --watch-pid)"
+        parser.add_argument('--watch-timeout', default=None, help=watch_timeout_help)
+
+        watch_interval_help = "With --watch, seconds between checks of the app directory"
+        parser.add_argument('--watch-interval', default=DEFAULT_POLL_INTERVAL, help=watch_interval_help)
+
+        watch_pattern_help = "With --watch, pattern of the result files to upload"
+        parser.add_argument('--watch-pattern', default=DEFAULT_PATTERN, help=watch_pattern_help)
 
         input_id_help = "Specify in sample ids explicitly"
         parser.add_argument('--input-sample-ids', nargs='*', default=None, help=input_id_help)
@@ -236,6 +754,11 @@ class SimulationSubcommand(ListObjects):
         process_name_help = "Set the name of the process"
         parser.add_argument('--proc-name', nargs='*', default=None, help=process_name_help)
 
+        profile_help = "Write a Chrome trace of every backend call to this file and print a per-operation latency summary"
+        parser.add_argument('--profile', default=None, help=profile_help)
+
+        metadata_cache.add_refresh_option(parser)
+
         return
 
     def list_data(self, obj):
@@ -4,8 +4,14 @@ import sys
 import os.path
 import subprocess
 import prismspf_mcapi
+from prismspf_mcapi.lookup import get_sample_by_id, get_processes_by_template
+from prismspf_mcapi.process_builder import ProcessBuilder
 from materials_commons.cli import ListObjects
-from materials_commons.cli.functions import make_local_project, make_local_expt
+from prismspf_mcapi.backend import make_project_and_experiment
+from prismspf_mcapi.main import subcommand_desc
+from prismspf_mcapi.profiling import profile_backend_calls, attribute_backend_calls
+from prismspf_mcapi import metadata_cache
+from materials_commons.cli.functions import _trunc_name, _format_mtime
 
 
 def get_software_sample(expt, sample_id=None, out=sys.stdout):
@@ -28,7 +34,7 @@ def get_software_sample(expt, sample_id=None, out=sys.stdout):
 
     """
     if sample_id is None:
-        candidate_software = [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates['software']]
+        candidate_software = get_processes_by_template(expt, prismspf_mcapi.templates['software'])
         if len(candidate_software) == 0:
             out.write('Did not find a Software sample.\n')
             out.write('Use \'mc prismspf software --create\' to create a Software sample, or --parameters-id <id> to specify explicitly.\n')
@@ -45,27 +51,14 @@ def get_software_sample(expt, sample_id=None, out=sys.stdout):
         software_proc.decorate_with_output_samples()
         return software_proc.output_samples[0]
     else:
-        # print("The sample id is: ")
-        # print(sample_id[0])
-
-        # This is broken, temporarily replaced by a more complicated work-around
-        # software = expt.get_sample_by_id(sample_id)
-
-        sample_found = False
-        for proc in expt.get_all_processes():
-            for sample in proc.get_all_samples():
-                if sample.id == sample_id[0]:
-                    # print("Sample found with id of: ", sample.id)
-                    software = sample
-                    sample_found = True
-                    break
-            if sample_found:
-                break
+        # expt.get_sample_by_id(sample_id) is broken, so use the shared sample index instead
+        software = get_sample_by_id(expt, sample_id[0], out)
 
     return software
 
 
-def create_software_sample(expt, args, process_name=None, sample_name=None, verbose=False):
+@attribute_backend_calls
+def create_software_sample(expt, args, process_name=None, sample_name=None, verbose=False, app_dir=None):
     """
     Create a PRISMS-PF Software Sample
 
@@ -81,6 +74,9 @@ def create_software_sample(expt, args, process_name=None, sample_name=None, verb
         verbose: bool
           Print messages about uploads, etc.
 
+        app_dir: str, optional (default=current working directory)
+          The PRISMS-PF app directory the app name, version and git hash are taken from
+
     Returns:
 
         proc: mcapi.Process instance
@@ -89,66 +85,58 @@ def create_software_sample(expt, args, process_name=None, sample_name=None, verb
     template_id = prismspf_mcapi.templates['software']
 
     print("The template ID is: " + template_id)
-    ## Process that will create samples
-    proc = expt.create_process_from_template(template_id)
-
     if process_name is None:
-        proc.rename('Set Software')
-    else:
-        proc.rename(process_name)
-
-
-    ## Create sample
+        process_name = 'Set Software'
     if sample_name is None:
         sample_name = "Software"
-    new_sample = proc.create_samples([sample_name])
 
-    proc = expt.get_process_by_id(proc.id)
+    ## Process that will create samples, committed at the end in as few requests as possible
+    builder = ProcessBuilder(expt, template_id, process_name)
+    builder.add_output_sample(sample_name)
+
+    measurements = builder.measurements
 
     # Add the appropriate attributes
 
     # Assume for now that PRISMS-PF is the software being used
-    proc.add_string_measurement('Simulation Software Name', 'PRISMS-PF')
+    measurements.add_string('Simulation Software Name', 'PRISMS-PF')
 
     # Get the name of the current app (assumed to be the name of the current directory)
-    app_name = os.path.basename(os.getcwd())
-    proc.add_string_measurement('Simulation Software App Name', app_name)
+    app_name = os.path.basename(os.path.abspath(app_dir or os.getcwd()))
+    measurements.add_string('Simulation Software App Name', app_name)
 
     # Get the version
     if args.version is None:
-        if (os.path.isfile('version')):
-            with open('version') as f:
+        if (os.path.isfile(os.path.join(app_dir or '', 'version'))):
+            with open(os.path.join(app_dir or '', 'version')) as f:
                 version = f.read()
             f.closed
-        elif (os.path.isfile('../../version')):
-            with open('../../version') as f:
+        elif (os.path.isfile(os.path.join(app_dir or '', '../../version'))):
+            with open(os.path.join(app_dir or '', '../../version')) as f:
                 version = f.read()
             f.closed
         else:
-            print('Did not find the \'version\' file where expected (two directories up from the current working directory). The version is being uploaded as \'unknown\'.\n')
+            print('Did not find the \'version\' file where expected (two directories up from the app directory). The version is being uploaded as \'unknown\'.\n')
             version = 'unknown'
     else:
         version = args.version
 
-    proc.add_string_measurement('Simulation Software Version', version)
+    measurements.add_string('Simulation Software Version', version)
 
     # Get the Git hash (if available)
     try:
-        git_hash = subprocess.check_output(["git", "rev-parse", "HEAD"]).strip()
+        git_hash = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=app_dir, stderr=subprocess.DEVNULL).strip()
     except subprocess.CalledProcessError:
         print('Did not find git information connected to this project. The git hash is being uploaded as \'unknown\'.\n')
         git_hash = 'unknown'
 
-    proc.add_string_measurement('Simulation Software Git Hash', git_hash)
-
-    # new_sample[0].pretty_print(shift=0, indent=2, out=sys.stdout)
-
+    measurements.add_string('Simulation Software Git Hash', git_hash)
 
-    return expt.get_process_by_id(proc.id)
+    return builder.commit()
 
 
 class SoftwareSubcommand(ListObjects):
-    desc = "(sample) PRISMS-PF Software"
+    desc = subcommand_desc('software')
 
     def __init__(self):
         super(SoftwareSubcommand, self).__init__(["prismspf", "software"], "Software", "Softwares",
@@ -158,14 +146,15 @@ class SoftwareSubcommand(ListObjects):
             creatable=True)
 
     def get_all_from_experiment(self, expt):
-        return [proc for proc in expt.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(expt, prismspf_mcapi.templates[self.cmdname[-1]])
 
     def get_all_from_project(self, proj):
-        return [proc for proc in proj.get_all_processes() if proc.template_id == prismspf_mcapi.templates[self.cmdname[-1]]]
+        return get_processes_by_template(proj, prismspf_mcapi.templates[self.cmdname[-1]])
 
+    @profile_backend_calls
     def create(self, args, out=sys.stdout):
-        proj = make_local_project()
-        expt = make_local_expt(proj)
+        metadata_cache.configure(args.refresh)
+        proj, expt = make_project_and_experiment()
 
         if args.proc_name is None:
             proc_name = None
@@ -191,6 +180,11 @@ class SoftwareSubcommand(ListObjects):
         process_name_help = "Set the name of the process"
         parser.add_argument('--proc-name', nargs='*', default=None, help=process_name_help)
 
+        profile_help = "Write a Chrome trace of every backend call to this file and print a per-operation latency summary"
+        parser.add_argument('--profile', default=None, help=profile_help)
+
+        metadata_cache.add_refresh_option(parser)
+
         return
 
     def list_data(self, obj):
@@ -0,0 +1,346 @@
+"""
+Parallel upload of simulation result files: whole files to the Materials
+Commons project, or chunked and resumable to a separate upload endpoint
+"""
+
+import os
+import sys
+import json
+import time
+from urllib.parse import urlsplit
+from prismspf_mcapi.file_registry import get_file_registry, cached_file_digest
+from prismspf_mcapi.http_pool import get_connection_pool
+from prismspf_mcapi import worker_pool
+from prismspf_mcapi.measurements import MeasurementBatch
+from prismspf_mcapi.retry import backoff_delay, get_retry_policy, is_transient
+
+# Default number of files uploaded at the same time
+DEFAULT_UPLOAD_WORKERS = 4
+
+# Default number of bytes sent per request by chunked transports
+DEFAULT_CHUNK_SIZE = 8 << 20
+
+# Default number of times a failed upload is resumed before giving up
+DEFAULT_MAX_RETRIES = 3
+
+
+def _status_error(action, status):
+    """Return the IOError for an unexpected HTTP status, transient for 5xx statuses"""
+    err = IOError(action + ' failed with HTTP status ' + str(status))
+    err.transient = status >= 500
+    return err
+
+
+class UploadedFile(object):
+    """
+    Record of a file stored by an upload endpoint other than Materials Commons.
+
+    Its 'id' is the endpoint's, not a Materials Commons file id, so it must
+    not be passed to proc.add_files or sample.link_files; 'url' is where the
+    endpoint stores the file.
+    """
+
+    def __init__(self, id, name, path=None, size=None, direction=None, url=None):
+        self.id = id
+        self.name = name
+        self.path = path
+        self.size = size
+        self.direction = direction
+        self.url = url
+
+
+class ProjectTransport(object):
+    """
+    Uploads whole files through mcapi.Project.add_file_by_local_path.
+
+    Materials Commons does not accept partial transfers, so files are sent
+    whole and a failed upload restarts the file from the beginning. It is
+    not resumable: an upload is one write through the backend's
+    RetryPolicy, which retries it only when that cannot create a second
+    copy of the file. Files already uploaded during the invocation are
+    reused through the shared FileRegistry.
+
+    Arguments:
+
+        project: mcapi.Project object
+    """
+
+    resumable = False
+    registers_files = True
+
+    def __init__(self, project):
+        self.registry = get_file_registry(project)
+
+    def upload(self, path, chunk_size=DEFAULT_CHUNK_SIZE, verbose=False):
+        return self.registry.add_file_by_local_path(path, verbose=verbose)
+
+
+class ChunkedHTTPTransport(object):
+    """
+    Uploads files in fixed-size chunks to a resumable upload endpoint.
+
+    The upload id of a file is the SHA-256 of its contents, so an interrupted
+    upload of an unchanged file continues from the offset the server already
+    holds, even from a later invocation. The protocol is:
+
+        HEAD  <url>/<upload id>           -> 'Upload-Offset' header (404 if unknown)
+        PATCH <url>/<upload id>           'Upload-Offset', 'Upload-Length' and
+                                          'Upload-Name' headers, chunk as body
+                                          -> 'Upload-Offset' header
+        POST  <url>/<upload id>/complete  -> JSON file record with 'id' and 'name'
+
+    prismspf_mcapi.upload_server implements this protocol for local testing.
+
+    The files are not Materials Commons files: upload returns UploadedFile
+    records, which upload_result_files records as measurements of the
+    process instead of attaching them.
+
+    Requests go through the shared keep-alive ConnectionPool of the endpoint's
+    host (see prismspf_mcapi.http_pool), so every transport, upload worker and
+    ingested run of one invocation reuses the same connections.
+
+    Arguments:
+
+        url: str
+          Base URL of the upload endpoint, e.g. http://localhost:8000/uploads
+
+        pool: prismspf_mcapi.http_pool.ConnectionPool, optional (default=the shared pool for 'url')
+    """
+
+    resumable = True
+    registers_files = False
+
+    def __init__(self, url, pool=None):
+        self.url = url.rstrip('/')
+        self.base_path = urlsplit(url).path.rstrip('/')
+        self.pool = pool if pool is not None else get_connection_pool(url)
+
+    def _request(self, method, path, body=None, headers=None):
+        return self.pool.request(method, self.base_path + path, body=body, headers=headers)
+
+    def offset(self, upload_id):
+        """Return the number of bytes the server already holds for 'upload_id'"""
+        response, _ = self._request('HEAD', '/' + upload_id)
+        if response.status == 404:
+            return 0
+        if response.status != 200:
+            raise _status_error('Upload offset query', response.status)
+        return int(response.getheader('Upload-Offset', 0))
+
+    def upload(self, path, chunk_size=DEFAULT_CHUNK_SIZE, verbose=False):
+        size = os.path.getsize(path)
+        name = os.path.basename(path)
+        upload_id = cached_file_digest(path)
+
+        offset = self.offset(upload_id)
+        if verbose and offset > 0:
+            print('Resuming upload of ' + name + ' at byte ' + str(offset))
+
+        with open(path, 'rb') as f:
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+                headers = {
+                    'Upload-Offset': str(offset),
+                    'Upload-Length': str(size),
+                    'Upload-Name': name,
+                    'Content-Type': 'application/offset+octet-stream'}
+                response, _ = self._request('PATCH', '/' + upload_id, body=chunk, headers=headers)
+                if response.status not in (200, 204, 409):
+                    raise _status_error('Upload of ' + name, response.status)
+                # 409 means the server holds a different offset, continue from there
+                offset = int(response.getheader('Upload-Offset', offset + len(chunk)))
+
+        response, data = self._request('POST', '/' + upload_id + '/complete', body=b'', headers={'Upload-Name': name})
+        if response.status != 200:
+            raise _status_error('Completing upload of ' + name, response.status)
+        record = json.loads(data.decode('utf-8'))
+        if verbose:
+            print('Uploaded ' + name)
+        return UploadedFile(record['id'], record.get('name', name), path=path, size=size,
+                            url=record.get('url', self.url + '/' + upload_id))
+
+
+class UploadEngine(object):
+    """
+    Uploads many files concurrently on a bounded thread pool.
+
+    With a resumable transport, a file whose upload fails transiently (see
+    prismspf_mcapi.retry.is_transient) is resumed with jittered exponential
+    backoff (see prismspf_mcapi.retry.backoff_delay), counted as 'upload'
+    retries in the shared RetryPolicy's statistics. Chunked transports resume
+    from the server's offset, so only the missing bytes are sent again. Other
+    transports are not retried here, their backend calls already are.
+
+    Arguments:
+
+        transport: ProjectTransport or ChunkedHTTPTransport
+
+        workers: int, optional (default=DEFAULT_UPLOAD_WORKERS)
+          Number of files uploaded at the same time
+
+        chunk_size: int, optional (default=DEFAULT_CHUNK_SIZE)
+          Bytes per request for chunked transports
+
+        max_retries: int, optional (default=DEFAULT_MAX_RETRIES)
+          Number of times a failed file upload is resumed by a resumable transport
+
+        retry_delay: float, optional (default=1.0)
+          Upper bound in seconds of the random delay before the first retry,
+          doubled for each further retry
+
+        compressor: prismspf_mcapi.compression.StreamCompressor, optional (default=None)
+          If given, files are compressed by the upload worker before they are
+          sent, and the uploaded file object gets a 'compression' attribute
+          holding the codec and original size. The compressed copy is
+          deleted once sent.
+    """
+
+    def __init__(self, transport, workers=DEFAULT_UPLOAD_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+                 max_retries=DEFAULT_MAX_RETRIES, retry_delay=1.0, compressor=None):
+        self.transport = transport
+        self.workers = max(1, int(workers))
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_retries = max(0, int(max_retries)) if getattr(transport, 'resumable', False) else 0
+        self.retry_delay = retry_delay
+        self.compressor = compressor
+
+    def _upload_one(self, path, verbose):
+        if self.compressor is None or not self.compressor.should_compress(path):
+            return self._upload_with_retries(path, verbose)
+
+        compression = self.compressor.compress_file(path)
+        try:
+            uploaded = self._upload_with_retries(compression.path, verbose)
+        finally:
+            compression.remove()
+        uploaded.compression = compression.metadata()
+        return uploaded
+
+    def _upload_with_retries(self, path, verbose):
+        attempt = 0
+        while True:
+            try:
+                return self.transport.upload(path, chunk_size=self.chunk_size, verbose=verbose)
+            except (IOError, OSError) as err:
+                if attempt >= self.max_retries or not is_transient(err):
+                    raise
+                delay = backoff_delay(attempt, self.retry_delay)
+                get_retry_policy().record_retry('upload', delay)
+                attempt += 1
+                sys.stderr.write('Upload of ' + path + ' failed (' + str(err) + '), retrying in {:.2f} s\n'.format(delay))
+                time.sleep(delay)
+
+    def upload(self, paths, verbose=False, on_upload=None):
+        """
+        Upload local files.
+
+        Arguments:
+
+            paths: list of str
+              Paths to the local files
+
+            verbose: bool
+              Print messages about uploads
+
+            on_upload: callable, optional (default=None)
+              Called as on_upload(path, file_obj) by the upload worker as soon
+              as each file is uploaded
+
+        Returns:
+
+            files: list
+              The uploaded file objects, in the same order as 'paths'
+        """
+        if len(paths) == 0:
+            return []
+
+        def upload_one(path):
+            uploaded = self._upload_one(path, verbose)
+            if on_upload is not None:
+                on_upload(path, uploaded)
+            return uploaded
+
+        return worker_pool.map_items(upload_one, paths, max_workers=self.workers)
+
+
+def make_transport(project, upload_url=None):
+    """Return a ChunkedHTTPTransport for 'upload_url', or a ProjectTransport if it is None"""
+    if upload_url is None:
+        return ProjectTransport(project)
+    return ChunkedHTTPTransport(upload_url)
+
+
+def upload_result_files(proc, samples, paths, transport, workers=DEFAULT_UPLOAD_WORKERS,
+                        chunk_size=DEFAULT_CHUNK_SIZE, direction='out', compressor=None, verbose=False,
+                        uploaded=None, on_upload=None):
+    """
+    Upload result files in parallel, then attach them to a process and its samples in bulk.
+
+    Files stored outside Materials Commons (by a ChunkedHTTPTransport) are
+    not attached, as they have no Materials Commons file id. Their location
+    is added to the process as a measurement named '<file name>: Location'
+    instead. The codec and original size of each file that was compressed
+    are added as measurements named '<file name>: Compression codec' and
+    '<file name>: Original size', so the files can be restored.
+
+    Arguments:
+
+        proc: mcapi.Process object
+
+        samples: list of mcapi.Sample
+          Samples the files are linked to
+
+        paths: list of str
+          Paths to the local files
+
+        transport: ProjectTransport or ChunkedHTTPTransport
+
+        direction: str, optional (default='out')
+          Direction of the files relative to the process
+
+        compressor: prismspf_mcapi.compression.StreamCompressor, optional (default=None)
+          Compress files before uploading them
+
+        uploaded: dict, optional (default=None)
+          {path: file object} of files in 'paths' that were already uploaded
+          (e.g. by an interrupted run); they are attached without being sent again
+
+        on_upload: callable, optional (default=None)
+          See UploadEngine.upload
+
+    Returns:
+
+        files: list
+          The uploaded file objects, in the same order as 'paths'
+    """
+    uploaded = uploaded or {}
+    new_paths = [path for path in paths if path not in uploaded]
+    engine = UploadEngine(transport, workers=workers, chunk_size=chunk_size, compressor=compressor)
+    new_files = dict(zip(new_paths, engine.upload(new_paths, verbose=verbose, on_upload=on_upload)))
+    files = [uploaded[path] if path in uploaded else new_files[path] for path in paths]
+    if len(files) == 0:
+        return files
+
+    for f in files:
+        f.direction = direction
+
+    measurements = MeasurementBatch(proc)
+    if getattr(transport, 'registers_files', True):
+        proc.add_files(files)
+        for sample in samples:
+            sample.link_files(files)
+    else:
+        for path, f in zip(paths, files):
+            measurements.add_string(os.path.basename(path) + ': Location', f.url)
+
+    for path, f in zip(paths, files):
+        compression = getattr(f, 'compression', None)
+        if compression:
+            name = os.path.basename(path)
+            measurements.add_string(name + ': Compression codec', compression['codec'])
+            measurements.add_integer(name + ': Original size', compression['original_size'])
+    if len(measurements):
+        measurements.commit()
+
+    return files
@@ -0,0 +1,157 @@
+"""Local stand-in server for the resumable chunked upload protocol
+
+Implements the protocol used by prismspf_mcapi.upload.ChunkedHTTPTransport so
+that uploads can be exercised and timed without Materials Commons:
+
+    python -m prismspf_mcapi.upload_server --root /tmp/uploads --port 8000
+
+and then, from a PRISMS-PF app directory:
+
+    mc prismspf simulation --create ... --upload-url http://localhost:8000/uploads
+"""
+
+import os
+import json
+import shutil
+import argparse
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class UploadRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately, so without TCP_NODELAY a
+    # keep-alive client stalls on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # Called once per connection, not per request
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+        if self.server.connect_delay > 0:
+            time.sleep(self.server.connect_delay)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _parse_path(self):
+        parts = [p for p in self.path.split('/') if p]
+        if len(parts) < 2 or parts[0] != 'uploads':
+            return None, None
+        return parts[1], parts[2] if len(parts) > 2 else None
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.server.root, upload_id + '.part')
+
+    def _reply(self, status, headers=None, body=b''):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        upload_id, _ = self._parse_path()
+        if upload_id is None:
+            return self._reply(404)
+        part = self._part_path(upload_id)
+        if not os.path.exists(part):
+            return self._reply(404)
+        self._reply(200, {'Upload-Offset': str(os.path.getsize(part))})
+
+    def do_PATCH(self):
+        upload_id, _ = self._parse_path()
+        length = int(self.headers.get('Content-Length', 0))
+        data = self.rfile.read(length)
+        if upload_id is None:
+            return self._reply(404)
+
+        part = self._part_path(upload_id)
+        with self.server.lock:
+            current = os.path.getsize(part) if os.path.exists(part) else 0
+            offset = int(self.headers.get('Upload-Offset', 0))
+            if offset != current:
+                return self._reply(409, {'Upload-Offset': str(current)})
+            with open(part, 'ab') as f:
+                f.write(data)
+            self.server.bytes_received += len(data)
+        self._reply(204, {'Upload-Offset': str(current + len(data))})
+
+    def do_POST(self):
+        upload_id, action = self._parse_path()
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if upload_id is None or action != 'complete':
+            return self._reply(404)
+
+        name = os.path.basename(self.headers.get('Upload-Name', upload_id))
+        part = self._part_path(upload_id)
+        final = os.path.join(self.server.root, upload_id + '-' + name)
+        with self.server.lock:
+            if os.path.exists(part):
+                shutil.move(part, final)
+            elif not os.path.exists(final):
+                # An empty file never receives a PATCH
+                open(final, 'wb').close()
+        record = {'id': upload_id, 'name': name, 'size': os.path.getsize(final)}
+        self._reply(200, {'Content-Type': 'application/json'}, json.dumps(record).encode('utf-8'))
+
+
+def make_server(root, host='127.0.0.1', port=0, verbose=False, connect_delay=0.0):
+    """
+    Create (but do not start) a stand-in upload server.
+
+    Arguments:
+
+        root: str
+          Directory partial and completed uploads are stored in
+
+        port: int, optional (default=0)
+          Port to listen on, 0 picks a free port (see server.server_address)
+
+        connect_delay: float, optional (default=0)
+          Seconds each new connection waits before its first request is
+          read, standing in for TCP and TLS handshake round trips
+
+    Returns:
+
+        server: http.server.ThreadingHTTPServer instance
+    """
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    server = ThreadingHTTPServer((host, port), UploadRequestHandler)
+    server.root = root
+    server.verbose = verbose
+    server.lock = threading.Lock()
+    server.bytes_received = 0
+    server.connections = 0
+    server.connect_delay = connect_delay
+    return server
+
+
+def start_server(root, host='127.0.0.1', port=0, verbose=False, connect_delay=0.0):
+    """Start a stand-in upload server on a background thread and return it with its base URL"""
+    server = make_server(root, host, port, verbose, connect_delay)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = 'http://' + server.server_address[0] + ':' + str(server.server_address[1]) + '/uploads'
+    return server, url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in server for prismspf_mcapi chunked uploads')
+    parser.add_argument('--root', default='uploads', help='Directory uploads are stored in')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--connect-delay', type=float, default=0.0, help='Seconds added to each new connection, to stand in for handshakes')
+    args = parser.parse_args()
+
+    server = make_server(args.root, args.host, args.port, verbose=True, connect_delay=args.connect_delay)
+    print('Serving uploads from ' + os.path.abspath(args.root) + ' at http://' + args.host + ':' + str(args.port) + '/uploads')
+    server.serve_forever()
@@ -0,0 +1,260 @@
+"""Streaming inspection of VTK XML (.vtu/.pvtu) result file headers"""
+
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from prismspf_mcapi.file_registry import stat_key
+
+# Number of bytes read at a time while scanning a file
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+# Scan files in a process pool when there are at least this many
+PROCESS_POOL_THRESHOLD = 64
+
+_attribute_pattern = re.compile(r'([\w:]+)\s*=\s*"([^"]*)"')
+_tag_name_pattern = re.compile(r'</?\s*([\w:]+)')
+_time_step_pattern = re.compile(r'-(\d+)(?:\.\d+)?\.p?vtu$')
+
+# Sections whose DataArrays are field variables
+_FIELD_SECTIONS = {'PointData': 'point', 'CellData': 'cell', 'PPointData': 'point', 'PCellData': 'cell'}
+
+# stat_key(path) -> VTUHeader, so an unchanged file is scanned once per invocation
+_headers = {}
+_headers_lock = threading.Lock()
+
+
+class DataArrayInfo(object):
+    """
+    Declaration of one DataArray, without its values.
+
+    Attributes:
+
+        name, type, format, number_of_components: from the DataArray attributes
+
+        section: str
+          'point', 'cell', or the name of the enclosing element (e.g. 'Points', 'Cells')
+
+        offset: int or None
+          For format="appended", the 'offset' attribute (relative to the appended data)
+
+        content_start, content_end: int or None
+          Byte range of the inline (ascii or binary) values in the file
+    """
+
+    def __init__(self, attributes, section, content_start=None):
+        self.attributes = attributes
+        self.name = attributes.get('Name', '')
+        self.type = attributes.get('type', '')
+        self.format = attributes.get('format', 'ascii')
+        self.number_of_components = int(attributes.get('NumberOfComponents', 1))
+        self.section = section
+        self.offset = int(attributes['offset']) if 'offset' in attributes else None
+        self.content_start = content_start
+        self.content_end = None
+
+
+class VTUHeader(object):
+    """
+    Metadata from the XML structure of a .vtu or .pvtu file.
+
+    Attributes:
+
+        path, file_size, time_step (int or None, from the file name)
+
+        file_type: str
+          'UnstructuredGrid' or 'PUnstructuredGrid'
+
+        header_type, byte_order, compressor: from the VTKFile element
+
+        number_of_points, number_of_cells: int, summed over all pieces (0 for .pvtu)
+
+        number_of_pieces: int
+
+        data_arrays: list of DataArrayInfo
+
+        appended_encoding: str or None
+          Encoding of the AppendedData element, if present
+
+        appended_data_start: int or None
+          Byte position of the first appended byte (after the '_' marker)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file_size = os.path.getsize(path)
+        match = _time_step_pattern.search(os.path.basename(path))
+        self.time_step = int(match.group(1)) if match is not None else None
+        self.file_type = None
+        self.header_type = 'UInt32'
+        self.byte_order = 'LittleEndian'
+        self.compressor = None
+        self.number_of_points = 0
+        self.number_of_cells = 0
+        self.number_of_pieces = 0
+        self.data_arrays = []
+        self.appended_encoding = None
+        self.appended_data_start = None
+
+    @property
+    def point_fields(self):
+        return [a.name for a in self.data_arrays if a.section == 'point']
+
+    @property
+    def cell_fields(self):
+        return [a.name for a in self.data_arrays if a.section == 'cell']
+
+    @property
+    def field_names(self):
+        return self.point_fields + [name for name in self.cell_fields if name not in self.point_fields]
+
+
+def _iter_tags(f, block_size):
+    """
+    Yield (tag text, start position, end position) for every tag in a file.
+
+    Only tag text is kept in memory. Text between tags (the inline values of
+    DataArrays) is skipped block by block.
+    """
+    buffer = b''
+    buffer_start = 0
+    while True:
+        lt = buffer.find(b'<')
+        if lt < 0:
+            buffer_start += len(buffer)
+            buffer = f.read(block_size)
+            if not buffer:
+                return
+            continue
+        gt = buffer.find(b'>', lt)
+        while gt < 0:
+            block = f.read(block_size)
+            if not block:
+                return
+            buffer += block
+            gt = buffer.find(b'>', lt)
+        yield buffer[lt:gt + 1].decode('utf-8', 'replace'), buffer_start + lt, buffer_start + gt + 1
+        buffer_start += gt + 1
+        buffer = buffer[gt + 1:]
+
+
+def scan_vtu(path, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Read the structure of a .vtu or .pvtu file without decoding any field values.
+
+    Scanning stops at the AppendedData element, so for appended files only the
+    XML header is read. For inline files the values are skipped, not stored.
+
+    Arguments:
+
+        path: str
+
+        block_size: int, optional (default=DEFAULT_BLOCK_SIZE)
+
+    Returns:
+
+        header: VTUHeader instance
+    """
+    header = VTUHeader(path)
+    sections = []
+    open_array = None
+
+    with open(path, 'rb') as f:
+        for tag, start, end in _iter_tags(f, block_size):
+            if tag.startswith('<?') or tag.startswith('<!'):
+                continue
+            match = _tag_name_pattern.match(tag)
+            if match is None:
+                continue
+            name = match.group(1)
+
+            if tag.startswith('</'):
+                if name == 'DataArray' and open_array is not None:
+                    open_array.content_end = start
+                    open_array = None
+                elif sections and sections[-1] == name:
+                    sections.pop()
+                continue
+
+            attributes = dict(_attribute_pattern.findall(tag))
+            self_closing = tag.endswith('/>')
+
+            if name == 'VTKFile':
+                header.file_type = attributes.get('type')
+                header.header_type = attributes.get('header_type', header.header_type)
+                header.byte_order = attributes.get('byte_order', header.byte_order)
+                header.compressor = attributes.get('compressor')
+            elif name == 'Piece':
+                header.number_of_pieces += 1
+                header.number_of_points += int(attributes.get('NumberOfPoints', 0))
+                header.number_of_cells += int(attributes.get('NumberOfCells', 0))
+            elif name in ('DataArray', 'PDataArray'):
+                enclosing = sections[-1] if sections else ''
+                info = DataArrayInfo(attributes, _FIELD_SECTIONS.get(enclosing, enclosing),
+                                     content_start=None if self_closing else end)
+                header.data_arrays.append(info)
+                if name == 'DataArray' and not self_closing:
+                    open_array = info
+                continue
+            elif name == 'AppendedData':
+                header.appended_encoding = attributes.get('encoding', 'raw')
+                # The appended bytes start after the '_' marker that follows the tag
+                f.seek(end)
+                lead = f.read(256)
+                marker = lead.find(b'_')
+                if marker >= 0:
+                    header.appended_data_start = end + marker + 1
+                break
+
+            if not self_closing:
+                sections.append(name)
+
+    return header
+
+
+def scan_vtu_files(paths, processes=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Scan many .vtu/.pvtu files, in a process pool when there are enough of them.
+
+    Headers are memoized by path, size and mtime, so only new or changed
+    files are read.
+
+    Arguments:
+
+        paths: list of str
+
+        processes: int, optional (default=None)
+          Size of the process pool (default: number of CPUs). Use 1 to scan in
+          the current process.
+
+    Returns:
+
+        headers: list of VTUHeader, in the same order as 'paths'
+    """
+    keys = [stat_key(path) for path in paths]
+    with _headers_lock:
+        pending = [(path, key) for path, key in zip(paths, keys) if key not in _headers]
+
+    pending_paths = [path for path, _ in pending]
+    if processes == 1 or len(pending) < PROCESS_POOL_THRESHOLD:
+        scanned = [scan_vtu(path, block_size) for path in pending_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            scanned = list(executor.map(scan_vtu, pending_paths, [block_size] * len(pending), chunksize=16))
+
+    add_vtu_headers({key: header for (_, key), header in zip(pending, scanned)})
+    with _headers_lock:
+        return [_headers[key] for key in keys]
+
+
+def add_vtu_headers(headers):
+    """
+    Remember headers scanned elsewhere, e.g. in a worker process.
+
+    Arguments:
+
+        headers: dict
+          prismspf_mcapi.file_registry.stat_key(path) -> VTUHeader
+    """
+    with _headers_lock:
+        _headers.update(headers)
@@ -0,0 +1,218 @@
+"""Per-field summary statistics of VTU result files, computed with NumPy"""
+
+import os
+import csv
+import zlib
+import base64
+import mmap
+import importlib.util
+from prismspf_mcapi.vtu import scan_vtu
+
+# VTK type name -> NumPy type code
+VTK_TYPES = {
+    'Int8': 'i1', 'UInt8': 'u1', 'Int16': 'i2', 'UInt16': 'u2',
+    'Int32': 'i4', 'UInt32': 'u4', 'Int64': 'i8', 'UInt64': 'u8',
+    'Float32': 'f4', 'Float64': 'f8'}
+
+# Where the time-series table is written, relative to the app directory
+DEFAULT_TABLE_PATH = os.path.join('.prismspf_mcapi', 'field_statistics.csv')
+
+# Columns of the time-series table
+STATISTICS_COLUMNS = ['time_step', 'field', 'count', 'min', 'max', 'mean', 'l2_norm']
+
+
+def numpy_available():
+    return importlib.util.find_spec('numpy') is not None
+
+
+def _numpy():
+    """Return the numpy module, imported on first use so that commands not computing statistics do not load it"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Field statistics require NumPy (pip install numpy).")
+    return numpy
+
+
+def _dtype(vtk_type, byte_order):
+    np = _numpy()
+    return np.dtype(('<' if byte_order == 'LittleEndian' else '>') + VTK_TYPES[vtk_type])
+
+
+def _decode_compressed_blocks(header_ints, payload):
+    """Decompress vtkZLibDataCompressor blocks; header_ints is [nblocks, blocksize, lastsize, sizes...]"""
+    n_blocks = int(header_ints[0])
+    pieces = []
+    position = 0
+    for size in header_ints[3:3 + n_blocks]:
+        pieces.append(zlib.decompress(payload[position:position + int(size)]))
+        position += int(size)
+    return b''.join(pieces)
+
+
+def _decode_base64(header, text, dtype):
+    """Decode an inline base64 binary DataArray"""
+    np = _numpy()
+    header_dtype = _dtype(header.header_type, header.byte_order)
+    text = b''.join(text.split())
+    if header.compressor is None:
+        raw = base64.b64decode(text)
+        return np.frombuffer(raw, dtype=dtype, offset=header_dtype.itemsize)
+
+    # The compression header is encoded separately from the data
+    first = np.frombuffer(base64.b64decode(text[:4 * ((3 * header_dtype.itemsize + 2) // 3)])[:header_dtype.itemsize], dtype=header_dtype)
+    header_size = (3 + int(first[0])) * header_dtype.itemsize
+    header_chars = 4 * ((header_size + 2) // 3)
+    header_ints = np.frombuffer(base64.b64decode(text[:header_chars])[:header_size], dtype=header_dtype)
+    raw = _decode_compressed_blocks(header_ints, base64.b64decode(text[header_chars:]))
+    return np.frombuffer(raw, dtype=dtype)
+
+
+def _decode_appended_raw(header, array, dtype):
+    """Memory-map (uncompressed) or decompress one array from raw appended data"""
+    np = _numpy()
+    header_dtype = _dtype(header.header_type, header.byte_order)
+    start = header.appended_data_start + array.offset
+    with open(header.path, 'rb') as f:
+        f.seek(start)
+        if header.compressor is None:
+            n_bytes = int(np.frombuffer(f.read(header_dtype.itemsize), dtype=header_dtype)[0])
+            return np.memmap(header.path, dtype=dtype, mode='r', offset=start + header_dtype.itemsize,
+                             shape=(n_bytes // dtype.itemsize,))
+        first = np.frombuffer(f.read(3 * header_dtype.itemsize), dtype=header_dtype)
+        sizes = np.frombuffer(f.read(int(first[0]) * header_dtype.itemsize), dtype=header_dtype)
+        payload = f.read(int(sizes.sum()))
+    return np.frombuffer(_decode_compressed_blocks(np.concatenate([first, sizes]), payload), dtype=dtype)
+
+
+def read_data_array(header, array):
+    """
+    Decode one DataArray of a scanned VTU file into a NumPy array.
+
+    Supports format="ascii", inline format="binary" (base64, optionally zlib
+    compressed) and format="appended" with raw encoding (memory-mapped when
+    uncompressed) or base64 encoding.
+
+    Arguments:
+
+        header: prismspf_mcapi.vtu.VTUHeader
+
+        array: prismspf_mcapi.vtu.DataArrayInfo
+          One of header.data_arrays
+
+    Returns:
+
+        values: numpy.ndarray, shape (n,) or (n, number_of_components)
+    """
+    np = _numpy()
+    dtype = _dtype(array.type, header.byte_order)
+
+    if array.format == 'appended':
+        if header.appended_encoding == 'raw':
+            values = _decode_appended_raw(header, array, dtype)
+        else:
+            with open(header.path, 'rb') as f:
+                f.seek(header.appended_data_start + array.offset)
+                # Read up to the next array (or the end of the appended section)
+                following = [a.offset for a in header.data_arrays if a.offset is not None and a.offset > array.offset]
+                text = f.read(min(following) - array.offset) if following else f.read()
+            values = _decode_base64(header, text.split(b'<')[0], dtype)
+    else:
+        with open(header.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                text = mm[array.content_start:array.content_end]
+        if array.format == 'ascii':
+            values = np.fromstring(text.decode('ascii'), dtype=dtype, sep=' ')
+        else:
+            values = _decode_base64(header, text, dtype)
+
+    if array.number_of_components > 1:
+        values = values.reshape(-1, array.number_of_components)
+    return values
+
+
+class FieldAccumulator(object):
+    """Running count, sum, sum of squares, min and max of one field over one time step"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, values):
+        np = _numpy()
+        if values.ndim > 1:
+            # Vector fields are summarized by their magnitude
+            values = np.sqrt(np.einsum('ij,ij->i', values, values, dtype=np.float64))
+        else:
+            values = values.astype(np.float64, copy=False)
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.total += float(values.sum())
+        self.total_squares += float(np.dot(values, values))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def row(self):
+        mean = self.total / self.count if self.count else float('nan')
+        return [self.count, self.min, self.max, mean, self.total_squares ** 0.5]
+
+
+def compute_field_statistics(paths, field_names=None):
+    """
+    Compute per-time-step min, max, mean and L2 norm of each field.
+
+    Files are processed one array at a time, so peak memory is bounded by the
+    largest single array. Files of the same time step (e.g. one per MPI
+    process) are combined.
+
+    Arguments:
+
+        paths: list of str
+          .vtu files; .pvtu index files hold no data and are skipped
+
+        field_names: list of str, optional (default=None)
+          Fields to summarize, e.g. the variable names from equations.cc. All
+          point and cell fields are summarized if None.
+
+    Returns:
+
+        rows: list of lists
+          One row per (time step, field), with the columns in STATISTICS_COLUMNS,
+          sorted by time step and field
+    """
+    _numpy()
+    accumulators = {}
+    for path in paths:
+        if not path.endswith('.vtu'):
+            continue
+        header = scan_vtu(path)
+        time_step = header.time_step if header.time_step is not None else os.path.basename(path)
+        for array in header.data_arrays:
+            if array.section not in ('point', 'cell'):
+                continue
+            if field_names is not None and array.name not in field_names:
+                continue
+            accumulator = accumulators.setdefault((time_step, array.name), FieldAccumulator())
+            accumulator.add(read_data_array(header, array))
+
+    rows = []
+    for (time_step, name) in sorted(accumulators, key=lambda key: (str(type(key[0])), key[0], key[1])):
+        rows.append([time_step, name] + accumulators[(time_step, name)].row())
+    return rows
+
+
+def write_statistics_table(rows, path):
+    """Write the time-series table from compute_field_statistics as CSV"""
+    out_dir = os.path.dirname(path)
+    if out_dir and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(STATISTICS_COLUMNS)
+        for row in rows:
+            writer.writerow([row[0], row[1], row[2]] + ['{:.9g}'.format(value) for value in row[3:]])
+    return path
@@ -0,0 +1,164 @@
+"""Watch a PRISMS-PF app directory for result files while the simulation runs"""
+
+import os
+import sys
+import time
+import fnmatch
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+# Default seconds between checks of the app directory
+DEFAULT_POLL_INTERVAL = 2.0
+
+# Default number of consecutive checks a file's size must be unchanged before it is considered written
+DEFAULT_STABLE_CHECKS = 2
+
+# Default seconds without a new result file after which a run watched without a pid is considered finished
+DEFAULT_IDLE_TIMEOUT = 600.0
+
+# Default result file pattern, the .vtu and .pvtu files 'simulation --create' uploads
+DEFAULT_PATTERN = '*vtu'
+
+
+def process_is_running(pid):
+    """Return True if a process with id 'pid' exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ResultWatcher(object):
+    """
+    Reports result files in an app directory once they are fully written.
+
+    With inotify (the optional 'inotify_simple' package, Linux only), a file is
+    ready as soon as the writer closes it. Otherwise the directory is polled
+    and a file is ready once its size and mtime are unchanged for
+    'stable_checks' consecutive polls.
+
+    Watching ends when the simulation process 'pid' exits, when no new file
+    has appeared for 'idle_timeout' seconds, or on KeyboardInterrupt. Files
+    still pending at that point are reported in a final batch.
+
+    Arguments:
+
+        app_dir: str, optional (default=current working directory)
+
+        pattern: str, optional (default=DEFAULT_PATTERN)
+          fnmatch pattern of the result files
+
+        poll_interval: float, optional (default=DEFAULT_POLL_INTERVAL)
+
+        stable_checks: int, optional (default=DEFAULT_STABLE_CHECKS)
+
+        pid: int, optional (default=None)
+          Process id of the running simulation
+
+        idle_timeout: float, optional (default=None)
+          Seconds without a new file after which the run is considered finished
+
+        use_inotify: bool, optional (default=True)
+          Use inotify if it is available
+    """
+
+    def __init__(self, app_dir=None, pattern=DEFAULT_PATTERN, poll_interval=DEFAULT_POLL_INTERVAL,
+                 stable_checks=DEFAULT_STABLE_CHECKS, pid=None, idle_timeout=None, use_inotify=True):
+        if app_dir is None:
+            app_dir = os.getcwd()
+        self.app_dir = app_dir
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.stable_checks = max(1, int(stable_checks))
+        self.pid = pid
+        self.idle_timeout = idle_timeout
+        self.seen = set()
+        self._pending = {}
+        self._last_new_file = time.time()
+
+        self._inotify = None
+        if use_inotify and INotify is not None:
+            self._inotify = INotify()
+            self._inotify.add_watch(app_dir, inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE)
+
+    def _matches(self, name):
+        return fnmatch.fnmatch(name, self.pattern) and name not in self.seen
+
+    def _poll(self):
+        """Return files whose size and mtime have been stable for enough polls"""
+        ready = []
+        for name in sorted(os.listdir(self.app_dir)):
+            if not self._matches(name):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.app_dir, name))
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous, count = self._pending.get(name, (None, 0))
+            if name not in self._pending:
+                self._last_new_file = time.time()
+            count = count + 1 if signature == previous else 0
+            if count >= self.stable_checks:
+                ready.append(name)
+            else:
+                self._pending[name] = (signature, count)
+        return ready
+
+    def _read_inotify(self):
+        """Return files closed after writing, and record newly created ones as pending"""
+        ready = []
+        for event in self._inotify.read(timeout=int(self.poll_interval * 1000)):
+            if not self._matches(event.name):
+                continue
+            if event.mask & (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO):
+                if event.name not in ready:
+                    ready.append(event.name)
+            elif event.name not in self._pending:
+                self._pending[event.name] = (None, 0)
+                self._last_new_file = time.time()
+        return ready
+
+    def _finished(self):
+        if self.pid is not None and not process_is_running(self.pid):
+            return True
+        if self.idle_timeout is not None and not self._pending and time.time() - self._last_new_file > self.idle_timeout:
+            return True
+        return False
+
+    def _take(self, names):
+        for name in names:
+            self.seen.add(name)
+            self._pending.pop(name, None)
+        self._last_new_file = time.time() if names else self._last_new_file
+        return [os.path.join(self.app_dir, name) for name in names]
+
+    def batches(self):
+        """
+        Yield lists of paths of newly completed result files until the run ends.
+        """
+        try:
+            while not self._finished():
+                if self._inotify is not None:
+                    ready = self._read_inotify()
+                else:
+                    time.sleep(self.poll_interval)
+                    ready = self._poll()
+                if ready:
+                    yield self._take(ready)
+        except KeyboardInterrupt:
+            sys.stderr.write('Watch interrupted, uploading remaining files\n')
+
+        # The run is over, so everything left is complete
+        remaining = sorted(name for name in os.listdir(self.app_dir) if self._matches(name))
+        if remaining:
+            yield self._take(remaining)
+
+        if self._inotify is not None:
+            self._inotify.close()
@@ -0,0 +1,172 @@
+"""One bounded pool of worker threads shared by every concurrent step of an invocation"""
+
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Environment variable with the number of worker threads
+POOL_SIZE_ENV_VAR = 'PRISMSPF_MCAPI_WORKERS'
+
+# Default number of worker threads
+DEFAULT_POOL_SIZE = 16
+
+# Pool size set with configure(), or None to use the environment variable or default
+_pool_size = None
+
+# The shared executor, once created, and the number of threads it has
+_executor = None
+_executor_size = None
+_executor_lock = threading.Lock()
+
+
+def configure(pool_size=None):
+    """Set the number of worker threads of the shared pool; takes effect for work submitted from now on"""
+    global _pool_size
+    _pool_size = None if pool_size is None else max(1, int(pool_size))
+
+
+def pool_size():
+    """Return the configured number of worker threads"""
+    if _pool_size is not None:
+        return _pool_size
+    return max(1, int(os.environ.get(POOL_SIZE_ENV_VAR, DEFAULT_POOL_SIZE)))
+
+
+def _shared_executor():
+    global _executor, _executor_size
+    size = pool_size()
+    with _executor_lock:
+        if _executor is None or _executor_size != size:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='prismspf_mcapi')
+            _executor_size = size
+        return _executor
+
+
+def in_current_context(fn):
+    """
+    Return a function that runs 'fn' in a copy of the current context.
+
+    Work run by map_items() is wrapped with it, so it sees the context
+    variables of the code that started it, e.g. the subcommand its backend
+    calls are attributed to (see prismspf_mcapi.profiling) and where its
+    output is captured (see prismspf_mcapi.pipeline.thread_output).
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+class _Task(object):
+    """Work queued on the shared executor that whichever thread claims it first runs, exactly once"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self._claimed = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self):
+        """Run the task unless another thread claimed it; return whether this thread ran it"""
+        with self._lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+        try:
+            self.fn()
+        finally:
+            self._done.set()
+        return True
+
+    def wait(self):
+        """Run the task in this thread if no worker started it yet, otherwise wait for it to finish"""
+        if not self.run():
+            self._done.wait()
+
+
+def map_items(fn, items, max_workers=None, return_exceptions=False):
+    """
+    Call 'fn' on every item on the shared pool, at most 'max_workers' at a time, and return the results in order.
+
+    The calling thread works on the items too, and waits only for items a
+    worker already started. Work queued by a worker that is itself running an
+    item (e.g. the samples of a process created by one stage of a pipeline)
+    therefore never waits for a free worker, so nested calls cannot deadlock
+    however small the pool, and the number of threads stays bounded by the
+    pool size over the whole invocation.
+
+    Every item is processed even if some fail.
+
+    Arguments:
+
+        fn: callable
+          Called as fn(item), in a copy of the caller's context
+
+        items: iterable
+          Consumed lazily, one item at a time, by whichever thread is free;
+          it may block, e.g. to yield work as it becomes ready
+
+        max_workers: int, optional (default=pool_size())
+          Maximum number of items processed at the same time by this call
+
+        return_exceptions: bool, optional (default=False)
+          Return the exception raised for an item in place of its result,
+          instead of raising the first one
+
+    Returns:
+
+        results: list
+          fn(item) for each item, in the order of 'items'
+    """
+    lanes = max(1, int(max_workers)) if max_workers is not None else pool_size()
+    if hasattr(items, '__len__'):
+        lanes = min(lanes, len(items))
+        if lanes == 0:
+            return []
+
+    iterator = iter(items)
+    iterator_lock = threading.Lock()
+    count = [0]
+    results = {}
+    errors = {}
+    call = in_current_context(fn)
+
+    def lane():
+        while True:
+            with iterator_lock:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                index = count[0]
+                count[0] += 1
+            try:
+                results[index] = call(item)
+            except Exception as err:
+                errors[index] = err
+
+    tasks = [_Task(lane) for _ in range(lanes)]
+    if lanes > 1:
+        executor = _shared_executor()
+        for task in tasks[1:]:
+            executor.submit(task.run)
+    for task in tasks:
+        task.wait()
+
+    n = count[0]
+    if return_exceptions:
+        return [errors[i] if i in errors else results[i] for i in range(n)]
+    for i in range(n):
+        if i in errors:
+            raise errors[i]
+    return [results[i] for i in range(n)]
+
+
+def call_all(calls, max_workers=None, return_exceptions=False):
+    """Call every function of 'calls' without arguments on the shared pool (see map_items()) and return the results in order"""
+    return map_items(lambda call: call(), calls, max_workers=max_workers, return_exceptions=return_exceptions)
@@ -0,0 +1,74 @@
+import os
+import tarfile
+
+import pytest
+
+from prismspf_mcapi.bundling import (
+    DEFAULT_BUNDLE_DIR, bundle_per_timestep, complete_timesteps, find_timestep_groups, pvtu_pieces)
+
+PVTU = """<?xml version="1.0"?>
+<VTKFile type="PUnstructuredGrid" version="0.1" byte_order="LittleEndian">
+  <PUnstructuredGrid GhostLevel="0">
+    {pieces}
+  </PUnstructuredGrid>
+</VTKFile>
+"""
+
+
+def write_step(app_dir, step, n_ranks, base_name='solution', written=None):
+    """Write the .pvtu of a time step and the per-process files in 'written' (default: all of them)"""
+    pieces = ['{}-{}.{}.vtu'.format(base_name, step, rank) for rank in range(n_ranks)]
+    with open(os.path.join(app_dir, '{}-{}.pvtu'.format(base_name, step)), 'w') as f:
+        f.write(PVTU.format(pieces='\n    '.join('<Piece Source="{}"/>'.format(p) for p in pieces)))
+    for piece in pieces if written is None else written:
+        with open(os.path.join(app_dir, piece), 'w') as f:
+            f.write('<VTKFile type="UnstructuredGrid"/>\n')
+    return pieces
+
+
+@pytest.fixture
+def app_dir(tmp_path):
+    return str(tmp_path)
+
+
+def test_per_rank_files_are_grouped_with_their_pvtu_by_step():
+    file_names = ['solution-000100.10.vtu', 'solution-000100.pvtu', 'solution-000100.2.vtu',
+                  'solution-000200.0.vtu', 'solution-000200.pvtu', 'solution-000300.vtu',
+                  'other-000100.0.vtu', 'integratedFields.txt']
+    assert find_timestep_groups(file_names) == {
+        # The .pvtu first, then the ranks in numeric order
+        '000100': ['solution-000100.pvtu', 'solution-000100.2.vtu', 'solution-000100.10.vtu'],
+        '000200': ['solution-000200.pvtu', 'solution-000200.0.vtu']}
+    assert find_timestep_groups(file_names, base_name='other') == {'000100': ['other-000100.0.vtu']}
+
+
+def test_pvtu_pieces(app_dir):
+    pieces = write_step(app_dir, '000100', 3)
+    assert pvtu_pieces(os.path.join(app_dir, 'solution-000100.pvtu')) == pieces
+
+
+def test_bundle_per_timestep(app_dir):
+    write_step(app_dir, '000100', 2)
+    write_step(app_dir, '000200', 2)
+    file_names = sorted(os.listdir(app_dir)) + ['solution-000300.vtu']
+    open(os.path.join(app_dir, 'solution-000300.vtu'), 'w').close()
+
+    paths = bundle_per_timestep(file_names, app_dir=app_dir)
+    assert paths == [os.path.join(DEFAULT_BUNDLE_DIR, 'solution-000100.tar.gz'),
+                     os.path.join(DEFAULT_BUNDLE_DIR, 'solution-000200.tar.gz'),
+                     'solution-000300.vtu']
+    with tarfile.open(os.path.join(app_dir, paths[0])) as tar:
+        assert tar.getnames() == ['solution-000100.pvtu', 'solution-000100.0.vtu', 'solution-000100.1.vtu']
+
+    # Unchanged members: the bundle is reused
+    mtime = os.path.getmtime(os.path.join(app_dir, paths[0]))
+    bundle_per_timestep(file_names, app_dir=app_dir)
+    assert os.path.getmtime(os.path.join(app_dir, paths[0])) == mtime
+
+
+def test_complete_timesteps(app_dir):
+    pieces = write_step(app_dir, '000100', 2)
+    write_step(app_dir, '000200', 3, written=['solution-000200.0.vtu'])
+    file_names = sorted(os.listdir(app_dir)) + ['solution-000300.vtu']
+    # In the order given, without the step whose per-process files are not all written yet
+    assert complete_timesteps(file_names, app_dir=app_dir) == pieces + ['solution-000100.pvtu', 'solution-000300.vtu']
@@ -0,0 +1,63 @@
+import bz2
+import gzip
+import lzma
+import os
+
+import pytest
+
+from prismspf_mcapi.compression import StreamCompressor, available_codecs, make_compressor
+
+CONTENTS = b'<VTKFile type="UnstructuredGrid">\n' + b'0.25 0.5 0.75 1.0\n' * 5000
+
+
+def decompress(codec, data):
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'bz2':
+        return bz2.decompress(data)
+    if codec == 'lzma':
+        return lzma.decompress(data)
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'solution-000100.vtu'
+    path.write_bytes(CONTENTS)
+    return str(path)
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_round_trip(codec, path, tmp_path):
+    # A small block size, so the file is compressed in many blocks
+    compressor = StreamCompressor(codec, block_size=1000, app_dir=str(tmp_path))
+    result = compressor.compress_file(path)
+    with open(result.path, 'rb') as f:
+        assert decompress(codec, f.read()) == CONTENTS
+
+    assert result.metadata() == {'codec': codec, 'level': compressor.level, 'original_size': len(CONTENTS)}
+    assert result.compressed_size == os.path.getsize(result.path) < len(CONTENTS)
+    assert (compressor.n_files, compressor.original_bytes) == (1, len(CONTENTS))
+    result.remove()
+    assert not os.path.exists(result.path)
+
+
+def test_compressed_files_are_skipped(tmp_path):
+    compressor = StreamCompressor('gzip', app_dir=str(tmp_path))
+    assert not compressor.should_compress(str(tmp_path / 'solution-000100.tar.gz'))
+    assert compressor.should_compress(str(tmp_path / 'solution-000100.vtu'))
+    assert compressor.n_skipped == 1
+
+
+def test_file_outside_the_app_directory_is_rejected(tmp_path, path):
+    compressor = StreamCompressor('gzip', app_dir=str(tmp_path / 'app'))
+    with pytest.raises(ValueError):
+        compressor.compress_file(path)
+
+
+def test_make_compressor():
+    assert make_compressor(None) is None
+    assert make_compressor('none') is None
+    with pytest.raises(ValueError):
+        make_compressor('rar')
@@ -0,0 +1,75 @@
+import pytest
+
+from prismspf_mcapi.equations_dot_h_parser import parse_equations_file, strip_comments
+
+EQUATIONS_CC = """
+// =================================================================================
+// Set the attributes of the primary field variables
+// =================================================================================
+void variableAttributeLoader::loadVariableAttributes(){
+    // Variable 0
+    set_variable_name                (0,"c");
+    set_variable_type                (0,SCALAR);
+    set_variable_equation_type       (0,EXPLICIT_TIME_DEPENDENT);
+
+    // Variable 1
+    set_variable_name(1, "u"); set_variable_type(1, VECTOR);
+    set_variable_equation_type(1,TIME_INDEPENDENT);   // trailing comment
+
+    /* Variable 2 was removed:
+    set_variable_name                (2,"old");
+    set_variable_type                (2,SCALAR);
+    */
+    set_variable_name (3 , "mu") ; /* inline */ set_variable_equation_type(3,AUXILIARY);
+    // set_variable_name(4, "commented out");
+}
+"""
+
+
+@pytest.fixture
+def equations(tmp_path):
+    path = tmp_path / 'equations.cc'
+    path.write_text(EQUATIONS_CC)
+    return parse_equations_file(str(path))
+
+
+def test_variables_in_order_of_first_appearance(equations):
+    assert [e.index for e in equations] == ['0', '1', '3']
+
+
+def test_attributes(equations):
+    assert [(e.name, e.type, e.equation_type) for e in equations] == [
+        ('c', 'SCALAR', 'EXPLICIT_TIME_DEPENDENT'),
+        ('u', 'VECTOR', 'TIME_INDEPENDENT'),
+        # Attributes that are not set keep their defaults
+        ('mu', 'SCALAR', 'AUXILIARY')]
+
+
+def test_statements_in_comments_are_ignored(equations):
+    assert all(e.name not in ('old', 'commented out') for e in equations)
+
+
+@pytest.mark.parametrize('line, in_block_comment, expected', [
+    ('code // comment\n', False, ('code ', False)),
+    ('a /* b */ c /* d */ e\n', False, ('a  c  e\n', False)),
+    ('a /* b\n', False, ('a ', True)),
+    ('still comment\n', True, ('', True)),
+    ('end */ code // more\n', True, (' code ', False)),
+    ('url = "http:" /* x */\n', False, ('url = "http:" \n', False)),
+])
+def test_strip_comments(line, in_block_comment, expected):
+    assert strip_comments(line, in_block_comment) == expected
+
+
+def test_large_generated_file(tmp_path):
+    n = 5000
+    lines = []
+    for i in range(n):
+        lines.append('set_variable_name({0}, "n{0}"); /* variable {0} */'.format(i))
+        lines.append('set_variable_type({0}, SCALAR); // order parameter'.format(i))
+        lines.append('set_variable_equation_type({0}, EXPLICIT_TIME_DEPENDENT);'.format(i))
+    path = tmp_path / 'equations.cc'
+    path.write_text('\n'.join(lines))
+    equations = parse_equations_file(str(path))
+    assert len(equations) == n
+    assert (equations[-1].index, equations[-1].name) == (str(n - 1), 'n' + str(n - 1))
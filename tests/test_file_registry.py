@@ -0,0 +1,72 @@
+import os
+import threading
+
+import pytest
+
+from prismspf_mcapi.file_registry import FileRegistry
+from prismspf_mcapi.local_backend import LocalStore
+
+
+@pytest.fixture
+def store():
+    return LocalStore(latency=0.01)
+
+
+@pytest.fixture
+def project(store, tmp_path):
+    return store.project(str(tmp_path))
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'parameters.in'
+    path.write_text('set Number of dimensions = 2\n')
+    return str(path)
+
+
+def test_one_upload_per_path_and_contents(store, project, path):
+    registry = FileRegistry(project)
+    files = []
+
+    def add():
+        files.append(registry.add_file_by_local_path(path))
+
+    threads = [threading.Thread(target=add) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.calls['add_file_by_local_path'] == 1
+    assert len(set(f.id for f in files)) == 1
+
+    # Another path to the same file is the same key
+    relative = os.path.relpath(path)
+    assert registry.add_file_by_local_path(relative).id == files[0].id
+    assert store.calls['add_file_by_local_path'] == 1
+
+    # Changed contents are uploaded again
+    with open(path, 'a') as f:
+        f.write('set Number of outputs = 10\n')
+    assert registry.add_file_by_local_path(path).id != files[0].id
+    assert store.calls['add_file_by_local_path'] == 2
+
+
+def test_each_caller_gets_its_own_file_object(project, path):
+    registry = FileRegistry(project)
+    first = registry.add_file_by_local_path(path)
+    first.direction = 'in'
+    second = registry.add_file_by_local_path(path)
+    assert second.id == first.id
+    assert second.direction is None
+
+
+def test_links_are_made_once(store, project, path):
+    registry = FileRegistry(project)
+    expt = project.experiment()
+    samples = expt.create_process_from_template('template').create_samples(['a', 'b'])
+    f = registry.add_file_by_local_path(path)
+
+    registry.link_files(samples, [f])
+    registry.link_files(samples, [f])
+    assert store.calls['link_files'] == 2
+    assert [sample.get_linked_files() for sample in samples] == [[f.id], [f.id]]
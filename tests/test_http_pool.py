@@ -0,0 +1,49 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from prismspf_mcapi import http_pool
+
+requests = pytest.importorskip('requests')
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def session(monkeypatch):
+    # share_api_session replaces requests.request; put it back afterwards
+    monkeypatch.setattr(requests, 'request', requests.request)
+    monkeypatch.setattr(requests.api, 'request', requests.api.request)
+    monkeypatch.setattr(http_pool, '_session', None)
+    monkeypatch.setattr(http_pool, '_session_counts', {})
+    return http_pool.share_api_session()
+
+
+def test_api_session_reports_connection_reuse(session, url):
+    for i in range(5):
+        assert requests.get(url).text == 'ok'
+    [stats] = http_pool.connection_stats()
+    assert stats['host'] == url[len('http://'):-1]
+    assert (stats['requests'], stats['connections_opened'], stats['reused']) == (5, 1, 4)
@@ -0,0 +1,77 @@
+import argparse
+import io
+
+import pytest
+
+# The ingest command registers runs with the simulation subcommand's functions
+pytest.importorskip('materials_commons')
+
+from prismspf_mcapi import ingest
+from prismspf_mcapi.backend import ConnectionLimiter
+from prismspf_mcapi.ingest import RunResult, find_run_dirs, register_run_with_retries, write_summary
+from prismspf_mcapi.pipeline import PipelineError
+
+
+@pytest.fixture
+def args():
+    return argparse.Namespace(retries=2, retry_delay=0.0)
+
+
+def flaky_register_run(failures):
+    """A register_run that fails with the next exception in 'failures' until there are none left"""
+    failures = list(failures)
+
+    def register_run(app_dir, args, limiter, result):
+        print('attempt ' + str(result.attempts))
+        if failures:
+            raise failures.pop(0)
+        result.processes = 6
+        result.simulation_id = 'sim-' + app_dir
+    return register_run
+
+
+def test_run_is_retried_until_it_succeeds(monkeypatch, args):
+    monkeypatch.setattr(ingest, 'register_run', flaky_register_run([IOError('timed out'), IOError('timed out')]))
+    result = register_run_with_retries('run_1', args, ConnectionLimiter(2), RunResult('run_1'))
+    assert (result.status, result.attempts, result.error) == ('ok', 3, None)
+    assert (result.processes, result.simulation_id) == (6, 'sim-run_1')
+    # Only the output of the last attempt is kept
+    assert result.log == 'attempt 3\n'
+
+
+def test_run_fails_once_the_retries_are_used_up(monkeypatch, args):
+    stage_failure = PipelineError([None, 'ok'], [('software', ValueError('no git repository'))])
+    monkeypatch.setattr(ingest, 'register_run', flaky_register_run([IOError('timed out')] * 2 + [stage_failure]))
+    result = register_run_with_retries('run_1', args, ConnectionLimiter(2), RunResult('run_1'))
+    assert (result.status, result.attempts) == ('failed', 3)
+    assert result.error == "software: ValueError('no git repository')"
+    assert result.simulation_id is None
+
+
+def test_summary(monkeypatch):
+    ok = RunResult('sweep/run_1')
+    ok.status, ok.attempts, ok.processes, ok.simulation_id = 'ok', 2, 6, 'sim-1'
+    failed = RunResult('sweep/run_2')
+    failed.attempts, failed.error = 3, "IOError('timed out')"
+    skipped = RunResult('sweep/run_3')
+    skipped.status, skipped.error = 'skipped', 'missing equations.cc'
+    monkeypatch.setattr(ingest.http_pool, 'connection_stats', lambda: [])
+
+    out = io.StringIO()
+    write_summary([ok, failed, skipped], ConnectionLimiter(4), 1.5, out)
+    lines = out.getvalue().splitlines()
+    assert lines[1].split()[:4] == ['run', 'status', 'attempts', 'prepare']
+    assert lines[2].split() == ['sweep/run_1', 'ok', '2', '0.00', '0.00', '6', 'sim-1']
+    assert lines[3].split()[:2] == ['sweep/run_2', 'failed'] and lines[3].endswith("IOError('timed out')")
+    assert lines[4].endswith('missing equations.cc')
+    assert lines[6] == '1 failed, 1 ok, 1 skipped of 3 run(s) in 1.50 s'
+    assert lines[7].startswith('0 backend call(s) over at most 4 connection(s)')
+
+
+def test_find_run_dirs(tmp_path):
+    for name in ('run_2', 'run_1', 'run_10'):
+        (tmp_path / name).mkdir()
+    (tmp_path / 'run_3.log').write_text('')
+    pattern = str(tmp_path / 'run_*')
+    assert find_run_dirs([pattern, str(tmp_path / 'run_1'), str(tmp_path / 'missing')]) == [
+        str(tmp_path / name) for name in ('run_1', 'run_10', 'run_2')]
@@ -0,0 +1,127 @@
+import json
+import os
+
+import pytest
+
+from prismspf_mcapi.journal import RegistrationJournal, JOURNAL_FILE_NAME
+from prismspf_mcapi.local_backend import LocalStore
+from prismspf_mcapi.process_builder import ProcessBuilder, commit_all
+
+
+class Obj(object):
+    """A backend process, sample or file with the given attributes"""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class FlakyExperiment(object):
+    """A local experiment whose create_process fails for the templates in 'failing'"""
+
+    def __init__(self, expt, failing):
+        self.expt = expt
+        self.failing = set(failing)
+        self.project = expt.project
+
+    def create_process(self, template_id, **kwargs):
+        if template_id in self.failing:
+            raise IOError('create_process failed: ' + template_id)
+        return self.expt.create_process(template_id, **kwargs)
+
+
+@pytest.fixture
+def store():
+    return LocalStore()
+
+
+@pytest.fixture
+def expt(store, tmp_path):
+    return store.project(str(tmp_path)).experiment()
+
+
+def builders(expt, templates):
+    result = []
+    for template_id in templates:
+        builder = ProcessBuilder(expt, template_id, name=template_id + ' process')
+        builder.add_output_sample(template_id + ' sample')
+        result.append(builder)
+    return result
+
+
+def n_processes(store):
+    return len(store.query('SELECT id FROM processes'))
+
+
+def test_stages_steps_and_files_survive_a_restart(tmp_path):
+    journal = RegistrationJournal(str(tmp_path), fingerprint='abc')
+    assert not journal.resumed
+    journal.record_stage('software', [Obj(id='p1', name='Set Software', output_samples=[Obj(id='s1', name='software')])])
+    journal.record_step('simulation_process', 'p9')
+    journal.record_file('solution.vtu', Obj(id='f1', name='solution.vtu', compression='gzip'))
+
+    resumed = RegistrationJournal(str(tmp_path), fingerprint='abc')
+    assert resumed.resumed
+    [proc] = resumed.stage('software')
+    assert (proc.id, proc.name) == ('p1', 'Set Software')
+    assert [(s.id, s.name) for s in proc.output_samples] == [('s1', 'software')]
+    assert resumed.stage('equations') is None
+    assert resumed.step('simulation_process') == 'p9'
+    record = resumed.files()['solution.vtu']
+    assert (record.id, record.name, record.compression) == ('f1', 'solution.vtu', 'gzip')
+
+
+@pytest.mark.parametrize('fingerprint, restart', [('other', False), ('abc', True)])
+def test_journal_is_not_resumed_for_another_registration_or_on_restart(tmp_path, fingerprint, restart):
+    RegistrationJournal(str(tmp_path), fingerprint='abc').record_step('created')
+    journal = RegistrationJournal(str(tmp_path), fingerprint=fingerprint, restart=restart)
+    assert not journal.resumed
+    assert journal.step('created') is None
+
+
+def test_completed_journal_is_not_resumed(tmp_path):
+    journal = RegistrationJournal(str(tmp_path), fingerprint='abc')
+    journal.record_step('created')
+    journal.complete()
+    with open(os.path.join(str(tmp_path), JOURNAL_FILE_NAME)) as f:
+        assert json.load(f)['complete']
+    assert not RegistrationJournal(str(tmp_path), fingerprint='abc').resumed
+
+
+def test_recorded_process_is_not_created_again(store, expt, tmp_path):
+    journal = RegistrationJournal(str(tmp_path), fingerprint='abc')
+    [builder] = builders(expt, ['global_Phase Field Simulation: Set Software'])
+    proc = builder.commit(journal)
+    assert n_processes(store) == 1
+
+    resumed = RegistrationJournal(str(tmp_path), fingerprint='abc')
+    [builder] = builders(expt, ['global_Phase Field Simulation: Set Software'])
+    again = builder.commit(resumed)
+    assert n_processes(store) == 1
+    assert again.id == proc.id
+    assert [s.id for s in again.output_samples] == [s.id for s in proc.output_samples]
+
+
+def test_commit_all_resumes_with_only_the_processes_that_failed(store, expt, tmp_path):
+    templates = ['template a', 'template b', 'template c']
+    journal = RegistrationJournal(str(tmp_path), fingerprint='abc')
+    with pytest.raises(IOError):
+        commit_all(builders(FlakyExperiment(expt, ['template b']), templates), journal=journal)
+    # The processes that were created are recorded as soon as they exist
+    assert n_processes(store) == 2
+    first_ids = dict((key, record['id']) for key, record in journal.data['processes'].items())
+    assert len(first_ids) == 2
+
+    resumed = RegistrationJournal(str(tmp_path), fingerprint='abc')
+    assert resumed.resumed
+    procs = commit_all(builders(FlakyExperiment(expt, []), templates), journal=resumed)
+    assert n_processes(store) == 3
+    assert [proc.name for proc in procs] == [template_id + ' process' for template_id in templates]
+    for builder, proc in zip(builders(expt, templates), procs):
+        if builder.journal_key() in first_ids:
+            assert proc.id == first_ids[builder.journal_key()]
+
+
+def test_journal_key_distinguishes_processes_of_one_template(expt):
+    first = ProcessBuilder(expt, 'global_Phase Field Simulation: Set Equations', name='Set Equations: var0')
+    second = ProcessBuilder(expt, 'global_Phase Field Simulation: Set Equations', name='Set Equations: var1')
+    assert first.journal_key() != second.journal_key()
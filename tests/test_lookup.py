@@ -0,0 +1,78 @@
+import io
+
+import pytest
+
+from prismspf_mcapi import lookup
+from prismspf_mcapi.lookup import get_sample_by_id, get_sample_index
+from prismspf_mcapi.local_backend import LocalStore
+
+TEMPLATE = 'global_Phase Field Simulation: Run Simulation'
+
+
+@pytest.fixture(autouse=True)
+def fresh_indexes(monkeypatch):
+    monkeypatch.setattr(lookup, '_sample_indexes', {})
+    monkeypatch.setattr(lookup, '_template_indexes', {})
+
+
+@pytest.fixture
+def store():
+    return LocalStore()
+
+
+@pytest.fixture
+def expt(store, tmp_path):
+    # No .mc directory in the project, so there is no metadata cache
+    return store.project(str(tmp_path)).experiment()
+
+
+def test_sample_lookups_share_one_listing(store, expt):
+    samples = expt.create_process_from_template(TEMPLATE).create_samples(['a', 'b', 'c'])
+    for sample in samples:
+        assert get_sample_by_id(expt, sample.id).name == sample.name
+    assert store.calls['get_all_samples'] == 1
+
+    out = io.StringIO()
+    assert get_sample_by_id(expt, 'missing', out=out) is None
+    assert out.getvalue() == 'Did not find a sample with id: missing\n'
+
+    # Samples created later are added to the index instead of fetching the listing again
+    [new] = expt.create_process_from_template(TEMPLATE).create_samples(['d'])
+    get_sample_index(expt).add([new])
+    assert get_sample_by_id(expt, new.id).name == 'd'
+    assert store.calls['get_all_samples'] == 1
+
+
+class AllProcessesOnly(object):
+    """An experiment whose backend cannot filter processes by template"""
+
+    def __init__(self, expt):
+        self.id = expt.id
+        self.project = expt.project
+        self.get_all_processes = expt.get_all_processes
+
+
+def create_processes(expt, counts):
+    ids = {}
+    for template_id, n in counts:
+        for i in range(n):
+            ids.setdefault(template_id, []).append(expt.create_process_from_template(template_id).id)
+    return ids
+
+
+@pytest.mark.parametrize('page_size, requests', [(2, 3), (5, 2), (500, 1)])
+def test_processes_by_template_are_fetched_in_pages(store, expt, page_size, requests):
+    ids = create_processes(expt, [(TEMPLATE, 5), ('other template', 2)])
+    processes = lookup.get_processes_by_template(expt, TEMPLATE, page_size=page_size)
+    assert [proc.id for proc in processes] == ids[TEMPLATE]
+    assert store.calls['get_processes_by_template'] == requests
+    assert 'get_all_processes' not in store.calls
+
+
+def test_template_index_lists_all_processes_once(store, expt):
+    ids = create_processes(expt, [(TEMPLATE, 3), ('other template', 2)])
+    container = AllProcessesOnly(expt)
+    assert [proc.id for proc in lookup.get_processes_by_template(container, TEMPLATE)] == ids[TEMPLATE]
+    assert [proc.id for proc in lookup.get_processes_by_template(container, 'other template')] == ids['other template']
+    assert lookup.get_processes_by_template(container, 'unused template') == []
+    assert store.calls['get_all_processes'] == 1
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from prismspf_mcapi.main import prismspf_usage, subcommand_desc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USAGE_SCRIPT = """
+import sys
+import prismspf_mcapi
+prismspf_mcapi.prismspf_subcommand(['mc', 'prismspf'])
+modules = [interface['module'] for interface in prismspf_mcapi.main.prismspf_usage] + ['materials_commons', 'numpy']
+print(','.join(name for name in modules if name in sys.modules))
+"""
+
+
+def test_usage_imports_no_subcommand():
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR, os.environ.get('PYTHONPATH', '')]))
+    output = subprocess.check_output([sys.executable, '-c', USAGE_SCRIPT], env=env, universal_newlines=True)
+    assert 'mc prismspf <command> [<args>]' in output
+    assert output.splitlines()[-1] == ''
+
+
+def test_subcommand_desc():
+    assert [subcommand_desc(interface['name']) for interface in prismspf_usage] == [
+        interface['desc'] for interface in prismspf_usage]
+    with pytest.raises(KeyError):
+        subcommand_desc('samples')
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from prismspf_mcapi.manifest import UploadManifest, MANIFEST_FILE_NAME
+
+
+class Obj(object):
+    """An uploaded file with the given attributes"""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+@pytest.fixture
+def app_dir(tmp_path):
+    for name in ('solution-000100.vtu', 'solution-000200.vtu'):
+        (tmp_path / name).write_text('<VTKFile/>\n' + name)
+    return str(tmp_path)
+
+
+def set_mtime(path, delta_ns):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + delta_ns))
+
+
+def test_changed_files_skips_unchanged_files_and_picks_up_modified_ones(app_dir):
+    manifest = UploadManifest(app_dir)
+    paths = ['solution-000100.vtu', 'solution-000200.vtu']
+    assert manifest.changed_files('p1', paths) == paths
+    for path in paths:
+        manifest.record('p1', path, Obj(id='f-' + path))
+    assert manifest.changed_files('p1', paths) == []
+
+    # Touched but not modified: skipped
+    set_mtime(os.path.join(app_dir, paths[0]), 1000000)
+    assert manifest.changed_files('p1', paths) == []
+
+    # Rewritten, with the same size or not: picked up
+    with open(os.path.join(app_dir, paths[0]), 'w') as f:
+        f.write('<VTKFile/>\nsolution-000100.VTU')
+    set_mtime(os.path.join(app_dir, paths[0]), 2000000)
+    with open(os.path.join(app_dir, paths[1]), 'a') as f:
+        f.write('more')
+    assert manifest.changed_files('p1', paths) == paths
+
+    # Files are tracked per process
+    assert manifest.changed_files('p2', paths[:1]) == paths[:1]
+
+
+def test_manifest_is_saved_in_the_app_directory(app_dir):
+    manifest = UploadManifest(app_dir)
+    manifest.record('p1', 'solution-000100.vtu', Obj(id='f1'), metadata={'compression': 'gzip'})
+    manifest.save()
+    assert os.path.isfile(os.path.join(app_dir, MANIFEST_FILE_NAME))
+
+    reloaded = UploadManifest(app_dir)
+    assert reloaded.last_simulation_process == 'p1'
+    record = reloaded.files('p1')['solution-000100.vtu']
+    assert (record['file_id'], record['compression']) == ('f1', 'gzip')
+    assert reloaded.changed_files('p1', ['solution-000100.vtu']) == []
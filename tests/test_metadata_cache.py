@@ -0,0 +1,172 @@
+import os
+
+import pytest
+
+from prismspf_mcapi import metadata_cache
+from prismspf_mcapi.metadata_cache import MetadataCache, get_metadata_cache, CACHE_FILE_NAME
+from prismspf_mcapi.local_backend import LocalStore
+from prismspf_mcapi.lookup import SampleIndex
+
+
+class Obj(object):
+    """A backend project, experiment, process or sample with the given attributes"""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+TEMPLATE = 'global_Phase Field Simulation: Run Simulation'
+
+
+@pytest.fixture
+def project(tmp_path):
+    os.mkdir(str(tmp_path / '.mc'))
+    return Obj(id='proj', path=str(tmp_path))
+
+
+@pytest.fixture
+def expt(project):
+    return Obj(id='expt', project=project, mtime=100.0)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MetadataCache(str(tmp_path / '.mc' / CACHE_FILE_NAME), ttl=60)
+
+
+@pytest.fixture(autouse=True)
+def no_refresh():
+    metadata_cache.configure(False)
+    yield
+    metadata_cache.configure(False)
+
+
+def processes():
+    return [Obj(id='p1', name='Run Simulation', owner='me', template_id=TEMPLATE),
+            Obj(id='p2', name='Run Simulation 2', owner='me', template_id=TEMPLATE)]
+
+
+def test_listings_are_served_from_the_file(cache, expt):
+    assert cache.processes_by_template(expt, TEMPLATE) is None
+    cache.add_processes_by_template(expt, TEMPLATE, processes())
+    cache.add_samples_of(expt, [Obj(id='s1', name='results')])
+
+    reloaded = MetadataCache(cache.path, ttl=60)
+    assert [(p.id, p.name) for p in reloaded.processes_by_template(expt, TEMPLATE)] == [
+        ('p1', 'Run Simulation'), ('p2', 'Run Simulation 2')]
+    assert [s.name for s in reloaded.samples_of(expt)] == ['results']
+    assert reloaded.processes_by_template(expt, 'another template') is None
+
+
+def test_expired_listing_is_used_only_while_the_container_is_unchanged(cache, expt, monkeypatch):
+    cache.add_processes_by_template(expt, TEMPLATE, processes())
+    now = metadata_cache.time.time()
+    monkeypatch.setattr(metadata_cache.time, 'time', lambda: now + 120)
+    assert cache.processes_by_template(expt, TEMPLATE) is not None
+
+    # Revalidated: fresh for another TTL, even after the experiment changes
+    expt.mtime = 200.0
+    assert cache.processes_by_template(expt, TEMPLATE) is not None
+    monkeypatch.setattr(metadata_cache.time, 'time', lambda: now + 240)
+    assert cache.processes_by_template(expt, TEMPLATE) is None
+
+
+def test_listing_without_validator_expires(cache, project, monkeypatch):
+    expt = Obj(id='expt', project=project)
+    cache.add_samples_of(expt, [Obj(id='s1', name='results')])
+    assert cache.samples_of(expt) is not None
+    now = metadata_cache.time.time()
+    monkeypatch.setattr(metadata_cache.time, 'time', lambda: now + 120)
+    assert cache.samples_of(expt) is None
+
+
+def test_invalidate_forgets_one_container(cache, expt, project):
+    other = Obj(id='other', project=project, mtime=100.0)
+    cache.add_samples_of(expt, [Obj(id='s1', name='results')])
+    cache.add_samples_of(other, [Obj(id='s2', name='inputs')])
+    cache.invalidate(expt)
+    assert cache.samples_of(expt) is None
+    assert [s.id for s in MetadataCache(cache.path).samples_of(other)] == ['s2']
+
+
+def test_write_clears_the_cache_and_read_does_not(cache, expt):
+    cache.add_samples_of(expt, [Obj(id='s1', name='results')])
+    assert cache.call('get_all_samples', lambda: 'read', (), {}) == 'read'
+    assert cache.samples_of(expt) is not None
+
+    assert cache.call('create_samples', lambda: 'written', (), {}) == 'written'
+    assert cache.samples_of(expt) is None
+    assert not os.path.exists(cache.path)
+
+
+def test_failed_write_clears_the_cache(cache, expt):
+    cache.add_samples_of(expt, [Obj(id='s1', name='results')])
+
+    def fail():
+        raise IOError('response lost')
+
+    with pytest.raises(IOError):
+        cache.call('add_files', fail, (), {})
+    assert cache.samples_of(expt) is None
+
+
+def test_refresh_ignores_the_file(cache, expt):
+    cache.add_samples_of(expt, [Obj(id='s1', name='results')])
+    metadata_cache.configure(True)
+    assert MetadataCache(cache.path).samples_of(expt) is None
+
+
+def test_cached_process_output_samples(cache, expt):
+    fetched = []
+
+    class Process(Obj):
+        def decorate_with_output_samples(self):
+            fetched.append(self.id)
+            self.output_samples = [Obj(id='s1', name='results')]
+
+    backend = Process(id='p1', name='Run Simulation', template_id=TEMPLATE)
+    expt.get_process_by_id = lambda process_id: backend
+    cache.add_processes_by_template(expt, TEMPLATE, [backend])
+
+    [proc] = MetadataCache(cache.path).processes_by_template(expt, TEMPLATE)
+    assert [s.name for s in proc.decorate_with_output_samples().output_samples] == ['results']
+    [proc] = MetadataCache(cache.path).processes_by_template(expt, TEMPLATE)
+    assert [s.name for s in proc.decorate_with_output_samples().output_samples] == ['results']
+    assert fetched == ['p1']
+
+
+def test_get_metadata_cache(project, tmp_path, monkeypatch):
+    expt = Obj(id='expt', project=project)
+    assert get_metadata_cache(expt) is get_metadata_cache(project)
+    assert get_metadata_cache(Obj(id='elsewhere', path=str(tmp_path / 'no_mc_dir'))) is None
+    monkeypatch.setenv(metadata_cache.TTL_ENV_VAR, '0')
+    assert get_metadata_cache(project) is None
+
+
+def test_sample_index_refetches_a_stale_listing_once(tmp_path):
+    os.mkdir(str(tmp_path / '.mc'))
+    store = LocalStore()
+    expt = store.project(str(tmp_path)).experiment()
+    first = expt.create_process_from_template(TEMPLATE).create_samples(['first'])[0]
+
+    assert SampleIndex(expt).get(first.id).name == 'first'
+    assert store.calls['get_all_samples'] == 1
+
+    # Created without going through the cache's write hook, e.g. by another client
+    second = expt.create_process_from_template(TEMPLATE).create_samples(['second'])[0]
+    index = SampleIndex(expt)
+    assert index.get(first.id).name == 'first'
+    assert store.calls['get_all_samples'] == 1
+    assert index.get(second.id).name == 'second'
+    assert store.calls['get_all_samples'] == 2
+    # The listing is now fresh from the backend, so a missing sample is not fetched for again
+    assert index.get('missing') is None
+    assert store.calls['get_all_samples'] == 2
+
+
+def test_refresh_is_read_from_the_subcommand_arguments():
+    metadata_cache.configure_from_argv(['mc', 'prismspf', 'simulation', '--refresh', '--expt'])
+    assert metadata_cache._refresh
+    # A later invocation without --refresh uses the cache again
+    metadata_cache.configure_from_argv(['mc', 'prismspf', 'simulation', '--id', 'p1'])
+    assert not metadata_cache._refresh
@@ -0,0 +1,113 @@
+import pytest
+
+from prismspf_mcapi.parameter_schema import ParameterSchema, TypedParameter, convert_values, schema_key
+from prismspf_mcapi.prismspf_parameter_parser import ParametersDocument
+
+DESCRIPTORS = [
+    ('Number of dimensions', 'int', '2', ''),
+    ('Time step', 'double', '0.0', ''),
+    ('Mesh adaptivity', 'bool', 'false', ''),
+    ('Output file type', 'string', 'vtu', ''),
+    ('Refinement criteria fields', 'list of strings', '', ''),
+    ('Subdivisions', 'list of ints', '1, 1', ''),
+    ('Tolerance type', 'string', 'ABSOLUTE_RESIDUAL', 'Linear solver parameters'),
+    ('Tolerance value', 'double', '1e-10', 'Linear solver parameters'),
+    ('Maximum linear solver iterations', 'int', '1000', 'Linear solver parameters'),
+]
+
+PARAMETERS_IN = """
+# A PRISMS-PF input file
+set Number of dimensions = 3
+set Time step = 2.5e-4
+set Mesh adaptivity = true
+set Refinement criteria fields = c, n1 , n2
+set Subdivisions = 3, 4
+set Not in the schema = 1
+
+subsection Linear solver parameters: c
+    set Tolerance value = 1e-6
+    set Preconditioner = AMG
+end
+subsection Linear solver parameters: n1
+    set Maximum linear solver iterations = many
+end
+"""
+
+
+@pytest.fixture
+def document(tmp_path):
+    path = tmp_path / 'parameters.in'
+    path.write_text(PARAMETERS_IN)
+    return ParametersDocument(str(path))
+
+
+@pytest.mark.parametrize('ptype, text, value', [
+    ('int', ' 42 ', 42),
+    ('double', '1.5e-3', 1.5e-3),
+    ('bool', 'True', True),
+    ('bool', 'off', False),
+    ('string', ' vtu ', 'vtu'),
+    ('list of ints', '1, 2,3', [1, 2, 3]),
+    ('list of doubles', '0.5,1e2', [0.5, 100.0]),
+    ('list of strings', 'c, n1, ', ['c', 'n1']),
+    ('list of strings', '', []),
+])
+def test_convert_values(ptype, text, value):
+    assert convert_values(ptype, [text]) == ([value], [])
+
+
+def test_convert_values_reports_each_invalid_value():
+    converted, errors = convert_values('int', ['1', 'x', '3', '4.5'])
+    assert converted == [1, None, 3, None]
+    assert [index for index, message in errors] == [1, 3]
+
+
+def test_invalid_default_is_rejected():
+    with pytest.raises(ValueError):
+        TypedParameter('Number of dimensions', 'int', 'two')
+
+
+def test_parameter_described_twice_is_rejected():
+    with pytest.raises(ValueError):
+        ParameterSchema([('Time step', 'double', '0', ''), ('Time step', 'double', '1', '')])
+
+
+def test_schema_key_drops_instance_names():
+    assert schema_key('Linear solver parameters (var0): Tolerance value') == 'Linear solver parameters: Tolerance value'
+    assert schema_key('Output file name (base)') == 'Output file name (base)'
+    assert schema_key('A (x): B (y): C') == 'A: B: C'
+
+
+def test_schema_indexes_parameters_by_subsection():
+    schema = ParameterSchema(DESCRIPTORS)
+    assert schema.parameters['Linear solver parameters: Tolerance value'].otype == 'number'
+    assert [p.name for p in schema.subsections['Linear solver parameters']] == [
+        'Tolerance type', 'Tolerance value', 'Maximum linear solver iterations']
+
+
+def test_values_are_typed_and_defaults_filled_in(document):
+    values, errors = ParameterSchema(DESCRIPTORS).values(document)
+    values = dict((key, (otype, value)) for key, otype, value in values)
+
+    # Set at the top level
+    assert values['Number of dimensions'] == ('integer', 3)
+    assert values['Time step'] == ('number', 2.5e-4)
+    assert values['Mesh adaptivity'] == ('boolean', True)
+    assert values['Refinement criteria fields'] == ('list', ['c', 'n1', 'n2'])
+    assert values['Subdivisions'] == ('list', [3, 4])
+    # Not set at the top level: the default
+    assert values['Output file type'] == ('string', 'vtu')
+    # Not described by the schema and outside its subsections: left out
+    assert 'Not in the schema' not in values
+
+    # Each subsection instance gets the parameters it sets, and defaults for the others
+    assert values['Linear solver parameters (c): Tolerance value'] == ('number', 1e-6)
+    assert values['Linear solver parameters (c): Tolerance type'] == ('string', 'ABSOLUTE_RESIDUAL')
+    assert values['Linear solver parameters (c): Maximum linear solver iterations'] == ('integer', 1000)
+    assert values['Linear solver parameters (n1): Tolerance value'] == ('number', 1e-10)
+    # Not described, but set in a subsection of the schema: kept as a string
+    assert values['Linear solver parameters (c): Preconditioner'] == ('string', 'AMG')
+
+    # A value of the wrong type is reported and kept as a string
+    assert [key for key, message in errors] == ['Linear solver parameters (n1): Maximum linear solver iterations']
+    assert values['Linear solver parameters (n1): Maximum linear solver iterations'] == ('string', 'many')
@@ -0,0 +1,55 @@
+import io
+import time
+
+import pytest
+
+from prismspf_mcapi import worker_pool
+from prismspf_mcapi.pipeline import PipelineError, run_stages
+
+
+def stage(name, delay, result=None, error=None):
+    def run():
+        print(name + ' started')
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        print(name + ' done')
+        return result
+    return (name, run)
+
+
+def test_output_and_results_are_in_stage_order():
+    # Later stages finish first
+    stages = [stage('software', 0.06, 1), stage('equations', 0.03, 2), stage('environment', 0.0, 3)]
+    out = io.StringIO()
+    assert run_stages(stages, out=out) == [1, 2, 3]
+    assert out.getvalue() == ('software started\nsoftware done\n'
+                              'equations started\nequations done\n'
+                              'environment started\nenvironment done\n')
+
+
+def test_output_of_a_stage_includes_its_worker_threads():
+    def parallel():
+        worker_pool.map_items(lambda i: print('part ' + str(i)), range(3), max_workers=3)
+        return 'parts'
+
+    out = io.StringIO()
+    assert run_stages([('parallel', parallel), stage('other', 0.0, 'other')], out=out) == ['parts', 'other']
+    lines = out.getvalue().splitlines()
+    assert sorted(lines[:3]) == ['part 0', 'part 1', 'part 2']
+    assert lines[3:] == ['other started', 'other done']
+
+
+def test_failures_are_collected_after_every_stage_finishes():
+    stages = [stage('software', 0.0, error=ValueError('no git repository')),
+              stage('equations', 0.03, 2),
+              stage('environment', 0.0, error=IOError('request failed'))]
+    out = io.StringIO()
+    with pytest.raises(PipelineError) as excinfo:
+        run_stages(stages, out=out)
+    err = excinfo.value
+    assert err.results == [None, 2, None]
+    assert [(name, type(e)) for name, e in err.failures] == [('software', ValueError), ('environment', OSError)]
+    assert 'software' in str(err) and 'environment' in str(err)
+    # The stage that succeeded finished, and its output was written
+    assert 'equations done\n' in out.getvalue()
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+from prismspf_mcapi.prismspf_parameter_parser import (
+    ParametersDocument, load_parameters_file, parse_parameters_file, parameter_extractor)
+
+PARAMETERS_IN = """
+# Top-level parameters
+set Number of dimensions = 2
+set Domain size X = 100
+set Output file name (base) = solution
+set Refinement criteria fields = c, n1
+
+subsection Linear solver parameters: c
+    set Tolerance value = 1e-10
+    # A comment inside a subsection
+    set Maximum linear solver iterations = 1000
+end
+subsection Linear solver parameters: n1
+    set Tolerance value = 1e-6
+end
+subsection Nucleation parameters: n1
+    set Nucleus semiaxes (x, y, z) = 2, 2, 2
+    subsection Hold time
+        set Freeze time following nucleation = 20
+    end
+end
+subsection Boundary condition for variable c
+    set Boundary condition for variable c = NATURAL
+end
+
+set Time step = 1.0e-3
+set No value here
+"""
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'parameters.in'
+    path.write_text(PARAMETERS_IN)
+    return str(path)
+
+
+@pytest.fixture
+def document(path):
+    return ParametersDocument(path)
+
+
+def test_top_level_parameters(document):
+    assert document.get('Number of dimensions') == '2'
+    assert document.get('Output file name (base)') == 'solution'
+    assert document.get('Refinement criteria fields') == 'c, n1'
+    # Parameters after a subsection closes are at the top level again
+    assert document.get('Time step') == '1.0e-3'
+    assert document.get('No value') == 'Invalid Entry'
+    assert document.get('Missing', 'default') == 'default'
+    assert 'Domain size X' in document
+    assert 'Tolerance value' not in document
+
+
+def test_subsection_instances_are_kept_apart(document):
+    assert document.get('Linear solver parameters (c): Tolerance value') == '1e-10'
+    assert document.get('Linear solver parameters (n1): Tolerance value') == '1e-6'
+    assert document.subsection('Linear solver parameters (c)') == {
+        'Tolerance value': '1e-10', 'Maximum linear solver iterations': '1000'}
+    assert document.get_in('Linear solver parameters (n1)', 'Tolerance value') == '1e-6'
+    assert document.get_in('Linear solver parameters (n1)', 'Maximum linear solver iterations') is None
+    assert document.subsection('Linear solver parameters (n2)') == {}
+
+
+def test_nested_subsections(document):
+    assert document.get('Nucleation parameters (n1): Hold time: Freeze time following nucleation') == '20'
+    assert document.subsection('Nucleation parameters (n1)') == {'Nucleus semiaxes (x, y, z)': '2, 2, 2'}
+    assert document.subsection('Nucleation parameters (n1): Hold time') == {'Freeze time following nucleation': '20'}
+
+
+def test_find_subsections_by_base_name(document):
+    assert document.find_subsections('Linear solver parameters') == [
+        'Linear solver parameters (c)', 'Linear solver parameters (n1)']
+    assert document.find_subsections('Boundary condition for variable c') == ['Boundary condition for variable c']
+    assert document.find_subsections('Hold time') == ['Nucleation parameters (n1): Hold time']
+    assert document.find_subsections('Nonlinear solver parameters') == []
+
+
+def test_compact_lookup_matches_parameter_extractor(document, path):
+    assert document.lookup_compact('DomainsizeX') == '100'
+    assert document.lookup_compact('Domain size X') == '100'
+    # The first word of the value, as parameter_extractor always returned
+    assert document.lookup_compact('Refinement criteria fields') == 'c,'
+    assert parameter_extractor(path, 'Number of dimensions') == '2'
+    assert parameter_extractor(path, 'Not set') == 0
+
+
+def test_parse_parameters_file_returns_a_copy(path):
+    parameters = parse_parameters_file(path)
+    parameters['Number of dimensions'] = '3'
+    assert parse_parameters_file(path)['Number of dimensions'] == '2'
+
+
+def test_documents_are_reparsed_only_when_the_file_changes(path):
+    document = load_parameters_file(path)
+    assert load_parameters_file(path) is document
+
+    with open(path, 'a') as f:
+        f.write('set Number of outputs = 10\n')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    changed = load_parameters_file(path)
+    assert changed is not document
+    assert changed.get('Number of outputs') == '10'
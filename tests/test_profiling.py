@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from prismspf_mcapi import worker_pool
+from prismspf_mcapi.profiling import HISTOGRAM_BUCKETS_MS, Tracer, attribute_backend_calls
+
+
+def software_stage(tracer):
+    """Makes backend calls on worker threads, as the software stage would"""
+    return worker_pool.call_all([lambda: tracer.call('create_samples', lambda names: names, (['software'],), {}),
+                                 lambda: tracer.call('rename', lambda name: name, ('Set Software',), {})])
+
+
+software_stage.__module__ = 'prismspf_mcapi.software'
+software_stage = attribute_backend_calls(software_stage)
+
+
+def test_calls_on_worker_threads_are_attributed_to_the_subcommand(tmp_path):
+    tracer = Tracer('simulation')
+    assert software_stage(tracer) == [['software'], 'Set Software']
+    tracer.call('get_all_samples', lambda: [], (), {})
+
+    def fail():
+        raise IOError('request failed')
+
+    with pytest.raises(IOError):
+        tracer.call('add_files', fail, (), {})
+
+    events = dict((event['name'], event) for event in tracer.events)
+    assert events['create_samples']['cat'] == events['rename']['cat'] == 'software'
+    assert events['get_all_samples']['cat'] == 'simulation'
+    assert events['add_files']['args']['error'] == "OSError('request failed')"
+    assert events['rename']['args']['request_bytes'] == len(json.dumps([['Set Software'], {}]))
+
+    path = str(tmp_path / 'trace.json')
+    tracer.write(path)
+    with open(path) as f:
+        trace = json.load(f)
+    assert sorted(event['name'] for event in trace['traceEvents']) == [
+        'add_files', 'create_samples', 'get_all_samples', 'rename']
+    operations = trace['otherData']['operations']
+    assert operations['rename']['count'] == 1
+    assert sum(operations['rename']['buckets']) == 1
+    assert len(operations['rename']['buckets']) == len(HISTOGRAM_BUCKETS_MS) + 1
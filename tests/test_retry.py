@@ -0,0 +1,182 @@
+import pytest
+
+from prismspf_mcapi import retry
+from prismspf_mcapi.retry import RetryPolicy, is_transient, is_unsent, current_idempotency_key, next_request_key
+from prismspf_mcapi.local_backend import LocalStore, TransientBackendError
+
+
+# Stand-ins for the requests and urllib3 exception classes, which are matched by module and name
+def http_error_class(module, name, base):
+    return type(name, (base,), {'__module__': module})
+
+
+RequestException = http_error_class('requests.exceptions', 'RequestException', IOError)
+RequestsConnectionError = http_error_class('requests.exceptions', 'ConnectionError', RequestException)
+Timeout = http_error_class('requests.exceptions', 'Timeout', RequestException)
+ConnectTimeout = http_error_class('requests.exceptions', 'ConnectTimeout', Timeout)
+ReadTimeout = http_error_class('requests.exceptions', 'ReadTimeout', Timeout)
+HTTPError = http_error_class('requests.exceptions', 'HTTPError', RequestException)
+NewConnectionError = http_error_class('urllib3.exceptions', 'NewConnectionError', Exception)
+MaxRetryError = http_error_class('urllib3.exceptions', 'MaxRetryError', Exception)
+
+
+class Response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def http_error(status):
+    err = HTTPError('HTTP ' + str(status))
+    err.response = Response(status)
+    return err
+
+
+def max_retry_error(reason):
+    err = MaxRetryError('Max retries exceeded')
+    err.reason = reason
+    return err
+
+
+@pytest.mark.parametrize('err, transient', [
+    (http_error(503), True),
+    (http_error(500), True),
+    (http_error(404), False),
+    (http_error(400), False),
+    (ReadTimeout('read timed out'), True),
+    (ConnectTimeout('connect timed out'), True),
+    (RequestsConnectionError('connection aborted'), True),
+    (ConnectionResetError(), True),
+    (TimeoutError(), True),
+    (TransientBackendError('injected'), True),
+    (FileNotFoundError('parameters.in'), False),
+    (ValueError('malformed URL'), False),
+])
+def test_is_transient(err, transient):
+    assert is_transient(err) is transient
+
+
+@pytest.mark.parametrize('err, unsent', [
+    (ConnectionRefusedError(), True),
+    (ConnectTimeout('connect timed out'), True),
+    (RequestsConnectionError(max_retry_error(NewConnectionError('refused'))), True),
+    (RequestsConnectionError(max_retry_error(ConnectionResetError())), False),
+    (RequestsConnectionError('connection aborted'), False),
+    (ReadTimeout('read timed out'), False),
+    (ConnectionResetError(), False),
+    (TransientBackendError('injected', sent=False), True),
+    (TransientBackendError('injected', sent=True), False),
+])
+def test_is_unsent(err, unsent):
+    assert is_unsent(err) is unsent
+
+
+def failing(errors, result='done'):
+    """Return a function raising each of 'errors' in turn, then returning 'result', and its list of calls"""
+    calls = []
+
+    def fn():
+        calls.append((current_idempotency_key(), next_request_key(), next_request_key()))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return fn, calls
+
+
+def test_read_is_retried_after_transient_failures():
+    policy = RetryPolicy(max_retries=3, base_delay=0)
+    fn, calls = failing([ReadTimeout('1'), http_error(502)])
+    assert policy.call('get_all_samples', fn, (), {}) == 'done'
+    assert len(calls) == 3
+    assert policy.stats()['retries'] == {'get_all_samples': 2}
+    # Reads carry no idempotency key
+    assert calls[0] == (None, None, None)
+
+
+def test_permanent_failure_is_not_retried():
+    policy = RetryPolicy(max_retries=3, base_delay=0)
+    fn, calls = failing([http_error(404)])
+    with pytest.raises(HTTPError):
+        policy.call('get_all_samples', fn, (), {})
+    assert len(calls) == 1
+
+
+def test_gives_up_after_max_retries():
+    policy = RetryPolicy(max_retries=2, base_delay=0)
+    fn, calls = failing([ReadTimeout(str(i)) for i in range(5)])
+    with pytest.raises(ReadTimeout):
+        policy.call('get_all_samples', fn, (), {})
+    assert len(calls) == 3
+    assert policy.stats()['gave_up'] == {'get_all_samples': 1}
+
+
+def test_write_that_may_have_been_applied_is_not_retried():
+    policy = RetryPolicy(max_retries=3, base_delay=0)
+    fn, calls = failing([ReadTimeout('response lost')])
+    with pytest.raises(ReadTimeout):
+        policy.call('create_samples', fn, (), {})
+    assert len(calls) == 1
+
+
+def test_write_that_was_not_sent_is_retried_with_the_same_key():
+    policy = RetryPolicy(max_retries=3, base_delay=0)
+    fn, calls = failing([ConnectionRefusedError(), RequestsConnectionError(max_retry_error(NewConnectionError('x')))])
+    assert policy.call('create_samples', fn, (), {}) == 'done'
+    assert len(calls) == 3
+    key = calls[0][0]
+    assert key is not None
+    # Every attempt reuses the key, and numbers its requests from 1 again
+    assert calls == [(key, key + '.1', key + '.2')] * 3
+
+
+def test_keyed_writes_are_retried_after_any_transient_failure():
+    policy = RetryPolicy(max_retries=3, base_delay=0, keyed_writes=True)
+    fn, calls = failing([ReadTimeout('response lost')])
+    assert policy.call('create_samples', fn, (), {}) == 'done'
+    assert len(calls) == 2
+    assert calls[0][0] == calls[1][0]
+
+
+def test_each_write_gets_its_own_key_and_nested_keys_are_restored():
+    policy = RetryPolicy(base_delay=0)
+    keys = []
+
+    def outer():
+        keys.append(current_idempotency_key())
+        policy.call('rename', lambda: keys.append(current_idempotency_key()), (), {})
+        keys.append(current_idempotency_key())
+
+    policy.call('create_process', outer, (), {})
+    policy.call('create_process', outer, (), {})
+    assert len(set(keys)) == 4
+    assert keys[0] == keys[2] and keys[3] == keys[5]
+    assert current_idempotency_key() is None
+
+
+def test_retried_local_write_is_applied_once():
+    store = LocalStore()
+    expt = store.project('/tmp/prismspf_mcapi_test_retry').experiment()
+    policy = RetryPolicy(max_retries=3, base_delay=0, keyed_writes=True)
+    created = []
+
+    def create_then_lose_response():
+        created.append(expt.create_process_from_template('global_Phase Field Simulation: Run Simulation'))
+        if len(created) == 1:
+            raise TransientBackendError('response lost', sent=True)
+        return created[-1]
+
+    proc = policy.call('create_process_from_template', create_then_lose_response, (), {})
+    assert created[0].id == proc.id
+    assert len(store.query('SELECT id FROM processes')) == 1
+
+
+def test_configure_keeps_unset_values(monkeypatch):
+    monkeypatch.setattr(retry, '_policy', None)
+    retry.configure(max_retries=7, keyed_writes=True)
+    retry.configure(base_delay=0.25)
+    policy = retry.get_retry_policy()
+    assert (policy.max_retries, policy.base_delay, policy.keyed_writes) == (7, 0.25, True)
+
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(20):
+        assert 0 <= retry.backoff_delay(attempt, base_delay=0.5, max_delay=4.0) <= min(4.0, 0.5 * 2 ** attempt)
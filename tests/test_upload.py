@@ -0,0 +1,132 @@
+import os
+
+import pytest
+
+from prismspf_mcapi.file_registry import file_digest
+from prismspf_mcapi.http_pool import ConnectionPool
+from prismspf_mcapi.retry import is_transient
+from prismspf_mcapi.upload import ChunkedHTTPTransport, UploadEngine, _status_error
+from prismspf_mcapi.upload_server import start_server
+
+CONTENTS = bytes(range(256)) * 40
+CHUNK_SIZE = 1024
+
+
+class Response(object):
+    """An HTTP response with a status and no headers"""
+
+    def __init__(self, status):
+        self.status = status
+
+    def getheader(self, name, default=None):
+        return default
+
+
+class RecordingPool(object):
+    """
+    A ConnectionPool that records the requests sent through it, and fails
+    the PATCH requests whose numbers (from 1) are in 'failures'.
+
+    A failure is either an exception, raised after the chunk reached the
+    server, as when the connection drops before the response arrives, or an
+    HTTP status, returned without sending the chunk.
+    """
+
+    def __init__(self, pool, failures=None):
+        self.pool = pool
+        self.failures = failures or {}
+        self.patches = []
+
+    def request(self, method, path, body=None, headers=None):
+        if method != 'PATCH':
+            return self.pool.request(method, path, body=body, headers=headers)
+        self.patches.append((int(headers['Upload-Offset']), len(body)))
+        failure = self.failures.get(len(self.patches))
+        if isinstance(failure, int):
+            return Response(failure), b''
+        result = self.pool.request(method, path, body=body, headers=headers)
+        if failure is not None:
+            raise failure
+        return result
+
+
+@pytest.fixture
+def server(tmp_path):
+    server, url = start_server(str(tmp_path / 'uploads'))
+    server.url = url
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'solution-000100.vtu'
+    path.write_bytes(CONTENTS)
+    return str(path)
+
+
+def transport(server, failures=None):
+    pool = RecordingPool(ConnectionPool('http', '{}:{}'.format(*server.server_address)), failures)
+    return ChunkedHTTPTransport(server.url, pool=pool)
+
+
+def stored_contents(server, path):
+    with open(os.path.join(server.root, file_digest(path) + '-' + os.path.basename(path)), 'rb') as f:
+        return f.read()
+
+
+def test_upload_in_chunks(server, path):
+    t = transport(server)
+    uploaded = UploadEngine(t, chunk_size=CHUNK_SIZE).upload([path])[0]
+    assert (uploaded.name, uploaded.size) == ('solution-000100.vtu', len(CONTENTS))
+    assert [offset for offset, n in t.pool.patches] == list(range(0, len(CONTENTS), CHUNK_SIZE))
+    assert stored_contents(server, path) == CONTENTS
+
+
+def test_interrupted_upload_resumes_from_the_server_offset(server, path):
+    # The third chunk reaches the server, but the connection drops before its response
+    t = transport(server, failures={3: ConnectionResetError('connection reset by peer')})
+    engine = UploadEngine(t, chunk_size=CHUNK_SIZE, max_retries=1, retry_delay=0.0)
+    engine.upload([path])
+
+    # The retry asks the server for its offset and sends only the bytes after it
+    offsets = [offset for offset, n in t.pool.patches]
+    assert offsets[:3] == [0, CHUNK_SIZE, 2 * CHUNK_SIZE]
+    assert offsets[3:] == list(range(3 * CHUNK_SIZE, len(CONTENTS), CHUNK_SIZE))
+    assert server.bytes_received == len(CONTENTS)
+    assert stored_contents(server, path) == CONTENTS
+
+
+def test_offset_mismatch_continues_from_the_server_offset(server, path):
+    # The server already holds the first two chunks, but the client starts from 0
+    with open(os.path.join(server.root, file_digest(path) + '.part'), 'wb') as f:
+        f.write(CONTENTS[:2 * CHUNK_SIZE])
+    t = transport(server)
+    t.offset = lambda upload_id: 0
+    UploadEngine(t, chunk_size=CHUNK_SIZE).upload([path])
+
+    offsets = [offset for offset, n in t.pool.patches]
+    assert offsets[:2] == [0, 2 * CHUNK_SIZE]
+    assert server.bytes_received == len(CONTENTS) - 2 * CHUNK_SIZE
+    assert stored_contents(server, path) == CONTENTS
+
+
+def test_server_error_is_transient_and_retried(server, path):
+    assert is_transient(_status_error('Upload', 503))
+    assert not is_transient(_status_error('Upload', 404))
+
+    t = transport(server, failures={2: 503})
+    UploadEngine(t, chunk_size=CHUNK_SIZE, max_retries=1, retry_delay=0.0).upload([path])
+    offsets = [offset for offset, n in t.pool.patches]
+    # The chunk the server refused is sent again, after the one it holds
+    assert offsets[:3] == [0, CHUNK_SIZE, CHUNK_SIZE]
+    assert server.bytes_received == len(CONTENTS)
+    assert stored_contents(server, path) == CONTENTS
+
+
+def test_client_error_is_not_retried(server, path):
+    t = transport(server, failures={2: 400})
+    with pytest.raises(IOError):
+        UploadEngine(t, chunk_size=CHUNK_SIZE, max_retries=3, retry_delay=0.0).upload([path])
+    assert len(t.pool.patches) == 2
@@ -0,0 +1,67 @@
+import pytest
+
+from prismspf_mcapi.vtu import scan_vtu, scan_vtu_files
+
+VTU = b"""<?xml version="1.0"?>
+<!-- A comment with a <Piece> in it -->
+<VTKFile type="UnstructuredGrid" version="1.0" byte_order="LittleEndian" header_type="UInt64">
+  <UnstructuredGrid>
+    <Piece NumberOfPoints="4" NumberOfCells="1">
+      <Points>
+        <DataArray type="Float32" NumberOfComponents="3" format="ascii">
+          0 0 0 1 0 0 1 1 0 0 1 0
+        </DataArray>
+      </Points>
+      <Cells>
+        <DataArray type="Int32" Name="connectivity" format="ascii">0 1 2 3</DataArray>
+      </Cells>
+      <PointData Scalars="c">
+        <DataArray type="Float64" Name="c" format="ascii">0.1 0.2 0.3 0.4</DataArray>
+        <DataArray type="Float64" Name="u" NumberOfComponents="2" format="ascii">0 0 1 1 2 2 3 3</DataArray>
+      </PointData>
+      <CellData>
+        <DataArray type="Float64" Name="subdomain" format="ascii">0</DataArray>
+        <DataArray type="Float64" Name="c" format="ascii">0.25</DataArray>
+      </CellData>
+    </Piece>
+    <Piece NumberOfPoints="2" NumberOfCells="1">
+    </Piece>
+  </UnstructuredGrid>
+  <AppendedData encoding="raw">
+   _\x00<binary data, not scanned>
+  </AppendedData>
+</VTKFile>
+"""
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'solution-000200.vtu'
+    path.write_bytes(VTU)
+    return str(path)
+
+
+@pytest.mark.parametrize('block_size', [1 << 20, 7])
+def test_header_scan(path, block_size):
+    header = scan_vtu(path, block_size=block_size)
+    assert (header.file_type, header.header_type, header.byte_order) == ('UnstructuredGrid', 'UInt64', 'LittleEndian')
+    assert header.time_step == 200
+    assert (header.number_of_pieces, header.number_of_points, header.number_of_cells) == (2, 6, 2)
+    assert header.point_fields == ['c', 'u']
+    assert header.cell_fields == ['subdomain', 'c']
+    assert header.field_names == ['c', 'u', 'subdomain']
+
+    u = header.data_arrays[3]
+    assert (u.name, u.type, u.format, u.number_of_components) == ('u', 'Float64', 'ascii', 2)
+    assert VTU[u.content_start:u.content_end] == b'0 0 1 1 2 2 3 3'
+    assert [a.section for a in header.data_arrays[:2]] == ['Points', 'Cells']
+
+    assert header.appended_encoding == 'raw'
+    assert VTU[header.appended_data_start:header.appended_data_start + 2] == b'\x00<'
+
+
+def test_headers_are_scanned_once_per_file(path, monkeypatch):
+    [first] = scan_vtu_files([path], processes=1)
+    monkeypatch.setattr('prismspf_mcapi.vtu.scan_vtu', None)
+    [again] = scan_vtu_files([path], processes=1)
+    assert again is first
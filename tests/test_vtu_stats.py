@@ -0,0 +1,112 @@
+import base64
+import zlib
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from prismspf_mcapi.vtu import scan_vtu
+from prismspf_mcapi.vtu_stats import compute_field_statistics, read_data_array, write_statistics_table
+
+C = np.array([0.5, -1.25, 3.0, 2.0, 0.0, 7.5])
+U = np.arange(12, dtype=np.float64).reshape(6, 2)
+
+VTU = """<?xml version="1.0"?>
+<VTKFile type="UnstructuredGrid" version="0.1" byte_order="LittleEndian"{compressor}>
+  <UnstructuredGrid>
+    <Piece NumberOfPoints="6" NumberOfCells="0">
+      <PointData>
+        <DataArray type="Float64" Name="c" format="{format}"{c}
+        <DataArray type="Float64" Name="u" NumberOfComponents="2" format="{format}"{u}
+      </PointData>
+    </Piece>
+  </UnstructuredGrid>{appended}
+</VTKFile>
+"""
+
+
+def block(values, compressed):
+    """The bytes of one array: a UInt32 size header and the values, as one zlib block if 'compressed'"""
+    data = values.astype('<f8').tobytes()
+    if not compressed:
+        return np.array([len(data)], dtype='<u4').tobytes(), data
+    payload = zlib.compress(data)
+    return np.array([1, len(data), len(data), len(payload)], dtype='<u4').tobytes(), payload
+
+
+def inline(text):
+    return '>' + text + '</DataArray>'
+
+
+def ascii(values):
+    return ' '.join(str(float(x)) for x in values.ravel())
+
+
+def vtu_text(encoding, compressed=False):
+    compressor = ' compressor="vtkZLibDataCompressor"' if compressed else ''
+    if encoding == 'ascii':
+        return VTU.format(compressor='', format='ascii', appended='',
+                          c=inline(ascii(C)), u=inline(ascii(U)))
+
+    if encoding == 'base64':
+        def encode(values):
+            header, data = block(values, compressed)
+            # Compressed arrays encode the header and the data separately
+            if compressed:
+                return base64.b64encode(header).decode() + base64.b64encode(data).decode()
+            return base64.b64encode(header + data).decode()
+        return VTU.format(compressor=compressor, format='binary', appended='',
+                          c=inline(encode(C)), u=inline(encode(U)))
+
+    # Appended raw: the arrays one after another after the '_' marker
+    c_bytes = b''.join(block(C, compressed))
+    u_bytes = b''.join(block(U, compressed))
+    appended = '\n  <AppendedData encoding="raw">\n   _' + (c_bytes + u_bytes).decode('latin-1') + '\n  </AppendedData>'
+    return VTU.format(compressor=compressor, format='appended', appended=appended,
+                      c=' offset="0"/>', u=' offset="{}"/>'.format(len(c_bytes)))
+
+
+@pytest.fixture
+def write_vtu(tmp_path):
+    def write(name, encoding, compressed=False):
+        path = tmp_path / name
+        path.write_bytes(vtu_text(encoding, compressed).encode('latin-1'))
+        return str(path)
+    return write
+
+
+@pytest.mark.parametrize('encoding, compressed', [
+    ('ascii', False), ('base64', False), ('base64', True), ('appended', False), ('appended', True)])
+def test_read_data_array(write_vtu, encoding, compressed):
+    header = scan_vtu(write_vtu('solution-000100.vtu', encoding, compressed))
+    c, u = [read_data_array(header, array) for array in header.data_arrays]
+    assert np.array_equal(c, C)
+    assert np.array_equal(u, U)
+
+
+def test_encodings_give_the_same_statistics(write_vtu):
+    rows = [compute_field_statistics([write_vtu('solution-00010{}.vtu'.format(i), encoding)])
+            for i, encoding in enumerate(['ascii', 'base64', 'appended'])]
+    rows = [[row[1:] for row in r] for r in rows]
+    assert rows[0] == rows[1] == rows[2]
+
+    [c, u] = rows[0]
+    assert c[:5] == ['c', 6, C.min(), C.max(), pytest.approx(C.mean())]
+    assert c[5] == pytest.approx(np.linalg.norm(C))
+    # Vector fields are summarized by their magnitude
+    magnitude = np.linalg.norm(U, axis=1)
+    assert u[:4] == ['u', 6, magnitude.min(), pytest.approx(magnitude.max())]
+
+
+def test_files_of_one_time_step_are_combined(write_vtu, tmp_path):
+    paths = [write_vtu('solution-000100.0.vtu', 'ascii'), write_vtu('solution-000100.1.vtu', 'appended'),
+             write_vtu('solution-000200.0.vtu', 'base64'), str(tmp_path / 'solution-000100.pvtu')]
+    rows = compute_field_statistics(paths, field_names=['c'])
+    assert [row[:3] for row in rows] == [[100, 'c', 12], [200, 'c', 6]]
+    assert rows[0][5] == pytest.approx(C.mean())
+
+    table = write_statistics_table(rows, str(tmp_path / 'stats' / 'field_statistics.csv'))
+    with open(table) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == 'time_step,field,count,min,max,mean,l2_norm'
+    assert lines[1].startswith('100,c,12,-1.25,7.5,')
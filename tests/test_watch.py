@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from prismspf_mcapi.watch import ResultWatcher, process_is_running
+
+
+@pytest.fixture
+def app_dir(tmp_path):
+    return str(tmp_path)
+
+
+def write(app_dir, name, text, append=False):
+    with open(os.path.join(app_dir, name), 'a' if append else 'w') as f:
+        f.write(text)
+
+
+def finished_pid():
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def test_polling_ignores_a_file_until_it_is_stable(app_dir):
+    watcher = ResultWatcher(app_dir, poll_interval=0, stable_checks=2, use_inotify=False)
+    write(app_dir, 'solution-000100.vtu', '<VTKFile>')
+    write(app_dir, 'integratedFields.txt', 'not a result file')
+    assert watcher._poll() == []
+    assert watcher._poll() == []
+
+    # Still being written: the count starts again
+    write(app_dir, 'solution-000100.vtu', '<Piece/>', append=True)
+    assert watcher._poll() == []
+    assert watcher._poll() == []
+    assert watcher._poll() == ['solution-000100.vtu']
+    assert watcher._take(['solution-000100.vtu']) == [os.path.join(app_dir, 'solution-000100.vtu')]
+    # Reported once
+    assert watcher._poll() == []
+
+
+def test_watch_ends_after_the_idle_timeout(app_dir):
+    write(app_dir, 'solution-000100.vtu', '<VTKFile/>')
+    watcher = ResultWatcher(app_dir, poll_interval=0.01, stable_checks=1, idle_timeout=0.1, use_inotify=False)
+    assert list(watcher.batches()) == [[os.path.join(app_dir, 'solution-000100.vtu')]]
+
+
+def test_files_left_when_the_simulation_exits_are_reported(app_dir):
+    pid = finished_pid()
+    assert not process_is_running(pid)
+    assert process_is_running(os.getpid())
+
+    write(app_dir, 'solution-000100.pvtu', '<VTKFile/>')
+    write(app_dir, 'solution-000100.0.vtu', '<VTKFile/>')
+    watcher = ResultWatcher(app_dir, pid=pid, use_inotify=False)
+    assert list(watcher.batches()) == [[os.path.join(app_dir, 'solution-000100.0.vtu'),
+                                        os.path.join(app_dir, 'solution-000100.pvtu')]]